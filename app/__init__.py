@@ -4,15 +4,20 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect, generate_csrf
+from sqlalchemy import inspect, text
 import os
 import ssl
 import sys
+import threading
+import zlib
 
 # Initialize extensions
 db = SQLAlchemy()
 migrate = Migrate()
 csrf = CSRFProtect()
 DB_NAME = "store.db"
+# How long a booting worker waits for another one's schema upgrade
+UPGRADE_LOCK_TIMEOUT_MS = 300000
 
 # Ensure the migrations directory exists
 def ensure_migrations_dir():
@@ -21,6 +26,100 @@ def ensure_migrations_dir():
     os.makedirs(migrations_dir, exist_ok=True)
     return migrations_dir
 
+def schema_version(metadata):
+    """Checksum of the model tables, columns and indexes.
+
+    Stored in SQLite's ``PRAGMA user_version`` once the schema has been
+    created, so later boots can skip ``create_all`` while the models are
+    unchanged.
+    """
+    parts = []
+    for table in metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f'{c.name}:{c.type}:{c.nullable}:{c.primary_key}:{c.unique}' for c in table.columns)
+        parts.extend(sorted(index.name for index in table.indexes if index.name))
+    return zlib.crc32('\n'.join(parts).encode('utf-8')) & 0x7fffffff
+
+def add_missing_columns(metadata, connection):
+    """Add model columns and indexes missing from tables that already exist.
+
+    ``create_all`` only creates missing tables, so a database from before a
+    column was added to a model gets it here with ``ALTER TABLE ... ADD
+    COLUMN``; existing rows get NULL, which the code reading new columns
+    allows for. Runs only when ``schema_version`` changes.
+    """
+    inspector = inspect(connection)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+def backfill_order_snapshots():
+    """Fill the item snapshot columns of order lines saved before they existed.
+
+    Lines whose item has since been deleted stay NULL and show as a deleted
+    product.
+    """
+    from .models import ArchivedOrderItem, Item, OrderItem
+    for line in (OrderItem, ArchivedOrderItem):
+        item = db.session.query(Item).filter(Item.id == line.item_id)
+        db.session.query(line).filter(line.item_name.is_(None)).update({
+            line.item_name: item.with_entities(Item.name).scalar_subquery(),
+            line.item_barcode: item.with_entities(Item.barcode).scalar_subquery(),
+            line.item_image_url: item.with_entities(Item.image_url).scalar_subquery(),
+        }, synchronize_session=False)
+
+def upgrade_database(app, version):
+    """Create or upgrade the schema to ``version`` and backfill new tables.
+
+    Every worker process that boots on an out-of-date database gets here,
+    so the first one takes SQLite's write lock (``BEGIN IMMEDIATE``) and
+    the others wait on it, then find ``user_version`` already current and
+    return False. All of it runs on the session's connection in that one
+    transaction, so an upgrade that fails part way leaves nothing behind.
+    """
+    from . import barcodes, ledger, models, rollups, stock_alerts
+    # Another worker may hold the lock for a whole upgrade; wait rather than fail
+    db.session.execute(text(f'PRAGMA busy_timeout = {UPGRADE_LOCK_TIMEOUT_MS}'))
+    db.session.execute(text('BEGIN IMMEDIATE'))
+    if db.session.execute(text('PRAGMA user_version')).scalar() == version:
+        db.session.rollback()
+        return False
+    connection = db.session.connection()
+    # Rollup tables created on an existing database are filled from its orders below
+    new_rollups = not inspect(connection).has_table(models.DailySales.__table__.name)
+    db.metadata.create_all(bind=connection)
+    add_missing_columns(db.metadata, connection)
+    backfill_order_snapshots()
+    clashes = barcodes.backfill()
+    if clashes:
+        app.logger.warning('Items sharing a barcode with an older item (left without a GTIN): %s',
+                           ', '.join(map(str, clashes)))
+    ledger.open_balances()
+    if new_rollups:
+        rollups.rebuild(commit=False)
+    # Alerts for items that were already low before alerts existed
+    stock_alerts.sync([])
+    # Create default settings if they don't exist
+    if not models.StoreSettings.query.first():
+        db.session.add(models.StoreSettings())
+    db.session.execute(text(f'PRAGMA user_version = {version}'))
+    db.session.commit()
+    return True
+
+def _warm_scanner(app):
+    try:
+        from . import scanning
+        scanning.warm_up()
+    except Exception:
+        app.logger.exception('Scanner warm-up failed')
+
 def create_app():
     app = Flask(__name__)
     
@@ -50,6 +149,7 @@ def create_app():
         os.makedirs(data_dir, exist_ok=True)
     except Exception:
         pass
+    app.config['DATA_DIR'] = data_dir
     db_path = os.path.join(data_dir, DB_NAME)
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -81,22 +181,58 @@ def create_app():
     
     # Initialize extensions with app
     db.init_app(app)
+    
+    # Per-endpoint latency and SQL metrics; registered first so its timer
+    # wraps every other before_request hook. /metrics also accepts
+    # "Authorization: Bearer <STOREAPP_METRICS_TOKEN>" for scrapers.
+    app.config['METRICS_TOKEN'] = os.environ.get('STOREAPP_METRICS_TOKEN')
+    from . import metrics
+    metrics.init_app(app)
+    
+    # gzip/brotli for text responses and pre-compressed static files; its
+    # after_request hook runs after every hook registered later
+    from . import compression
+    compression.init_app(app)
+    
+    # N+1 lazy-load detection (STOREAPP_NPLUSONE=log|raise), off by default
+    from . import nplusone
+    nplusone.init_app(app)
+
+    # Admin-triggered cProfile of single requests (?_profile=1 or X-Profile: 1)
+    from . import profiling
+    profiling.init_app(app)
     # Migrate will be initialized once below with the migrations directory
     
     # Initialize CSRF protection after all other extensions
     csrf.init_app(app)
     
+    # Items without their own low-stock threshold alert at this level
+    app.config.setdefault('LOW_STOCK_THRESHOLD', int(os.environ.get('STOREAPP_LOW_STOCK_THRESHOLD', '5')))
+    
     # Import models after db is initialized to avoid circular imports
     from . import models
     
-    # Initialize the database
+    # Initialize the database, unless it was already created from these models
     with app.app_context():
-        db.create_all()
-        # Create default settings if they don't exist
-        if not models.StoreSettings.query.first():
-            default_settings = models.StoreSettings()
-            db.session.add(default_settings)
-            db.session.commit()
+        version = schema_version(db.metadata)
+        if db.session.execute(text('PRAGMA user_version')).scalar() != version:
+            upgrade_database(app, version)
+    
+    # Background job runner for slow admin work (exports, imports)
+    from .jobs import JobRunner
+    JobRunner(app)
+    
+    # Pub/sub hub behind the admin live order feed (server-sent events)
+    from . import events
+    events.init_app(app)
+    
+    # Signed-cookie cart for visitors who aren't logged in
+    from . import guest_cart
+    guest_cart.init_app(app)
+    
+    # Per-user rate limit and in-flight cap for the scan API
+    from . import admission
+    admission.init_app(app)
     
     # Import blueprints after CSRF is initialized to avoid circular imports
     from .views import views, api_scan_barcode
@@ -111,6 +247,12 @@ def create_app():
     # Exempt the API endpoint from CSRF protection
     csrf.exempt(api_scan_barcode)  # Exempt the API endpoint function
     
+    # OpenCV is imported lazily by the scan routes; optionally load it now
+    # in the background so the first scan doesn't wait for it
+    app.config.setdefault('SCAN_WARMUP', os.environ.get('STOREAPP_SCAN_WARMUP') == '1')
+    if app.config['SCAN_WARMUP']:
+        threading.Thread(target=_warm_scanner, args=(app,), name='scan-warmup', daemon=True).start()
+    
     # Make store settings available in all templates
     @app.context_processor
     def inject_settings():
@@ -168,8 +310,17 @@ def create_app():
             url = request.url.replace('http://', 'https://', 1)
             return redirect(url, code=301)
     
+    # One query for the user plus cart summary, cached briefly per process
+    from . import users
+    users.init_app(app)
+    
     @login_manager.user_loader
     def load_user(id):
-        return User.query.get(int(id))
+        return users.load_user(int(id))
+    
+    # Compiled templates kept under DATA_DIR across restarts, plus optional
+    # background warm-up; last, so every filter and global is registered
+    from . import templating
+    templating.init_app(app)
     
     return app
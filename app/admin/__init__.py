@@ -1,4 +1,4 @@
-from flask import Blueprint
+from flask import Blueprint, redirect, url_for, request, flash
 from flask_login import login_required, current_user
 from functools import wraps
 
@@ -17,5 +17,12 @@ def admin_required(f):
 # Create admin blueprint
 admin = Blueprint('admin', __name__)
 
+# Apply admin_required to all routes in this blueprint
+@admin.before_request
+@login_required
+@admin_required
+def require_admin():
+    pass  # The actual check is done in the decorator
+
 # Import routes after creating the blueprint to avoid circular imports
 from . import routes
@@ -1,22 +1,60 @@
-from flask import render_template, request, redirect, url_for, flash, Response
-import csv
-from io import StringIO
+from flask import render_template, request, redirect, url_for, flash, Response, stream_with_context, jsonify, send_file, abort, current_app
+import json
+from datetime import datetime
 from . import admin
-from ..models import Item, Order, StoreSettings, User, db
+from ..models import Item, Job, Order, StoreSettings, User, db
+from .. import admission, archive, barcodes, bulk, events, exports, importer, jobs, ledger, metrics, profiling, rollups, stock_alerts
+from flask_login import current_user
 from werkzeug.utils import secure_filename
 import os
+import uuid
+
+def _threshold_field():
+    """The item form's low-stock threshold, None when blank; ValueError if invalid."""
+    value = request.form.get('low_stock_threshold', '').strip()
+    if not value:
+        return None
+    try:
+        threshold = int(value)
+    except ValueError:
+        raise ValueError(f'Low-stock alert level must be a whole number, not {value!r}.')
+    if threshold < 0:
+        raise ValueError('Low-stock alert level cannot be negative.')
+    return threshold
 
 @admin.route('/')
 def dashboard():
     total_items = Item.query.count()
-    total_orders = Order.query.count()
+    total_orders = Order.query.count() + archive.archived_count()
     recent_orders = Order.query.order_by(Order.date_ordered.desc()).limit(5).all()
     settings = StoreSettings.get_settings()
+    # Sales figures come from the rollup tables, not the raw orders
+    daily = rollups.daily_sales(14)
+    low_stock, open_alerts = stock_alerts.open_alerts()
     return render_template('admin/dashboard.html', 
                          total_items=total_items,
                          total_orders=total_orders,
                          recent_orders=recent_orders,
-                         settings=settings)
+                         settings=settings,
+                         daily_sales=daily,
+                         max_daily_revenue=max(day['revenue'] for day in daily) or 1,
+                         lifetime=rollups.lifetime_totals(),
+                         top_items=rollups.top_items(),
+                         top_customers=rollups.top_customers(),
+                         low_stock=low_stock,
+                         open_alerts=open_alerts)
+
+@admin.route('/rollups/rebuild', methods=['POST'])
+def rebuild_rollups():
+    job = jobs.enqueue('rebuild_rollups', user_id=current_user.id)
+    flash(f'Rebuilding sales rollups (job #{job.id}).', 'info')
+    return redirect(url_for('admin.jobs_list'))
+
+@admin.route('/backup', methods=['POST'])
+def backup_database():
+    job = jobs.enqueue('backup_database', user_id=current_user.id)
+    flash(f'Backing up the database (job #{job.id}).', 'info')
+    return redirect(url_for('admin.jobs_list'))
 
 @admin.route('/items')
 def items():
@@ -33,7 +71,23 @@ def new_item():
         price = float(request.form.get('price', 0))
         description = request.form.get('description', '')
         stock = int(request.form.get('stock', 0))
-        barcode = request.form.get('barcode', '')
+        barcode = barcodes.clean(request.form.get('barcode'))
+        
+        # EAN/UPC codes must be valid and not already used in any format
+        try:
+            gtin = barcodes.normalize(barcode)
+        except barcodes.InvalidBarcode as e:
+            flash(str(e), 'error')
+            return render_template('admin/new_item.html')
+        duplicate = barcodes.find_duplicate(barcode)
+        if duplicate:
+            flash(f'A product with this barcode already exists ({duplicate.name})!', 'error')
+            return render_template('admin/new_item.html')
+        try:
+            low_stock_threshold = _threshold_field()
+        except ValueError as e:
+            flash(str(e), 'error')
+            return render_template('admin/new_item.html')
         
         # Handle file upload
         image = request.files.get('image')
@@ -56,9 +110,14 @@ def new_item():
                 description=description,
                 stock=stock,
                 barcode=barcode,
+                gtin=gtin,
+                low_stock_threshold=low_stock_threshold,
                 image_url=image_path
             )
             db.session.add(item)
+            db.session.flush()
+            ledger.record_change(item.id, stock, 'create', user_id=current_user.id)
+            stock_alerts.note_changes([(item, None, None)])
             db.session.commit()
             flash(f'Item added successfully! {image_path}', 'success')
             return redirect(url_for('admin.items'))
@@ -73,11 +132,35 @@ def edit_item(item_id):
     item = Item.query.get_or_404(item_id)
     
     if request.method == 'POST':
+        try:
+            low_stock_threshold = _threshold_field()
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('admin.edit_item', item_id=item.id))
+        barcode = barcodes.clean(request.form.get('barcode', item.barcode))
+        if barcode != item.barcode:
+            try:
+                gtin = barcodes.normalize(barcode)
+            except barcodes.InvalidBarcode as e:
+                flash(str(e), 'error')
+                return redirect(url_for('admin.edit_item', item_id=item.id))
+            duplicate = barcodes.find_duplicate(barcode, exclude_id=item.id)
+            if duplicate:
+                flash(f'A product with this barcode already exists ({duplicate.name})!', 'error')
+                return redirect(url_for('admin.edit_item', item_id=item.id))
+            item.barcode = barcode
+            item.gtin = gtin
+        
         item.name = request.form.get('name', item.name)
         item.price = float(request.form.get('price', item.price))
         item.description = request.form.get('description', item.description)
+        old_stock = item.stock or 0
+        old_threshold = stock_alerts.threshold_for(item)
         item.stock = int(request.form.get('stock', item.stock))
-        item.barcode = request.form.get('barcode', item.barcode)
+        if 'low_stock_threshold' in request.form:
+            item.low_stock_threshold = low_stock_threshold
+        ledger.record_change(item.id, item.stock - old_stock, 'edit', user_id=current_user.id)
+        stock_alerts.note_changes([(item, old_stock, old_threshold)])
         
         # Handle file upload
         image = request.files.get('image')
@@ -104,6 +187,8 @@ def edit_item(item_id):
 @admin.route('/items/delete/<int:item_id>', methods=['POST'])
 def delete_item(item_id):
     item = Item.query.get_or_404(item_id)
+    ledger.record_change(item.id, -(item.stock or 0), 'delete', user_id=current_user.id)
+    stock_alerts.resolve_item(item.id)
     db.session.delete(item)
     db.session.commit()
     flash('Item deleted successfully!', 'success')
@@ -111,30 +196,65 @@ def delete_item(item_id):
 
 @admin.route('/orders')
 def orders():
-    all_orders = Order.query.order_by(Order.date_ordered.desc()).all()
+    # Archived orders are only read when asked for (?history=all)
+    include_archived = request.args.get('history') == 'all'
+    all_orders = archive.order_history(include_archived=include_archived)
     settings = StoreSettings.get_settings()
-    return render_template('admin/orders.html', orders=all_orders, settings=settings)
+    return render_template('admin/orders.html', orders=all_orders, settings=settings,
+                           include_archived=include_archived)
 
 @admin.route('/order/<int:order_id>')
 def view_order(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = archive.find_order(order_id)
+    if order is None:
+        abort(404)
     settings = StoreSettings.get_settings()
     return render_template('admin/view_order.html', order=order, settings=settings)
 
 @admin.route('/order/update_status/<int:order_id>', methods=['POST'])
 def update_order_status(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.get(order_id)
+    if order is None:
+        if archive.find_order(order_id) is None:
+            abort(404)
+        flash('Archived orders are read-only.', 'error')
+        return redirect(url_for('admin.view_order', order_id=order_id))
     new_status = request.form.get('status')
     
     if new_status in ['Processing', 'Shipped', 'Delivered', 'Cancelled']:
+        previous = order.status
+        if new_status != previous:
+            rollups.record_status_change([Order.id == order.id], new_status)
         order.status = new_status
         db.session.commit()
+        if new_status != previous:
+            events.publish('order.status', {'id': order.id, 'status': new_status, 'previous': previous})
         flash('Order status updated successfully!', 'success')
     else:
         flash('Invalid status!', 'error')
     
     return redirect(url_for('admin.view_order', order_id=order_id))
 
+@admin.route('/orders/events')
+def order_events():
+    """Server-sent events for new orders and status changes (see app/events.py)."""
+    hub = events.get_hub()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        subscription = hub.subscribe(last_event_id)
+    except events.TooManySubscribers:
+        return Response('Too many live feed connections', status=503, headers={'Retry-After': '30'})
+    stream = hub.stream(subscription,
+                        heartbeat=current_app.config['EVENTS_HEARTBEAT'],
+                        max_age=current_app.config['EVENTS_MAX_AGE'])
+    response = Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # don't let nginx buffer the stream
+    })
+    # The stream's own cleanup never runs if it is never started (HEAD, early disconnect)
+    response.call_on_close(lambda: hub.unsubscribe(subscription))
+    return response
+
 @admin.route('/settings', methods=['GET', 'POST'])
 def settings():
     settings = StoreSettings.get_settings()
@@ -150,108 +270,275 @@ def settings():
     
     return render_template('admin/settings.html', settings=settings)
 
-@admin.route('/export/products')
-def export_products():
-    # Create CSV in memory
-    si = StringIO()
-    cw = csv.writer(si)
-    
-    # Write header
-    cw.writerow(['ID', 'Name', 'Description', 'Price', 'Stock', 'Barcode', 'Image Path', 'Date Added'])
-    
-    # Write data
-    products = Item.query.all()
-    for product in products:
-        cw.writerow([
-            product.id,
-            product.name,
-            product.description or '',
-            str(product.price),
-            product.stock,
-            product.barcode or '',
-            product.image_url or '',
-            product.date_added.strftime('%Y-%m-%d %H:%M:%S') if product.date_added else ''
-        ])
-    
-    # Create response
-    output = si.getvalue()
+def _export_response(filename, header, rows):
+    chunks = exports.stream_csv(header, rows)
+    if request.args.get('gzip'):
+        return Response(
+            stream_with_context(exports.gzip_stream(chunks)),
+            mimetype="application/gzip",
+            headers={"Content-disposition": f"attachment; filename={filename}.gz"}
+        )
     return Response(
-        output,
+        stream_with_context(chunks),
         mimetype="text/csv",
-        headers={"Content-disposition": "attachment; filename=products_export.csv"}
+        headers={"Content-disposition": f"attachment; filename={filename}"}
     )
 
+def _export(name):
+    try:
+        start, end = exports.parse_date_range(request.args)
+    except ValueError:
+        return Response('Invalid date range, use YYYY-MM-DD', status=400, mimetype='text/plain')
+    # Only the order, order line and customer exports take ?archived=1
+    options = {'archived': True} if request.args.get('archived') else {}
+    return _export_response(*exports.EXPORTS[name](start, end, **options))
+
+@admin.route('/export/products')
+def export_products():
+    return _export('products')
+
+@admin.route('/import/products', methods=['GET', 'POST'])
+def import_products():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or JSONL file to import', 'error')
+            return redirect(url_for('admin.import_products'))
+
+        fmt = request.form.get('format') or importer.detect_format(upload.filename)
+        try:
+            chunk_size = max(1, int(request.form.get('chunk_size', importer.DEFAULT_CHUNK_SIZE)))
+        except (TypeError, ValueError):
+            chunk_size = importer.DEFAULT_CHUNK_SIZE
+
+        # Hand large files to the background job runner
+        if request.form.get('background'):
+            upload_dir = os.path.join(jobs.get_runner().result_dir, 'uploads')
+            os.makedirs(upload_dir, exist_ok=True)
+            path = os.path.join(upload_dir, f'{uuid.uuid4().hex}-{secure_filename(upload.filename)}')
+            upload.save(path)
+            job = jobs.enqueue('import_products', user_id=current_user.id,
+                               path=path, fmt=fmt, chunk_size=chunk_size)
+            flash(f'Import queued as job #{job.id}', 'success')
+            return redirect(url_for('admin.jobs_list'))
+
+        # Stream progress as newline-delimited JSON for scripted uploads
+        if request.args.get('stream'):
+            def generate():
+                for progress in importer.import_products(upload.stream, fmt, chunk_size):
+                    yield json.dumps(progress.as_dict()) + '\n'
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+        result = None
+        for result in importer.import_products(upload.stream, fmt, chunk_size):
+            pass
+        result = result.as_dict()
+        category = 'warning' if result['failed'] else 'success'
+        flash(f"Imported {result['rows'] - result['failed']} of {result['rows']} rows", category)
+        return render_template('admin/import_products.html', result=result)
+
+    return render_template('admin/import_products.html', result=None)
+
 @admin.route('/export/orders')
 def export_orders():
-    # Create CSV in memory
-    si = StringIO()
-    cw = csv.writer(si)
-    
-    # Write header
-    cw.writerow(['Order ID', 'Customer Name', 'Email', 'Phone', 'Status', 'Total Amount', 'Order Date'])
-    
-    # Write data
-    orders = Order.query.all()
-    for order in orders:
-        cw.writerow([
-            order.id,
-            order.user.first_name or 'Guest',
-            order.user.email or 'No email',
-            '',  # Phone number not stored in the model
-            order.status,
-            str(order.total) if hasattr(order, 'total') else '0.00',
-            order.date_ordered.strftime('%Y-%m-%d %H:%M:%S') if order.date_ordered else ''
-        ])
-    
-    # Create response
-    output = si.getvalue()
-    return Response(
-        output,
-        mimetype="text/csv",
-        headers={"Content-disposition": "attachment; filename=orders_export.csv"}
-    )
+    return _export('orders')
+
+@admin.route('/export/order-lines')
+def export_order_lines():
+    return _export('order_lines')
 
 @admin.route('/export/customers')
 def export_customers():
-    # Create CSV in memory
-    si = StringIO()
-    cw = csv.writer(si)
-    
-    # Write header
-    cw.writerow(['Name', 'Email', 'Phone', 'Total Orders', 'Total Spent', 'Last Order Date'])
-    
-    # Get unique customers from orders
-    from sqlalchemy import func, desc
-    from sqlalchemy.sql import label
-    
-    # Get all users who have placed orders
-    customer_data = db.session.query(
-        User.id,
-        User.first_name,
-        User.email,
-        label('order_count', func.count(Order.id)),
-        label('total_spent', func.coalesce(func.sum(Order.total), 0.0)),
-        func.max(Order.date_ordered)
-    ).join(Order, User.id == Order.user_id)\
-     .group_by(User.id, User.first_name, User.email)\
-     .order_by(desc(func.count(Order.id)))\
-     .all()
-    
-    # Write data
-    for customer in customer_data:
-        cw.writerow([
-            customer.first_name or 'Guest',
-            customer.email or 'No email',
-            '',  # Phone number not stored in the model
-            customer.order_count,
-            f"{customer.total_spent:.0f}",
-            customer[5].strftime('%Y-%m-%d %H:%M:%S') if customer[5] else 'N/A'
-        ])
-    
-    # Create response
-    output = si.getvalue()
-    return Response(
-        output,
-        mimetype="text/csv",
-        headers={"Content-disposition": "attachment; filename=customers_export.csv"}
+    return _export('customers')
+
+@admin.route('/jobs/export/<export>', methods=['POST'])
+def enqueue_export(export):
+    if export not in exports.EXPORTS:
+        abort(404)
+    try:
+        exports.parse_date_range(request.form)
+    except ValueError:
+        flash('Invalid date range, use YYYY-MM-DD', 'error')
+        return redirect(request.referrer or url_for('admin.jobs_list'))
+    job = jobs.enqueue(
+        'export',
+        user_id=current_user.id,
+        export=export,
+        start=request.form.get('start') or None,
+        end=request.form.get('end') or None,
+        gzip=bool(request.form.get('gzip')),
+        archived=bool(request.form.get('archived'))
     )
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': True, 'job_id': job.id})
+    flash(f'Export queued as job #{job.id}', 'success')
+    return redirect(url_for('admin.jobs_list'))
+
+def _job_status(job):
+    data = job.to_dict()
+    data['progress'], message = jobs.get_runner().progress_for(job)
+    data['message'] = message or ''
+    if data['has_result'] and job.status == 'done':
+        data['download_url'] = url_for('admin.download_job', job_id=job.id)
+    return data
+
+@admin.route('/jobs')
+def jobs_list():
+    recent_jobs = Job.query.order_by(Job.id.desc()).limit(50).all()
+    return render_template('admin/jobs.html', jobs=[_job_status(job) for job in recent_jobs])
+
+@admin.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    return jsonify(_job_status(job))
+
+@admin.route('/jobs/<int:job_id>/download')
+def download_job(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.status != 'done' or not job.result_path or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(job.result_path, as_attachment=True, download_name=job.result_name)
+
+def _id_list(name):
+    """Collect integer ids from repeated form fields and/or a comma-separated list."""
+    ids = []
+    for value in request.form.getlist(name):
+        for part in value.split(','):
+            part = part.strip()
+            if part:
+                ids.append(int(part))
+    return ids
+
+def _bulk_response(result, message, redirect_to):
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify(dict(result.as_dict(), success=True, message=message))
+    flash(message, 'info' if result.dry_run else 'success')
+    return redirect(request.referrer or redirect_to)
+
+def _bulk_error(message, redirect_to):
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': False, 'message': message}), 400
+    flash(message, 'error')
+    return redirect(request.referrer or redirect_to)
+
+@admin.route('/bulk/orders/status', methods=['POST'])
+def bulk_order_status():
+    new_status = request.form.get('status')
+    dry_run = bool(request.form.get('dry_run'))
+    try:
+        start, end = exports.parse_date_range(request.form)
+        filters = bulk.order_filters(
+            order_ids=_id_list('order_ids'),
+            status=request.form.get('from_status') or None,
+            start=start,
+            end=end
+        )
+        result = bulk.set_order_status(new_status, filters, dry_run=dry_run)
+    except ValueError as e:
+        return _bulk_error(str(e), url_for('admin.orders'))
+
+    if dry_run:
+        message = f'{result.matched} order(s) would be set to {new_status}.'
+    else:
+        message = f'{result.matched} order(s) set to {new_status}.'
+        if result.matched:
+            events.publish('orders.bulk_status', {'status': new_status, 'matched': result.matched})
+    return _bulk_response(result, message, url_for('admin.orders'))
+
+@admin.route('/bulk/items', methods=['POST'])
+def bulk_items():
+    action = request.form.get('action')
+    dry_run = bool(request.form.get('dry_run'))
+    try:
+        max_stock = request.form.get('max_stock', '').strip()
+        filters = bulk.item_filters(
+            item_ids=_id_list('item_ids'),
+            search=request.form.get('search', '').strip() or None,
+            max_stock=int(max_stock) if max_stock else None
+        )
+        if action == 'reprice':
+            percent = float(request.form.get('percent', ''))
+            result = bulk.reprice_items(percent, filters, dry_run=dry_run)
+            change = f'repriced by {percent:+g}%'
+        elif action == 'restock':
+            add = request.form.get('add', '').strip()
+            set_to = request.form.get('set_to', '').strip()
+            result = bulk.restock_items(
+                filters,
+                add=int(add) if add else None,
+                set_to=int(set_to) if set_to else None,
+                dry_run=dry_run,
+                user_id=current_user.id
+            )
+            change = f'restocked by {int(add):+d}' if add else f'restocked to {int(set_to)}'
+        else:
+            raise ValueError('Unknown bulk action')
+    except ValueError as e:
+        return _bulk_error(str(e), url_for('admin.items'))
+
+    if dry_run:
+        message = f'{result.matched} item(s) would be {change}.'
+    else:
+        message = f'{result.matched} item(s) {change}.'
+    return _bulk_response(result, message, url_for('admin.items'))
+
+@admin.route('/metrics')
+def metrics_page():
+    registry = metrics.get_registry()
+    return render_template('admin/metrics.html',
+                         endpoints=registry.snapshot(),
+                         since=datetime.fromtimestamp(registry.started),
+                         scan=admission.get_scan_admission().stats())
+
+@admin.route('/metrics/reset', methods=['POST'])
+def reset_metrics():
+    metrics.get_registry().reset()
+    admission.get_scan_admission().reset()
+    flash('Metrics reset.', 'success')
+    return redirect(url_for('admin.metrics_page'))
+
+def _get_profile(profile_id):
+    profile = profiling.get_store().get(profile_id)
+    if profile is None:
+        abort(404)
+    return profile
+
+@admin.route('/profiles')
+def profiles():
+    return render_template('admin/profiles.html',
+                         profiles=profiling.get_store().all(),
+                         trigger_param=profiling.TRIGGER_PARAM,
+                         trigger_header=profiling.TRIGGER_HEADER)
+
+@admin.route('/profiles/<int:profile_id>')
+def profile_detail(profile_id):
+    profile = _get_profile(profile_id)
+    sort = request.args.get('sort', 'cumtime')
+    if sort not in ('cumtime', 'tottime', 'calls'):
+        sort = 'cumtime'
+    return render_template('admin/profile_detail.html',
+                         profile=profile,
+                         tree=profile.call_tree(),
+                         functions=profile.top_functions(sort=sort),
+                         sort=sort)
+
+@admin.route('/profiles/<int:profile_id>/download')
+def download_profile(profile_id):
+    profile = _get_profile(profile_id)
+    fmt = request.args.get('format', 'pstats')
+    if fmt == 'folded':
+        body, mimetype, ext = profile.folded_stacks(), 'text/plain', 'folded.txt'
+    elif fmt == 'json':
+        body = json.dumps({'path': profile.path, 'wall_ms': profile.wall_ms, 'tree': profile.call_tree()})
+        mimetype, ext = 'application/json', 'json'
+    else:
+        body, mimetype, ext = profile.pstats_bytes(), 'application/octet-stream', 'prof'
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=profile_{profile.id}.{ext}'
+    })
+
+@admin.route('/profiles/clear', methods=['POST'])
+def clear_profiles():
+    profiling.get_store().clear()
+    flash('Profiles cleared.', 'success')
+    return redirect(url_for('admin.profiles'))
@@ -0,0 +1,176 @@
+# app/admission.py
+"""Admission control for the barcode scan API.
+
+The live scanner posts camera frames in a loop, and every frame costs an
+image decode and a ZBar pass. Before any of that work starts, a frame has to
+pass two checks:
+
+* a per-user token bucket: ``SCAN_RATE`` frames per second (default 2) with
+  bursts of up to ``SCAN_BURST`` (default 4);
+* a cap on decodes in flight across all users, ``SCAN_MAX_IN_FLIGHT``
+  (default: the number of CPUs, at least 2).
+
+A frame that fails either check gets an immediate 429 with ``Retry-After``
+(whole seconds, as the header requires) and ``retry_after`` in the JSON body
+(fractional seconds); the scanner page waits that long before its next frame.
+A frame turned away because the server is busy doesn't use up a token.
+
+Accepted and rejected frames are counted per reason, shown on the admin
+metrics page and exported on ``/metrics``. Like the request metrics, the
+buckets and counters live in one process.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, jsonify
+
+
+class Rejected(Exception):
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity, now):
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def take(self, rate, capacity, now):
+        """Take a token; return 0, or the seconds until one is available."""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
+
+
+class AdmissionControl:
+
+    REASONS = ('rate', 'busy')
+
+    def __init__(self, rate, burst, max_in_flight, busy_retry_after=1.0, max_buckets=10000):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.busy_retry_after = float(busy_retry_after)
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.in_flight = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.accepted = 0
+            self.rejected = dict.fromkeys(self.REASONS, 0)
+            self.peak_in_flight = self.in_flight
+            self.started = time.time()
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+            # Least recently used buckets go first; a forgotten bucket is
+            # simply full again next time
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def acquire(self, key):
+        """Admit one request for ``key`` or raise ``Rejected``.
+
+        Every successful call must be paired with ``release()``.
+        """
+        with self._lock:
+            bucket = self._bucket(key, time.monotonic())
+            wait = bucket.take(self.rate, self.burst, bucket.updated)
+            if wait:
+                self.rejected['rate'] += 1
+                raise Rejected('rate', wait)
+            if self.in_flight >= self.max_in_flight:
+                bucket.tokens += 1
+                self.rejected['busy'] += 1
+                raise Rejected('busy', self.busy_retry_after)
+            self.in_flight += 1
+            self.accepted += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'accepted': self.accepted,
+                'rejected': dict(self.rejected),
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'max_in_flight': self.max_in_flight,
+                'rate': self.rate,
+                'burst': self.burst,
+                'users': len(self._buckets),
+                'started': self.started,
+            }
+
+    def prometheus(self):
+        stats = self.stats()
+        lines = [
+            '# HELP storeapp_scan_frames_total Scan API frames by admission outcome',
+            '# TYPE storeapp_scan_frames_total counter',
+            f'storeapp_scan_frames_total{{outcome="accepted"}} {stats["accepted"]}',
+        ]
+        for reason in self.REASONS:
+            lines.append(f'storeapp_scan_frames_total{{outcome="rejected_{reason}"}} {stats["rejected"][reason]}')
+        lines.append('# HELP storeapp_scan_in_flight Scan decodes currently running')
+        lines.append('# TYPE storeapp_scan_in_flight gauge')
+        lines.append(f'storeapp_scan_in_flight {stats["in_flight"]}')
+        return lines
+
+
+def rejected_response(error):
+    messages = {
+        'rate': 'Scanning too fast; slowing down.',
+        'busy': 'The scanner is busy; retrying shortly.',
+    }
+    response = jsonify({
+        'success': False,
+        'error': messages[error.reason],
+        'reason': error.reason,
+        'retry_after': round(error.retry_after, 3),
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+
+def get_scan_admission():
+    return current_app.extensions['scan_admission']
+
+
+def init_app(app):
+    app.config.setdefault('SCAN_RATE', 2.0)
+    app.config.setdefault('SCAN_BURST', 4)
+    app.config.setdefault('SCAN_MAX_IN_FLIGHT', max(2, os.cpu_count() or 1))
+    app.config.setdefault('SCAN_BUSY_RETRY_AFTER', 1.0)
+    control = AdmissionControl(
+        rate=app.config['SCAN_RATE'],
+        burst=app.config['SCAN_BURST'],
+        max_in_flight=app.config['SCAN_MAX_IN_FLIGHT'],
+        busy_retry_after=app.config['SCAN_BUSY_RETRY_AFTER'],
+    )
+    app.extensions['scan_admission'] = control
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        metrics.add_collector(control.prometheus)
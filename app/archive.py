@@ -0,0 +1,209 @@
+# app/archive.py
+"""Move old, finished orders out of the hot ``Order``/``OrderItem`` tables.
+
+Orders that are Delivered or Cancelled and were placed more than
+``DEFAULT_AGE_DAYS`` ago are copied into ``ArchivedOrder``/``ArchivedOrderItem``
+(keeping their ids) and deleted from the hot tables, a batch per transaction.
+Run it with scripts/archive_orders.py; it is safe to stop and re-run.
+
+Listings and exports read only the hot tables unless asked for older history
+(``?history=all`` on the order pages, "include archived" on exports), and
+order detail pages fall back to the archive, so old links keep working.
+The sales rollups are totals and are unaffected; ``rollups.rebuild()`` reads
+both sets of tables. A customer's order history is read a page at a time
+(``order_page``), from both sets of tables when asked.
+
+SQLite reuses the highest rowid once it is deleted, so the newest order (and
+the order holding the newest line) is never archived; a new order can then
+never get the id of an archived one.
+"""
+import heapq
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, literal, select, tuple_, union_all
+from sqlalchemy.orm import joinedload, selectinload
+
+from . import db
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ARCHIVE_STATUSES = ('Delivered', 'Cancelled')
+DEFAULT_AGE_DAYS = 180
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PAGE_SIZE = 20
+
+
+class ArchiveProgress:
+    __slots__ = ('orders', 'lines', 'batches', 'cutoff')
+
+    def __init__(self, cutoff):
+        self.orders = 0
+        self.lines = 0
+        self.batches = 0
+        self.cutoff = cutoff
+
+    def as_dict(self):
+        return {
+            'orders': self.orders,
+            'lines': self.lines,
+            'batches': self.batches,
+            'cutoff': self.cutoff.isoformat(),
+        }
+
+
+def _archivable(cutoff):
+    filters = [Order.status.in_(ARCHIVE_STATUSES), Order.date_ordered < cutoff]
+    newest_order = db.session.query(func.max(Order.id)).scalar()
+    if newest_order is not None:
+        filters.append(Order.id != newest_order)
+    newest_line_order = db.session.query(OrderItem.order_id)\
+        .order_by(OrderItem.id.desc()).limit(1).scalar()
+    if newest_line_order is not None:
+        filters.append(Order.id != newest_line_order)
+    return filters
+
+
+def count_archivable(older_than_days=DEFAULT_AGE_DAYS):
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    return db.session.query(func.count(Order.id)).filter(*_archivable(cutoff)).scalar()
+
+
+def _copy(source, target, where, archived_at=None):
+    names = [column.name for column in source.__table__.columns]
+    columns = [source.__table__.c[name] for name in names]
+    if archived_at is not None:
+        names.append('archived_at')
+        columns.append(literal(archived_at))
+    stmt = target.__table__.insert().from_select(names, select(*columns).where(where))
+    return db.session.execute(stmt).rowcount
+
+
+def archive_orders(older_than_days=DEFAULT_AGE_DAYS, batch_size=DEFAULT_BATCH_SIZE, limit=None):
+    """Move archivable orders in batches, yielding an ``ArchiveProgress`` after each.
+
+    Each batch is copied and deleted in one transaction, so an interrupted
+    run leaves every order in exactly one place. ``limit`` caps the number
+    of orders moved in this run.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    progress = ArchiveProgress(cutoff)
+    filters = _archivable(cutoff)
+    while limit is None or progress.orders < limit:
+        size = batch_size if limit is None else min(batch_size, limit - progress.orders)
+        ids = [row[0] for row in db.session.query(Order.id)
+               .filter(*filters).order_by(Order.id).limit(size)]
+        if not ids:
+            break
+        now = datetime.utcnow()
+        try:
+            _copy(Order, ArchivedOrder, Order.id.in_(ids), archived_at=now)
+            lines = _copy(OrderItem, ArchivedOrderItem, OrderItem.order_id.in_(ids))
+            OrderItem.query.filter(OrderItem.order_id.in_(ids)).delete(synchronize_session=False)
+            Order.query.filter(Order.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        progress.orders += len(ids)
+        progress.lines += lines
+        progress.batches += 1
+        yield progress
+
+
+def find_order(order_id, user_id=None):
+    """The order with ``order_id``, from the hot table or else the archive."""
+    for model in (Order, ArchivedOrder):
+        query = model.query.filter_by(id=order_id)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        order = query.first()
+        if order is not None:
+            return order
+    return None
+
+
+def order_history(filters=(), include_archived=False):
+    """Orders newest first, optionally followed by matching archived orders.
+
+    ``filters`` are callables taking the model, e.g.
+    ``lambda m: m.user_id == user.id``, so they apply to either table.
+    Customers and order lines are loaded with the orders, for listings.
+    """
+    hot = Order.query.filter(*[f(Order) for f in filters])\
+        .options(joinedload(Order.user), selectinload(Order.items))\
+        .order_by(Order.date_ordered.desc()).all()
+    if not include_archived:
+        return hot
+    archived = ArchivedOrder.query.filter(*[f(ArchivedOrder) for f in filters])\
+        .options(joinedload(ArchivedOrder.user), selectinload(ArchivedOrder.items))\
+        .order_by(ArchivedOrder.date_ordered.desc()).all()
+    return list(heapq.merge(hot, archived, key=lambda order: order.date_ordered, reverse=True))
+
+
+def order_page(user_id, before=None, limit=DEFAULT_PAGE_SIZE, include_archived=False):
+    """One page of a customer's orders, newest first, with their line counts.
+
+    Keyset pagination: ``before`` is the ``(date_ordered, id)`` of the last
+    order on the previous page, so every page is a range scan of the
+    ``(user_id, date_ordered DESC, id DESC)`` index however old it is. Line
+    counts come from a correlated subquery in the same statement.
+
+    Returns ``(rows, next_before)``: ``(order, line_count)`` pairs and the
+    cursor for the next page, or None on the last page.
+    """
+    def newest(orders, lines):
+        line_count = select(func.count(lines.id)).where(lines.order_id == orders.id)\
+            .correlate(orders).scalar_subquery()
+        query = db.session.query(orders, line_count).filter(orders.user_id == user_id)
+        if before is not None:
+            query = query.filter(tuple_(orders.date_ordered, orders.id) < tuple_(*before))
+        return query.order_by(orders.date_ordered.desc(), orders.id.desc()).limit(limit + 1).all()
+
+    rows = newest(Order, OrderItem)
+    if include_archived:
+        rows = list(heapq.merge(rows, newest(ArchivedOrder, ArchivedOrderItem),
+                                key=lambda row: (row[0].date_ordered, row[0].id), reverse=True))
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1][0].date_ordered, rows[-1][0].id)
+
+
+def format_cursor(cursor):
+    return f'{cursor[0].isoformat()}_{cursor[1]}'
+
+
+def parse_cursor(value):
+    """The ``(date_ordered, id)`` in a ``format_cursor`` string, or None if malformed."""
+    when, _, order_id = (value or '').rpartition('_')
+    try:
+        return datetime.fromisoformat(when), int(order_id)
+    except ValueError:
+        return None
+
+
+def all_orders(include_archived=False):
+    """A selectable over ``Order``'s columns, plus the archive if asked.
+
+    Use it in place of ``Order`` in aggregate queries, e.g. exports:
+    ``orders = all_orders(True); query(orders.c.id, ...)``.
+    """
+    names = [column.name for column in Order.__table__.columns]
+    hot = select(*[Order.__table__.c[name] for name in names])
+    if not include_archived:
+        return hot.subquery('orders')
+    archived = select(*[ArchivedOrder.__table__.c[name] for name in names])
+    return union_all(hot, archived).subquery('orders')
+
+
+def all_order_lines(include_archived=False):
+    """Like ``all_orders``, over ``OrderItem``'s columns."""
+    names = [column.name for column in OrderItem.__table__.columns]
+    hot = select(*[OrderItem.__table__.c[name] for name in names])
+    if not include_archived:
+        return hot.subquery('order_lines')
+    archived = select(*[ArchivedOrderItem.__table__.c[name] for name in names])
+    return union_all(hot, archived).subquery('order_lines')
+
+
+def archived_count():
+    return db.session.query(func.count(ArchivedOrder.id)).scalar()
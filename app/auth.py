@@ -2,6 +2,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from werkzeug.security import generate_password_hash, check_password_hash
 from .models import User, db
+from . import guest_cart, users
 from flask_login import login_user, login_required, logout_user, current_user
 
 auth = Blueprint('auth', __name__)
@@ -16,6 +17,8 @@ def login():
         # if user and check_password_hash(user.password, password):
         if user:
             login_user(user, remember=True)
+            if guest_cart.merge_into_user(user):
+                users.invalidate(user.id)
             next_page = request.args.get('next')
             flash('Logged in successfully!', 'success')
             return redirect(next_page or url_for('views.home'))
@@ -53,6 +56,8 @@ def signup():
             db.session.add(new_user)
             db.session.commit()
             login_user(new_user, remember=True)
+            if guest_cart.merge_into_user(new_user):
+                users.invalidate(new_user.id)
             flash('Account created!', 'success')
             return redirect(url_for('views.home'))
     
@@ -0,0 +1,169 @@
+# app/backup.py
+"""Online snapshots of the SQLite database.
+
+``create_backup()`` copies the live database with SQLite's backup API a few
+hundred pages at a time, sleeping between steps so the app's writers are
+only held off for one step at a time. The copy gets ``PRAGMA
+integrity_check``, is gzipped to ``BACKUP_DIR/store-YYYYmmdd-HHMMSS.db.gz``
+(``BACKUP_DIR`` defaults to ``<DATA_DIR>/backup``), and snapshots beyond the
+newest ``keep`` are deleted. Other files in the directory are left alone.
+
+A write from another connection makes SQLite restart the copy. After
+``max_restarts`` restarts the rest is copied in one step instead, which
+blocks writers for as long as that copy takes but always finishes.
+
+Used by scripts/backup_db.py and the ``backup_database`` admin job.
+"""
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from . import db
+
+SNAPSHOT_RE = re.compile(r'^store-\d{8}-\d{6}\.db(\.gz)?$')
+DEFAULT_PAGES = 256
+DEFAULT_SLEEP = 0.02
+DEFAULT_KEEP = 7
+
+
+class BackupError(Exception):
+    pass
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class BackupResult:
+    __slots__ = ('path', 'size', 'pages', 'steps', 'restarts', 'seconds')
+
+    def __init__(self, path, size, pages, steps, restarts, seconds):
+        self.path = path
+        self.size = size
+        self.pages = pages
+        self.steps = steps
+        self.restarts = restarts
+        self.seconds = seconds
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def backup_dir():
+    return current_app.config.get('BACKUP_DIR') or os.path.join(current_app.config['DATA_DIR'], 'backup')
+
+
+def database_path():
+    return db.engine.url.database
+
+
+def list_backups(directory=None):
+    """Snapshot paths in ``directory``, newest first."""
+    directory = directory or backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((name for name in os.listdir(directory) if SNAPSHOT_RE.match(name)), reverse=True)
+    return [os.path.join(directory, name) for name in names]
+
+
+def integrity_check(path):
+    """Run ``PRAGMA integrity_check`` on a database file (gzipped or not)."""
+    if path.endswith('.gz'):
+        fd, plain = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as out, gzip.open(path, 'rb') as src:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            return integrity_check(plain)
+        finally:
+            os.remove(plain)
+    conn = sqlite3.connect(path)
+    try:
+        rows = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    return rows == ['ok'], rows
+
+
+def _copy(source, target, pages, sleep, max_restarts, progress):
+    stats = {'steps': 0, 'restarts': 0, 'remaining': None, 'total': 0}
+
+    def on_step(status, remaining, total):
+        if stats['remaining'] is not None and remaining > stats['remaining']:
+            # Another connection wrote to the source; SQLite started over
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _TooManyRestarts()
+        stats['steps'] += 1
+        stats['remaining'] = remaining
+        stats['total'] = total
+        if progress:
+            progress(total - remaining, total)
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        try:
+            src.backup(dst, pages=pages, progress=on_step)
+        except _TooManyRestarts:
+            src.backup(dst, pages=-1)
+            stats['steps'] += 1
+    finally:
+        dst.close()
+        src.close()
+    return stats
+
+
+def _prune(directory, keep):
+    removed = []
+    for path in list_backups(directory)[keep:]:
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def create_backup(directory=None, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, compress=True,
+                  keep=DEFAULT_KEEP, max_restarts=5, progress=None):
+    """Snapshot the live database; returns a ``BackupResult``.
+
+    ``progress(copied_pages, total_pages)`` is called after every step.
+    Raises ``BackupError`` if the copy fails its integrity check, in which
+    case nothing is kept and no older snapshot is pruned.
+    """
+    directory = directory or backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    started = time.perf_counter()
+    name = datetime.now().strftime('store-%Y%m%d-%H%M%S.db')
+    fd, partial = tempfile.mkstemp(prefix='.partial-', suffix='.db', dir=directory)
+    os.close(fd)
+    try:
+        stats = _copy(database_path(), partial, pages, sleep, max_restarts, progress)
+        ok, messages = integrity_check(partial)
+        if not ok:
+            raise BackupError('Integrity check failed: ' + '; '.join(messages[:5]))
+        if compress:
+            name += '.gz'
+            compressed = partial + '.gz'
+            with open(partial, 'rb') as src, gzip.open(compressed, 'wb', compresslevel=6) as out:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            os.remove(partial)
+            partial = compressed
+        path = os.path.join(directory, name)
+        os.replace(partial, path)
+    except BaseException:
+        for leftover in (partial, partial + '.gz'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    if keep:
+        _prune(directory, keep)
+    return BackupResult(path, os.path.getsize(path), stats['total'], stats['steps'],
+                        stats['restarts'], time.perf_counter() - started)
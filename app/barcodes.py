@@ -0,0 +1,134 @@
+# app/barcodes.py
+"""Barcode normalization: every lookup by barcode goes through here.
+
+The same product scans as a 12-digit UPC-A or as a 13-digit EAN-13 with a
+leading zero, and the string a scanner or a spreadsheet produces may have
+either. Retail barcodes (EAN-8, UPC-A, EAN-13, GTIN-14) are therefore stored
+twice on ``Item``: ``barcode`` as entered, for display, and ``gtin``, the
+number zero-padded to GTIN-14 as an integer, which is uniquely indexed and
+what lookups match on. Codes that aren't GTINs (Code 128 labels, internal
+SKUs with letters, ...) have no ``gtin`` and match ``barcode`` exactly.
+
+A string of 8, 12, 13 or 14 digits is taken to be a GTIN, so its check digit
+has to be right; ``InvalidBarcode`` says so when it isn't. 9 to 11 digits is
+usually a UPC-A whose leading zeros a spreadsheet dropped: it is a GTIN if
+its check digit works out, and an ordinary code otherwise.
+"""
+from sqlalchemy import or_
+
+from . import db
+from .models import Item
+
+GTIN_LENGTHS = (8, 12, 13, 14)
+# Lengths of GTINs that lost leading zeros on the way
+TRUNCATED_LENGTHS = (9, 10, 11)
+
+
+class InvalidBarcode(ValueError):
+    pass
+
+
+def clean(value):
+    """``value`` as a string without surrounding blanks, or None if empty."""
+    value = str(value or '').strip()
+    return value or None
+
+
+def check_digit(digits):
+    """GS1 check digit for ``digits`` (the code without its last digit)."""
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return (10 - total % 10) % 10
+
+
+def normalize(value):
+    """The GTIN-14 of ``value`` as an integer, or None for non-GTIN codes.
+
+    Spaces and hyphens inside the code are ignored. Raises ``InvalidBarcode``
+    for a GTIN-length number whose check digit is wrong.
+    """
+    value = clean(value)
+    if value is None:
+        return None
+    digits = value.replace(' ', '').replace('-', '')
+    if not digits.isdigit() or len(digits) not in GTIN_LENGTHS + TRUNCATED_LENGTHS:
+        return None
+    if check_digit(digits[:-1]) != int(digits[-1]):
+        if len(digits) in TRUNCATED_LENGTHS:
+            return None
+        raise InvalidBarcode(f'{value} is not a valid EAN/UPC code (check digit should be '
+                             f'{check_digit(digits[:-1])}).')
+    return int(digits)
+
+
+def gtin_or_none(value):
+    """Like ``normalize`` but None for codes with a bad check digit."""
+    try:
+        return normalize(value)
+    except InvalidBarcode:
+        return None
+
+
+def format_gtin(gtin):
+    return f'{gtin:014d}' if gtin is not None else None
+
+
+def item_filter(value):
+    """Filter matching the item with barcode ``value`` in any GTIN format."""
+    gtin = gtin_or_none(value)
+    if gtin is not None:
+        return Item.gtin == gtin
+    return Item.barcode == clean(value)
+
+
+def items_filter(values):
+    """Filter matching any of ``values``, like ``item_filter``."""
+    gtins, others = set(), set()
+    for value in values:
+        gtin = gtin_or_none(value)
+        if gtin is not None:
+            gtins.add(gtin)
+        elif clean(value) is not None:
+            others.add(clean(value))
+    return or_(Item.gtin.in_(gtins), Item.barcode.in_(others))
+
+
+def find_item(value):
+    if clean(value) is None:
+        return None
+    return Item.query.filter(item_filter(value)).first()
+
+
+def find_duplicate(value, exclude_id=None):
+    """Another item already using barcode ``value`` (in any GTIN format)."""
+    if clean(value) is None:
+        return None
+    query = Item.query.filter(item_filter(value))
+    if exclude_id is not None:
+        query = query.filter(Item.id != exclude_id)
+    return query.first()
+
+
+def backfill():
+    """Fill ``Item.gtin`` for items saved before the column existed.
+
+    When two items turn out to share a GTIN (the duplicates this column is
+    meant to prevent), the older one gets it, and scans find that one. Returns
+    the ids of the others, left without a GTIN for staff to merge. The
+    caller commits.
+    """
+    taken = {gtin for (gtin,) in db.session.query(Item.gtin).filter(Item.gtin.isnot(None))}
+    updates, clashes = [], []
+    rows = db.session.query(Item.id, Item.barcode)\
+        .filter(Item.gtin.is_(None), Item.barcode.isnot(None)).order_by(Item.id)
+    for item_id, barcode in rows:
+        gtin = gtin_or_none(barcode)
+        if gtin is None:
+            continue
+        if gtin in taken:
+            clashes.append(item_id)
+            continue
+        taken.add(gtin)
+        updates.append({'id': item_id, 'gtin': gtin})
+    if updates:
+        db.session.bulk_update_mappings(Item, updates)
+    return clashes
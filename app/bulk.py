@@ -0,0 +1,106 @@
+# app/bulk.py
+"""Set-based bulk operations on orders and items.
+
+Every operation is a single ``UPDATE ... WHERE`` statement built from the same
+filter as its dry-run ``COUNT``, so changing ten thousand rows costs one
+statement instead of a Python loop over ORM objects.
+"""
+from sqlalchemy import func
+
+from . import barcodes as barcode_lookup, db, ledger, rollups, stock_alerts
+from .models import Item, Order
+
+ORDER_STATUSES = ['Processing', 'Shipped', 'Delivered', 'Cancelled']
+
+
+class BulkResult:
+
+    def __init__(self, matched, dry_run):
+        self.matched = matched
+        self.dry_run = dry_run
+
+    def as_dict(self):
+        return {'matched': self.matched, 'dry_run': self.dry_run}
+
+
+def order_filters(order_ids=None, status=None, start=None, end=None):
+    """Build the WHERE clause for a selection (ids) and/or filter of orders.
+
+    ``start`` is inclusive and ``end`` exclusive, as returned by
+    ``exports.parse_date_range``.
+    """
+    filters = []
+    if order_ids:
+        filters.append(Order.id.in_(order_ids))
+    if status:
+        filters.append(Order.status == status)
+    if start:
+        filters.append(Order.date_ordered >= start)
+    if end:
+        filters.append(Order.date_ordered < end)
+    return filters
+
+
+def item_filters(item_ids=None, search=None, max_stock=None, barcodes=None):
+    filters = []
+    if item_ids:
+        filters.append(Item.id.in_(item_ids))
+    if search:
+        filters.append(Item.name.ilike(f'%{search}%'))
+    if max_stock is not None:
+        filters.append(Item.stock <= max_stock)
+    if barcodes:
+        filters.append(barcode_lookup.items_filter(barcodes))
+    return filters
+
+
+def _apply(model, filters, values, dry_run, skip_unchanged=()):
+    if not filters:
+        # Refuse to touch every row by accident
+        raise ValueError('Select at least one row or filter')
+    filters = list(filters) + list(skip_unchanged)
+    if dry_run:
+        matched = db.session.query(func.count(model.id)).filter(*filters).scalar()
+        return BulkResult(matched, True)
+    matched = db.session.query(model).filter(*filters).update(values, synchronize_session=False)
+    db.session.commit()
+    return BulkResult(matched, False)
+
+
+def set_order_status(new_status, filters, dry_run=False):
+    """Move every order matching ``filters`` to ``new_status``."""
+    if new_status not in ORDER_STATUSES:
+        raise ValueError(f'Invalid status: {new_status}')
+    # Orders already in the target status are not counted as changed
+    skip_unchanged = [Order.status != new_status]
+    if filters and not dry_run:
+        # Same transaction as the UPDATE, which _apply commits
+        rollups.record_status_change(list(filters) + skip_unchanged, new_status)
+    return _apply(Order, filters, {Order.status: new_status}, dry_run,
+                  skip_unchanged=skip_unchanged)
+
+
+def reprice_items(percent, filters, dry_run=False):
+    """Change prices by ``percent`` (e.g. 10 for +10%, -5 for -5%)."""
+    percent = float(percent)
+    if percent <= -100:
+        raise ValueError('Price change must be greater than -100%')
+    factor = 1 + percent / 100.0
+    return _apply(Item, filters, {Item.price: func.round(Item.price * factor, 2)}, dry_run)
+
+
+def restock_items(filters, add=None, set_to=None, dry_run=False, user_id=None):
+    """Add ``add`` units to, or set stock to ``set_to`` for, every matching item."""
+    if (add is None) == (set_to is None):
+        raise ValueError('Give exactly one of add or set_to')
+    if add is not None:
+        value = func.max(func.coalesce(Item.stock, 0) + int(add), 0)
+    else:
+        if int(set_to) < 0:
+            raise ValueError('Stock cannot be negative')
+        value = int(set_to)
+    if filters and not dry_run:
+        # Same transaction as the UPDATE, which _apply commits
+        ledger.record_update(filters, value, 'restock', user_id=user_id)
+        stock_alerts.sync(filters, new_stock=value)
+    return _apply(Item, filters, {Item.stock: value}, dry_run)
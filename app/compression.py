@@ -0,0 +1,169 @@
+# app/compression.py
+"""gzip/brotli compression of responses and pre-compressed static files.
+
+Dynamic responses are compressed in an ``after_request`` hook when the
+client accepts it, the body is at least ``COMPRESS_MIN_SIZE`` bytes (default
+1024) and the mimetype is text-like (HTML, CSS, JS, JSON, SVG, ...). Skipped:
+images and other binary types, streamed bodies (CSV exports, the live order
+feed, NDJSON import progress), files from ``send_file``, and responses that
+already have a ``Content-Encoding`` or say ``Cache-Control: no-transform``.
+
+``COMPRESS_LEVEL`` (gzip, default 6) and ``COMPRESS_BR_LEVEL`` (brotli,
+default 5) trade CPU for size. Brotli is used only when the optional
+``brotli`` package is installed; otherwise clients get gzip.
+
+Static files: scripts/precompress_static.py writes ``.gz``/``.br`` copies
+next to the assets, and the ``static`` endpoint serves the best one the
+client accepts, if it is at least as new as the original.
+"""
+import gzip
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml',
+    'application/manifest+json', 'image/svg+xml',
+}
+STATIC_EXTENSIONS = ('.css', '.js', '.mjs', '.json', '.map', '.svg', '.html', '.txt', '.xml')
+# Static variants, best first, as (Content-Encoding, file suffix)
+STATIC_VARIANTS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encodings, encodings=None):
+    """The best encoding the client accepts (``Accept-Encoding`` q-values), or None."""
+    best, best_quality = None, 0
+    for encoding in encodings or available_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level=None, br_level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5 if br_level is None else br_level)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+
+
+def _should_compress(response, min_size):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    return response.content_length is None or response.content_length >= min_size
+
+
+def compress_response(response):
+    config = current_app.config
+    if not config['COMPRESS_ENABLED']:
+        return response
+    response.vary.add('Accept-Encoding')
+    min_size = config['COMPRESS_MIN_SIZE']
+    if not _should_compress(response, min_size):
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    response.set_data(compress(data, encoding, config['COMPRESS_LEVEL'], config['COMPRESS_BR_LEVEL']))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body differs byte for byte, so a strong validator no longer holds
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def _static_view(app, original):
+    def static(filename):
+        source = safe_join(app.static_folder, filename)
+        if source is not None and app.config['COMPRESS_ENABLED']:
+            for name, suffix in STATIC_VARIANTS:
+                if request.accept_encodings[name] <= 0:
+                    continue
+                variant = source + suffix
+                try:
+                    fresh = os.path.getmtime(variant) >= os.path.getmtime(source)
+                except OSError:
+                    continue
+                if fresh:
+                    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                    response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+                    response.headers['Content-Encoding'] = name
+                    response.vary.add('Accept-Encoding')
+                    return response
+        response = original(filename=filename)
+        response.vary.add('Accept-Encoding')
+        return response
+    return static
+
+
+def precompress_directory(root, min_size=256, level=9, br_level=11, force=False):
+    """Write ``.gz`` (and ``.br`` when brotli is installed) next to static assets.
+
+    Only files with a text-like extension and at least ``min_size`` bytes are
+    compressed, and a variant is only kept if it is smaller than the original.
+    Up-to-date variants are left alone unless ``force``. Returns a list of
+    ``(path, original_size, {suffix: size})``.
+    """
+    results = []
+    for directory, _, files in os.walk(root):
+        for name in sorted(files):
+            if not name.endswith(STATIC_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            size = os.path.getsize(path)
+            if size < min_size:
+                continue
+            written = {}
+            data = None
+            for encoding, suffix in STATIC_VARIANTS:
+                if encoding == 'br' and brotli is None:
+                    continue
+                variant = path + suffix
+                if not force and os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(path):
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = compress(data, encoding, level, br_level)
+                if len(compressed) >= size:
+                    if os.path.exists(variant):
+                        os.remove(variant)
+                    continue
+                with open(variant, 'wb') as f:
+                    f.write(compressed)
+                written[suffix] = len(compressed)
+            if written:
+                results.append((path, size, written))
+    return results
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_LEVEL', 5)
+    app.after_request(compress_response)
+    if app.static_folder and 'static' in app.view_functions:
+        app.view_functions['static'] = _static_view(app, app.view_functions['static'])
@@ -0,0 +1,127 @@
+# app/conditional.py
+"""Conditional GET for the catalogue pages.
+
+``@conditional_page(version)`` wraps a view. ``version(**view_args)`` returns
+``(token, last_modified)`` from a cheap query (or None to let the view run,
+e.g. to 404). Before the view runs, the ETag is built from that token plus
+everything else the page shows:
+
+* the store settings row (``g.store_settings.updated_at``);
+* who is logged in and their cart badge (both already loaded for the navbar),
+  or for visitors the guest cart badge from the cookie;
+* the CSRF token's age bucket, so a page kept by the browser never carries a
+  token older than half of ``WTF_CSRF_TIME_LIMIT``.
+
+A matching ``If-None-Match`` gets an empty 304 without rendering the
+template. ``If-Modified-Since`` is only trusted for anonymous visitors with
+an empty guest cart, whose page doesn't depend on anything but the data. Requests with a pending flash
+message always render, so the message is shown and consumed.
+
+Pages are ``private`` (they embed a per-session CSRF token, so shared caches
+must not keep them) and sent with ``Vary: Cookie``. Anonymous visitors may
+reuse a page for ``ANON_PAGE_MAX_AGE`` seconds (default 60); logged-in users
+revalidate every time.
+"""
+import hashlib
+import time
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import func
+
+from . import db, guest_cart
+from .models import Item
+
+
+def item_updated():
+    # Rows from before ``updated_at`` existed fall back to their creation time
+    return func.coalesce(Item.updated_at, Item.date_added)
+
+
+def catalog_version():
+    """Newest item change plus the item count (which catches deletions)."""
+    last_modified, count = db.session.query(func.max(item_updated()), func.count(Item.id)).one()
+    return f'{count}:{last_modified}', last_modified
+
+
+def item_version(item_id):
+    row = db.session.query(Item.id, item_updated()).filter(Item.id == item_id).first()
+    if row is None:
+        return None
+    return f'{item_id}:{row[1]}', row[1]
+
+
+def _viewer():
+    if not current_user.is_authenticated:
+        return f'anon:{guest_cart.line_count()}'
+    summary = current_user.cart_summary
+    return f'{current_user.id}:{current_user.first_name}:{current_user.is_admin}:{summary.line_count}'
+
+
+def _csrf_bucket():
+    """(bucket number, bucket start) for the CSRF token age, or ('', None)."""
+    config = current_app.config
+    limit = config.get('WTF_CSRF_TIME_LIMIT')
+    if not config.get('WTF_CSRF_ENABLED', True) or not limit:
+        return '', None
+    period = max(limit // 2, 1)
+    bucket = int(time.time() // period)
+    return str(bucket), datetime.utcfromtimestamp(bucket * period)
+
+
+def _settings_version():
+    settings = getattr(g, 'store_settings', None)
+    return f'{settings.id}:{settings.updated_at}' if settings is not None else ''
+
+
+def _newest(*stamps):
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps).replace(microsecond=0) if stamps else None
+
+
+def _apply_headers(response, etag, last_modified, anonymous):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    max_age = current_app.config.get('ANON_PAGE_MAX_AGE', 60) if anonymous else 0
+    response.headers['Cache-Control'] = f'private, max-age={max_age}, must-revalidate'
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional_page(version):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or not current_app.config.get('CONDITIONAL_GET', True)
+                    or session.get('_flashes')):
+                return view(*args, **kwargs)
+            stamp = version(**kwargs)
+            if stamp is None:
+                return view(*args, **kwargs)
+            token, data_modified = stamp
+            anonymous = not current_user.is_authenticated
+            bucket, bucket_start = _csrf_bucket()
+            parts = (request.endpoint, token, _settings_version(), _viewer(), bucket)
+            etag = hashlib.sha1('|'.join(map(str, parts)).encode('utf-8')).hexdigest()[:20]
+            settings = getattr(g, 'store_settings', None)
+            last_modified = _newest(data_modified, settings.updated_at if settings is not None else None,
+                                    bucket_start)
+
+            not_modified = False
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            elif anonymous and not guest_cart.line_count() and request.if_modified_since and last_modified is not None:
+                not_modified = last_modified <= request.if_modified_since.replace(tzinfo=None)
+            if not_modified:
+                return _apply_headers(current_app.response_class(status=304), etag, last_modified, anonymous)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _apply_headers(response, etag, last_modified, anonymous)
+            return response
+        return wrapper
+    return decorator
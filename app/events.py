@@ -0,0 +1,162 @@
+# app/events.py
+"""In-process publish/subscribe hub for the admin live order feed.
+
+``checkout`` and the admin status routes call ``publish()`` after they commit;
+``/admin/orders/events`` streams the events to browsers as server-sent events.
+
+* Subscribers are capped (``EVENTS_MAX_SUBSCRIBERS``, default 20) because
+  each open stream holds a server thread; the next one gets a 503.
+* Idle streams send a comment line every ``EVENTS_HEARTBEAT`` seconds
+  (default 15), which keeps proxies from closing them and lets the server
+  notice clients that went away.
+* The last ``EVENTS_HISTORY`` events (default 500) are kept so a browser that
+  reconnects with ``Last-Event-ID`` gets what it missed. If its id is too old,
+  or from another process or a restart, it gets a ``reset`` event and reloads.
+* A subscriber that stops reading is dropped once its queue is full; its
+  browser reconnects and resumes from history.
+
+The hub lives in one process, the same as the app's built-in server. Under a
+multi-process server, each worker only sees the events it published.
+"""
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from flask import current_app
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Event:
+    __slots__ = ('id', 'type', 'data')
+
+    def __init__(self, id, type, data):
+        self.id = id
+        self.type = type
+        self.data = data
+
+    def encode(self):
+        return f'id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n'
+
+
+class Subscription:
+
+    def __init__(self, hub, queue_size):
+        self.hub = hub
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventHub:
+
+    def __init__(self, max_subscribers=20, history=500, queue_size=100):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        # Event ids are "<process>-<n>" so ids from a restart or another worker are recognised
+        self.stream_id = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, type, data):
+        with self._lock:
+            event = Event(f'{self.stream_id}-{next(self._counter)}', type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(event)
+        return event
+
+    def _backlog(self, last_event_id):
+        """Events after ``last_event_id``, or None if they can't be recovered."""
+        stream, _, number = last_event_id.rpartition('-')
+        if stream != self.stream_id or not number.isdigit():
+            return None
+        number = int(number)
+        events = list(self._history)
+        if events and int(events[0].id.rpartition('-')[2]) > number + 1:
+            return None  # the oldest event we still have is past the gap
+        return [event for event in events if int(event.id.rpartition('-')[2]) > number]
+
+    def subscribe(self, last_event_id=None):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers()
+            subscription = Subscription(self, self.queue_size)
+            if last_event_id:
+                backlog = self._backlog(last_event_id)
+                if backlog is None:
+                    subscription.offer(Event(f'{self.stream_id}-0', 'reset', {}))
+                else:
+                    for event in backlog:
+                        subscription.offer(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Free ``subscription``'s slot; calling it again is harmless."""
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stream(self, subscription, heartbeat=15, max_age=None):
+        """Yield SSE text for ``subscription`` until the client goes away.
+
+        With ``max_age`` the stream ends after that many seconds; the browser
+        reconnects with ``Last-Event-ID`` and nothing is lost.
+        """
+        deadline = time.monotonic() + max_age if max_age else None
+        try:
+            yield 'retry: 5000\n\n'
+            while not subscription.dropped:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                event = subscription.get(timeout=heartbeat)
+                yield event.encode() if event is not None else ': heartbeat\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+
+def get_hub():
+    return current_app.extensions['events']
+
+
+def publish(type, data):
+    """Publish to the current app's hub; a no-op where it isn't set up."""
+    hub = current_app.extensions.get('events')
+    if hub is not None:
+        hub.publish(type, data)
+
+
+def init_app(app):
+    app.config.setdefault('EVENTS_MAX_SUBSCRIBERS', 20)
+    app.config.setdefault('EVENTS_HISTORY', 500)
+    app.config.setdefault('EVENTS_HEARTBEAT', 15)
+    app.config.setdefault('EVENTS_MAX_AGE', 600)
+    app.extensions['events'] = EventHub(
+        max_subscribers=app.config['EVENTS_MAX_SUBSCRIBERS'],
+        history=app.config['EVENTS_HISTORY'],
+    )
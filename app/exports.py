@@ -0,0 +1,226 @@
+# app/exports.py
+"""CSV exports shared by the admin download routes and background jobs.
+
+Each ``*_export`` function returns ``(filename, header, rows)`` where ``rows``
+iterates over a server-side cursor, so callers can stream the result to a
+response or a file without holding the table in memory. ``rows.count()``
+runs a COUNT of the same query, for progress reporting.
+"""
+import csv
+import zlib
+from datetime import datetime, timedelta
+from io import StringIO
+
+from sqlalchemy import func, desc
+from sqlalchemy.sql import label
+
+from . import db
+from .archive import all_order_lines, all_orders
+from .models import CustomerSales, Item, User
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def parse_date_range(args):
+    """Read optional ``start``/``end`` (YYYY-MM-DD) values; ``end`` is inclusive.
+
+    Raises ValueError on malformed dates.
+    """
+    start = (args.get('start') or '').strip()
+    end = (args.get('end') or '').strip()
+    start = datetime.strptime(start, '%Y-%m-%d') if start else None
+    end = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else None
+    return start, end
+
+
+def _date_filters(column, start, end):
+    filters = []
+    if start:
+        filters.append(column >= start)
+    if end:
+        filters.append(column < end)
+    return filters
+
+
+def _streamed(query):
+    """Run ``query`` with a server-side cursor, fetching rows in batches."""
+    return query.execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+
+
+class ExportRows:
+    """CSV rows of ``query``, each built by ``format_row`` from a result row."""
+
+    def __init__(self, query, format_row):
+        self.query = query
+        self.format_row = format_row
+
+    def __iter__(self):
+        for result in _streamed(self.query):
+            yield self.format_row(result)
+
+    def count(self):
+        return self.query.order_by(None).count()
+
+
+def stream_csv(header, rows):
+    """Yield CSV text in batches of rows, so memory stays flat regardless of size."""
+    si = StringIO()
+    cw = csv.writer(si)
+    cw.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        cw.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield si.getvalue()
+            si.seek(0)
+            si.truncate()
+    yield si.getvalue()
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def products_export(start=None, end=None):
+    query = db.session.query(
+        Item.id, Item.name, Item.description, Item.price, Item.stock,
+        Item.barcode, Item.image_url, Item.date_added
+    ).filter(*_date_filters(Item.date_added, start, end)).order_by(Item.id)
+
+    def row(product):
+        return [
+            product.id,
+            product.name,
+            product.description or '',
+            str(product.price),
+            product.stock,
+            product.barcode or '',
+            product.image_url or '',
+            product.date_added.strftime('%Y-%m-%d %H:%M:%S') if product.date_added else ''
+        ]
+
+    return (
+        'products_export.csv',
+        ['ID', 'Name', 'Description', 'Price', 'Stock', 'Barcode', 'Image Path', 'Date Added'],
+        ExportRows(query, row)
+    )
+
+
+def orders_export(start=None, end=None, archived=False):
+    """Orders in the date range; with ``archived`` also those in the archive."""
+    orders = all_orders(archived)
+    # Join the customer in the same query instead of lazy-loading order.user per row
+    query = db.session.query(
+        orders.c.id, orders.c.status, orders.c.total, orders.c.date_ordered,
+        User.first_name, User.email
+    ).outerjoin(User, User.id == orders.c.user_id)\
+     .filter(*_date_filters(orders.c.date_ordered, start, end))\
+     .order_by(orders.c.id)
+
+    def row(order):
+        return [
+            order.id,
+            order.first_name or 'Guest',
+            order.email or 'No email',
+            '',  # Phone number not stored in the model
+            order.status,
+            str(order.total) if order.total is not None else '0.00',
+            order.date_ordered.strftime('%Y-%m-%d %H:%M:%S') if order.date_ordered else ''
+        ]
+
+    return (
+        'orders_export.csv',
+        ['Order ID', 'Customer Name', 'Email', 'Phone', 'Status', 'Total Amount', 'Order Date'],
+        ExportRows(query, row)
+    )
+
+
+def order_lines_export(start=None, end=None, archived=False):
+    """One row per order line, from the item snapshot taken at checkout."""
+    orders = all_orders(archived)
+    lines = all_order_lines(archived)
+    query = db.session.query(
+        lines.c.order_id, orders.c.date_ordered, orders.c.status,
+        lines.c.item_id, lines.c.item_name, lines.c.item_barcode,
+        lines.c.quantity, lines.c.price
+    ).join(orders, orders.c.id == lines.c.order_id)\
+     .filter(*_date_filters(orders.c.date_ordered, start, end))\
+     .order_by(lines.c.order_id, lines.c.id)
+
+    def row(line):
+        return [
+            line.order_id,
+            line.date_ordered.strftime('%Y-%m-%d %H:%M:%S') if line.date_ordered else '',
+            line.status,
+            line.item_id if line.item_id is not None else '',
+            line.item_name or '',
+            line.item_barcode or '',
+            line.quantity,
+            str(line.price),
+            str(line.price * line.quantity)
+        ]
+
+    return (
+        'order_lines_export.csv',
+        ['Order ID', 'Order Date', 'Status', 'Item ID', 'Product', 'Barcode', 'Quantity', 'Unit Price', 'Line Total'],
+        ExportRows(query, row)
+    )
+
+
+def customers_export(start=None, end=None, archived=False):
+    """Per-customer order count and spend, excluding cancelled orders.
+
+    Without a date range this reads the ``CustomerSales`` rollup, which
+    already covers archived orders; with one it aggregates the orders placed
+    in that range, including the archive if ``archived`` is set.
+    """
+    if start is None and end is None:
+        query = db.session.query(
+            User.first_name,
+            User.email,
+            CustomerSales.order_count,
+            CustomerSales.total_spent,
+            CustomerSales.last_order
+        ).join(User, User.id == CustomerSales.user_id)\
+         .filter(CustomerSales.order_count > 0)\
+         .order_by(desc(CustomerSales.order_count))
+    else:
+        orders = all_orders(archived)
+        query = db.session.query(
+            User.first_name,
+            User.email,
+            label('order_count', func.count(orders.c.id)),
+            label('total_spent', func.coalesce(func.sum(orders.c.total), 0.0)),
+            label('last_order', func.max(orders.c.date_ordered))
+        ).join(orders, User.id == orders.c.user_id)\
+         .filter(orders.c.status != 'Cancelled', *_date_filters(orders.c.date_ordered, start, end))\
+         .group_by(User.id, User.first_name, User.email)\
+         .order_by(desc(func.count(orders.c.id)))
+
+    def row(customer):
+        return [
+            customer.first_name or 'Guest',
+            customer.email or 'No email',
+            '',  # Phone number not stored in the model
+            customer.order_count,
+            f"{customer.total_spent:.0f}",
+            customer.last_order.strftime('%Y-%m-%d %H:%M:%S') if customer.last_order else 'N/A'
+        ]
+
+    return (
+        'customers_export.csv',
+        ['Name', 'Email', 'Phone', 'Total Orders', 'Total Spent', 'Last Order Date'],
+        ExportRows(query, row)
+    )
+
+
+EXPORTS = {
+    'products': products_export,
+    'orders': orders_export,
+    'order_lines': order_lines_export,
+    'customers': customers_export,
+}
@@ -0,0 +1,180 @@
+# app/guest_cart.py
+"""Cart for visitors who aren't logged in, kept in a signed cookie.
+
+The cookie holds ``item_id:quantity`` pairs signed with the app's secret key
+(tampered cookies read as an empty cart), so browsing and filling a cart
+writes nothing to the database. It is capped at ``MAX_LINES`` lines of at
+most ``MAX_QUANTITY`` each, which keeps it well under the 4 KB cookie limit.
+
+Quantities are checked against stock and ``max_per_customer`` with one
+batched item query (``validate``). On login or signup ``merge_into_user``
+adds the guest lines to the user's database cart in one transaction and
+clears the cookie; checkout itself still requires an account.
+"""
+from collections import namedtuple
+
+from flask import current_app, g, request
+from flask_login import current_user
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from . import db
+from .models import Cart, CartItem, Item
+
+COOKIE_NAME = 'guest_cart'
+MAX_LINES = 50
+MAX_QUANTITY = 999
+COOKIE_MAX_AGE = 30 * 24 * 3600
+
+# Quacks like CartItem for the cart template
+GuestLine = namedtuple('GuestLine', ['item_id', 'item', 'quantity'])
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='guest-cart')
+
+
+def _decode(value):
+    lines = {}
+    for pair in value.split(',') if value else ():
+        item_id, _, quantity = pair.partition(':')
+        if item_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+            lines[int(item_id)] = min(int(quantity), MAX_QUANTITY)
+        if len(lines) >= MAX_LINES:
+            break
+    return lines
+
+
+def _encode(lines):
+    return ','.join(f'{item_id}:{quantity}' for item_id, quantity in sorted(lines.items()))
+
+
+def load():
+    """``{item_id: quantity}`` from the cookie (empty if missing or tampered)."""
+    if 'guest_cart' not in g:
+        raw = request.cookies.get(COOKIE_NAME)
+        try:
+            g.guest_cart = _decode(_serializer().loads(raw)) if raw else {}
+        except BadSignature:
+            g.guest_cart = {}
+    return dict(g.guest_cart)
+
+
+def save(lines):
+    """Replace the guest cart; the cookie is written when the response goes out.
+
+    Raises ValueError if the cart would exceed ``MAX_LINES`` lines.
+    """
+    lines = {item_id: min(quantity, MAX_QUANTITY) for item_id, quantity in lines.items() if quantity > 0}
+    if len(lines) > MAX_LINES:
+        raise ValueError(f'A guest cart holds at most {MAX_LINES} different items; log in for a larger cart.')
+    g.guest_cart = lines
+    g.guest_cart_dirty = True
+
+
+def clear():
+    g.guest_cart = {}
+    g.guest_cart_dirty = True
+
+
+def line_count():
+    return len(load())
+
+
+def limit_for(item):
+    """Most of ``item`` one customer may have in their cart."""
+    limit = max(item.stock or 0, 0)
+    if item.max_per_customer:
+        limit = min(limit, item.max_per_customer)
+    return limit
+
+
+def validate(lines):
+    """Clamp ``lines`` to stock and per-customer limits with one item query.
+
+    Returns ``(lines, items, notices)``: the adjusted quantities (unknown
+    and sold-out items dropped), the ``Item`` rows by id, and a message per
+    line that changed.
+    """
+    items = {item.id: item for item in Item.query.filter(Item.id.in_(lines))} if lines else {}
+    valid, notices = {}, []
+    for item_id, quantity in lines.items():
+        item = items.get(item_id)
+        if item is None:
+            notices.append('An item in your cart is no longer available and was removed.')
+            continue
+        allowed = min(quantity, limit_for(item))
+        if allowed <= 0:
+            notices.append(f'{item.name} is out of stock and was removed from your cart.')
+            continue
+        if allowed < quantity:
+            notices.append(f'Only {allowed} of {item.name} can be ordered; your cart was adjusted.')
+        valid[item_id] = allowed
+    return valid, items, notices
+
+
+def display_lines():
+    """Validated ``GuestLine``s for the cart page, plus notices; saves any adjustment."""
+    lines = load()
+    valid, items, notices = validate(lines)
+    if valid != lines:
+        save(valid)
+    return [GuestLine(item_id, items[item_id], quantity) for item_id, quantity in valid.items()], notices
+
+
+def merge_into_user(user):
+    """Add the guest cart to ``user``'s database cart and clear the cookie.
+
+    Quantities are added to what the user already has, capped by stock and
+    ``max_per_customer``. Everything is written in one commit. Returns the
+    number of lines merged.
+    """
+    lines = load()
+    if not lines:
+        return 0
+    cart = Cart.query.filter_by(user_id=user.id).order_by(Cart.id).first()
+    if cart is None:
+        cart = Cart(user_id=user.id)
+        db.session.add(cart)
+        db.session.flush()
+    existing = {line.item_id: line for line in CartItem.query.filter(
+        CartItem.cart_id == cart.id, CartItem.item_id.in_(lines))}
+    items = {item.id: item for item in Item.query.filter(Item.id.in_(lines))}
+    merged = 0
+    for item_id, quantity in lines.items():
+        item = items.get(item_id)
+        if item is None:
+            continue
+        line = existing.get(item_id)
+        current = line.quantity if line is not None else 0
+        target = min(current + quantity, limit_for(item))
+        if target <= current:
+            continue
+        if line is not None:
+            line.quantity = target
+        else:
+            db.session.add(CartItem(cart_id=cart.id, item_id=item_id, quantity=target))
+        merged += 1
+    db.session.commit()
+    clear()
+    return merged
+
+
+def _write_cookie(response):
+    if g.get('guest_cart_dirty'):
+        lines = g.get('guest_cart') or {}
+        secure = current_app.config.get('PREFERRED_URL_SCHEME') == 'https'
+        if lines:
+            response.set_cookie(COOKIE_NAME, _serializer().dumps(_encode(lines)), max_age=COOKIE_MAX_AGE,
+                                httponly=True, samesite='Lax', secure=secure)
+        else:
+            response.delete_cookie(COOKIE_NAME, httponly=True, samesite='Lax', secure=secure)
+    return response
+
+
+def _inject_count():
+    return dict(guest_cart_count=0 if current_user.is_authenticated else line_count())
+
+
+def init_app(app):
+    app.after_request(_write_cookie)
+    app.context_processor(_inject_count)
@@ -0,0 +1,302 @@
+# app/importer.py
+"""Bulk product import.
+
+Reads the column layout written by ``admin.export_products`` (CSV) or the same
+fields as JSON objects, one per line (JSONL), and upserts items by barcode in
+chunks. Each chunk is validated and written with
+``INSERT ... ON CONFLICT ... DO UPDATE`` inside its own transaction, so a
+bad row never rolls back the rest of the file. EAN/UPC barcodes match on their
+GTIN (see app/barcodes.py), so a UPC-A row updates the item stored under the
+same code as an EAN-13; other barcodes match exactly.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import barcodes, db, ledger, stock_alerts
+from .models import Item
+
+# Columns written by export_products, mapped to Item attributes
+EXPORT_COLUMNS = {
+    'ID': 'id',
+    'Name': 'name',
+    'Description': 'description',
+    'Price': 'price',
+    'Stock': 'stock',
+    'Barcode': 'barcode',
+    'Image Path': 'image_url',
+    'Date Added': 'date_added',
+}
+# Accept the attribute names themselves as well (handy for JSONL)
+COLUMN_ALIASES = dict(EXPORT_COLUMNS, **{v: v for v in EXPORT_COLUMNS.values()})
+
+# Fields overwritten when an incoming barcode already exists
+UPSERT_FIELDS = ('name', 'description', 'price', 'stock', 'image_url')
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 200
+
+
+class ImportResult:
+    """Running totals for an import, updated after every chunk."""
+
+    def __init__(self):
+        self.rows = 0
+        self.upserted = 0
+        self.updated_by_id = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'message': message})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'upserted': self.upserted,
+            'updated_by_id': self.updated_by_id,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': list(self.errors),
+        }
+
+
+def detect_format(filename):
+    """Return 'jsonl' for .jsonl/.ndjson files and 'csv' for everything else."""
+    name = (filename or '').lower()
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def _iter_records(stream, fmt):
+    """Yield ``(line_number, raw_record)`` from a binary or text stream."""
+    if isinstance(stream, io.TextIOBase):
+        yield from _iter_text_records(stream, fmt)
+        return
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        yield from _iter_text_records(text, fmt)
+    finally:
+        # Leave the caller's stream open; the wrapper would close it otherwise
+        text.detach()
+
+
+def _iter_text_records(text, fmt):
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f'Invalid JSON: {e}')
+                continue
+            if not isinstance(record, dict):
+                yield line_number, ValueError('Each line must be a JSON object')
+                continue
+            yield line_number, record
+    else:
+        reader = csv.DictReader(text)
+        for record in reader:
+            # Header is line 1, so the first data row is line 2
+            yield reader.line_num, record
+
+
+def _clean_row(record):
+    """Validate one raw record and return a dict of Item column values."""
+    row = {}
+    for key, value in record.items():
+        attr = COLUMN_ALIASES.get((key or '').strip())
+        if attr:
+            row[attr] = value.strip() if isinstance(value, str) else value
+
+    name = row.get('name')
+    if not name:
+        raise ValueError('Name is required')
+
+    try:
+        price = float(row.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid price: {row.get('price')!r}")
+    if price < 0:
+        raise ValueError('Price cannot be negative')
+
+    stock = row.get('stock')
+    try:
+        stock = int(stock) if stock not in (None, '') else 0
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid stock: {stock!r}')
+    if stock < 0:
+        raise ValueError('Stock cannot be negative')
+
+    barcode = barcodes.clean(row.get('barcode'))
+
+    item_id = row.get('id')
+    try:
+        item_id = int(item_id) if item_id not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid ID: {item_id!r}')
+
+    date_added = row.get('date_added')
+    if date_added:
+        try:
+            date_added = datetime.strptime(date_added, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            raise ValueError(f'Invalid date: {date_added!r}')
+    else:
+        date_added = datetime.utcnow()
+
+    return {
+        'id': item_id,
+        'name': name,
+        'description': row.get('description') or None,
+        'price': price,
+        'stock': stock,
+        'barcode': barcode,
+        'gtin': barcodes.normalize(barcode),
+        'image_url': row.get('image_url') or None,
+        'date_added': date_added,
+    }
+
+
+def _upsert_statement(key):
+    stmt = sqlite_insert(Item.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=[Item.__table__.c[key]],
+        set_={**{field: stmt.excluded[field] for field in UPSERT_FIELDS}, 'updated_at': datetime.utcnow()},
+    )
+
+
+def _write_chunk(rows):
+    """Write one validated chunk in a single transaction.
+
+    Rows with an EAN/UPC barcode are upserted by GTIN (or update an item
+    that has the same barcode but no GTIN yet), rows with another barcode
+    by barcode. Rows without one update the item with the given ID
+    when it exists, and are inserted otherwise.
+    Stock changes go into the stock ledger, and low-stock alerts are
+    updated, in the same transaction.
+    Returns ``(upserted, updated_by_id, inserted)``.
+    """
+    by_gtin = {}
+    by_barcode = {}
+    without_barcode = []
+    for line, row in rows:
+        # Last occurrence of a barcode within a chunk wins
+        if row['gtin'] is not None:
+            by_gtin[row['gtin']] = {k: v for k, v in row.items() if k != 'id'}
+        elif row['barcode']:
+            by_barcode[row['barcode']] = {k: v for k, v in row.items() if k != 'id'}
+        else:
+            without_barcode.append(row)
+
+    ids = [row['id'] for row in without_barcode if row['id'] is not None]
+    existing_ids = set()
+    if ids:
+        existing_ids = {
+            item_id for (item_id,) in
+            db.session.query(Item.id).filter(Item.id.in_(ids)).all()
+        }
+
+    now = datetime.utcnow()
+    updates = []
+    inserts = []
+    for row in without_barcode:
+        if row['id'] in existing_ids:
+            updates.append({'id': row['id'], 'updated_at': now, **{f: row[f] for f in UPSERT_FIELDS}})
+        else:
+            inserts.append({k: v for k, v in row.items() if k != 'id'})
+
+    # An item may hold a row's barcode without its GTIN (written before the
+    # gtin column, or by raw SQL). Inserting the row would break the unique
+    # barcode, so give that item the GTIN and update it instead.
+    attached = []
+    known_gtins = {gtin for (gtin,) in db.session.query(Item.gtin).filter(Item.gtin.in_(by_gtin))}
+    unmatched = {row['barcode']: gtin for gtin, row in by_gtin.items() if gtin not in known_gtins}
+    if unmatched:
+        matches = db.session.query(Item.id, Item.barcode)\
+            .filter(Item.barcode.in_(unmatched), Item.gtin.is_(None))
+        for item_id, barcode in matches:
+            row = by_gtin.pop(unmatched[barcode])
+            attached.append({'id': item_id, 'gtin': row['gtin'], 'updated_at': now,
+                             **{f: row[f] for f in UPSERT_FIELDS}})
+
+    # Stock of every item this chunk can touch, to diff afterwards; new items
+    # get ids above the current maximum
+    touched = or_(Item.gtin.in_(by_gtin), Item.barcode.in_(by_barcode),
+                  Item.id.in_([row['id'] for row in updates + attached]))
+    before = ledger.stock_levels(touched)
+    max_id = db.session.query(func.max(Item.id)).scalar() or 0
+
+    if by_gtin:
+        db.session.execute(_upsert_statement('gtin'), list(by_gtin.values()))
+    if by_barcode:
+        db.session.execute(_upsert_statement('barcode'), list(by_barcode.values()))
+    if updates or attached:
+        db.session.bulk_update_mappings(Item, updates + attached)
+    if inserts:
+        db.session.execute(Item.__table__.insert(), inserts)
+    ledger.record_levels(before, ledger.stock_levels(or_(touched, Item.id > max_id)), 'import')
+    stock_alerts.sync([or_(touched, Item.id > max_id)])
+    db.session.commit()
+    return len(by_gtin) + len(by_barcode) + len(attached), len(updates), len(inserts)
+
+
+def _flush_chunk(rows, result):
+    if not rows:
+        return
+    try:
+        upserted, updated, inserted = _write_chunk(rows)
+    except SQLAlchemyError:
+        db.session.rollback()
+        # Retry row by row so that one bad row only fails itself
+        upserted = updated = inserted = 0
+        for line, row in rows:
+            try:
+                u, up, ins = _write_chunk([(line, row)])
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                result.add_error(line, str(getattr(e, 'orig', e)))
+                continue
+            upserted += u
+            updated += up
+            inserted += ins
+    result.upserted += upserted
+    result.updated_by_id += updated
+    result.inserted += inserted
+
+
+def import_products(stream, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import products from ``stream``, yielding an ``ImportResult`` after each chunk.
+
+    The same ``ImportResult`` instance is yielded every time, so callers can
+    report progress as it goes and read the final totals after the last yield.
+    """
+    result = ImportResult()
+    chunk = []
+    for line, record in _iter_records(stream, fmt):
+        result.rows += 1
+        if isinstance(record, Exception):
+            result.add_error(line, str(record))
+            continue
+        try:
+            chunk.append((line, _clean_row(record)))
+        except ValueError as e:
+            result.add_error(line, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            _flush_chunk(chunk, result)
+            chunk = []
+            yield result
+    _flush_chunk(chunk, result)
+    yield result
@@ -0,0 +1,288 @@
+# app/jobs.py
+"""In-process background jobs for slow admin work.
+
+Jobs are rows in the ``job`` table and run on a thread pool owned by the app,
+so no external broker is needed. A route enqueues a job with ``enqueue()`` and
+gets the job id back; the admin jobs page polls the row for status and
+progress and downloads ``result_path`` once the job is done.
+
+Job functions are registered with ``@job_type('name')`` and are called inside
+an app context as ``fn(ctx, **params)``; ``ctx`` reports progress and hands
+out a path for the result file.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+
+from . import db
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPES = {}
+
+
+def job_type(name):
+    """Register a function as the handler for jobs of kind ``name``."""
+    def decorator(fn):
+        JOB_TYPES[name] = fn
+        return fn
+    return decorator
+
+
+class JobContext:
+    """Handed to job functions to report progress and place result files."""
+
+    def __init__(self, runner, job):
+        self._runner = runner
+        self.job = job
+
+    def set_progress(self, progress, message=None, persist=False):
+        """Record progress (0-100).
+
+        Progress is always visible to this process; pass ``persist=True`` to
+        also write it to the job row. Only persist between transactions, not
+        while a streaming query is still open.
+        """
+        progress = max(0, min(100, int(progress)))
+        self._runner.live_progress[self.job.id] = (progress, message)
+        if persist:
+            self.job.progress = progress
+            if message is not None:
+                self.job.message = message[:500]
+            db.session.commit()
+
+    def result_file(self, filename):
+        """Return the path the job should write its result to."""
+        self.job.result_name = filename
+        self.job.result_path = os.path.join(self._runner.result_dir, f'{self.job.id}-{filename}')
+        return self.job.result_path
+
+
+class JobRunner:
+
+    def __init__(self, app=None):
+        self.executor = None
+        self.result_dir = None
+        self.live_progress = {}
+        self._resumed = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.result_dir = app.config.get('JOB_RESULT_DIR') or os.path.join(app.config['DATA_DIR'], 'job_results')
+        try:
+            os.makedirs(self.result_dir, exist_ok=True)
+        except Exception:
+            pass
+        # Worker threads are only spawned on first submit, so CLI scripts that
+        # build the app never start any.
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('JOB_WORKERS', 2),
+            thread_name_prefix='storeapp-job'
+        )
+        app.extensions['jobs'] = self
+        with app.app_context():
+            self.fail_orphaned()
+
+    def enqueue(self, kind, user_id=None, **params):
+        if kind not in JOB_TYPES:
+            raise ValueError(f'Unknown job type: {kind}')
+        self.resume_pending()
+        job = Job(kind=kind, params=json.dumps(params), created_by=user_id)
+        db.session.add(job)
+        db.session.commit()
+        self.executor.submit(self._run, job.id)
+        return job
+
+    def resume_pending(self):
+        """Submit jobs left queued by a previous process (once per process)."""
+        with self._lock:
+            if self._resumed:
+                return
+            self._resumed = True
+        for (job_id,) in db.session.query(Job.id).filter(Job.status == 'queued').all():
+            self.executor.submit(self._run, job_id)
+
+    def fail_orphaned(self):
+        """Mark jobs left ``running`` by a process that has since died as failed.
+
+        Each claim records the claiming process (``host:pid``), so a worker
+        starting up next to others only fails jobs whose process is gone on
+        this host, never one another worker is still running.
+        """
+        host = socket.gethostname()
+        orphaned = []
+        for job_id, worker in db.session.query(Job.id, Job.worker).filter(Job.status == 'running'):
+            owner_host, _, pid = (worker or '').rpartition(':')
+            if worker is None or (owner_host == host and pid.isdigit() and not _process_alive(int(pid))):
+                orphaned.append(job_id)
+        if orphaned:
+            Job.query.filter(Job.id.in_(orphaned), Job.status == 'running').update({
+                'status': 'failed',
+                'finished_at': datetime.utcnow(),
+                'message': 'Interrupted: the process running this job stopped.',
+            }, synchronize_session=False)
+            logger.warning('Marked interrupted jobs as failed: %s', ', '.join(map(str, orphaned)))
+        db.session.commit()
+        return orphaned
+
+    def progress_for(self, job):
+        """Return ``(progress, message)`` preferring live in-process values."""
+        if job.status == 'running' and job.id in self.live_progress:
+            return self.live_progress[job.id]
+        return job.progress or 0, job.message
+
+    def _claim(self, job_id):
+        # Atomic claim so several worker processes never run the same job twice
+        claimed = Job.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'running', 'started_at': datetime.utcnow(), 'progress': 0, 'worker': _worker_id()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return claimed == 1
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            if not self._claim(job_id):
+                return
+            job = Job.query.get(job_id)
+            fn = JOB_TYPES.get(job.kind)
+            try:
+                if fn is None:
+                    raise ValueError(f'Unknown job type: {job.kind}')
+                params = json.loads(job.params or '{}')
+                message = fn(JobContext(self, job), **params)
+                job = Job.query.get(job_id)
+                job.status = 'done'
+                job.progress = 100
+                job.message = (message or 'Finished')[:500]
+            except Exception as e:
+                logger.exception('Job %s (%s) failed', job_id, job.kind)
+                db.session.rollback()
+                job = Job.query.get(job_id)
+                job.status = 'failed'
+                job.message = str(e)[:500]
+            finally:
+                self.live_progress.pop(job_id, None)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        # This process has only just started, so the job was another's
+        return False
+    if os.name == 'nt':
+        import ctypes
+        # PROCESS_QUERY_LIMITED_INFORMATION; os.kill(pid, 0) would terminate it on Windows
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def get_runner():
+    return current_app.extensions['jobs']
+
+
+def enqueue(kind, user_id=None, **params):
+    return get_runner().enqueue(kind, user_id=user_id, **params)
+
+
+@job_type('export')
+def export_job(ctx, export, start=None, end=None, gzip=False, archived=False):
+    from . import exports
+
+    start_date, end_date = exports.parse_date_range({'start': start, 'end': end})
+    options = {'archived': True} if archived else {}
+    filename, header, rows = exports.EXPORTS[export](start_date, end_date, **options)
+
+    total = rows.count()
+    ctx.set_progress(0, f'Writing {total} rows', persist=True)
+
+    def counted(rows):
+        # Progress is kept in memory only; the export query is still open
+        for count, row in enumerate(rows, start=1):
+            if count % exports.EXPORT_BATCH_SIZE == 0:
+                ctx.set_progress(count * 100 // (total or 1), f'Wrote {count} of {total} rows')
+            yield row
+
+    chunks = exports.stream_csv(header, counted(rows))
+    path = ctx.result_file(filename + '.gz' if gzip else filename)
+    if gzip:
+        with open(path, 'wb') as f:
+            for chunk in exports.gzip_stream(chunks):
+                f.write(chunk)
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+    return f'Exported {ctx.job.result_name}'
+
+
+@job_type('import_products')
+def import_products_job(ctx, path, fmt='csv', chunk_size=1000):
+    from . import importer
+
+    result = None
+    try:
+        with open(path, 'rb') as f:
+            total = os.fstat(f.fileno()).st_size or 1
+            for result in importer.import_products(f, fmt, chunk_size):
+                ctx.set_progress(
+                    f.tell() * 100 // total,
+                    f'Processed {result.rows} rows, {result.failed} failed',
+                    persist=True
+                )
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    report_path = ctx.result_file('import_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(result.as_dict(), f, indent=2)
+    return f'Imported {result.rows - result.failed} of {result.rows} rows ({result.failed} failed)'
+
+
+@job_type('rebuild_rollups')
+def rebuild_rollups_job(ctx):
+    from . import rollups
+
+    ctx.set_progress(0, 'Recomputing sales rollups', persist=True)
+    counts = rollups.rebuild()
+    return 'Rebuilt rollups: {days} days, {items} items, {customers} customers'.format(**counts)
+
+
+@job_type('backup_database')
+def backup_database_job(ctx):
+    from . import backup
+
+    def progress(copied, total):
+        ctx.set_progress(copied * 100 // (total or 1), f'Copied {copied} of {total} pages')
+
+    result = backup.create_backup(keep=current_app.config.get('BACKUP_KEEP', backup.DEFAULT_KEEP),
+                                  progress=progress)
+    return f'Saved {os.path.basename(result.path)} ({result.size // 1024} KB, {result.seconds:.1f}s)'
@@ -0,0 +1,191 @@
+# app/ledger.py
+"""Append-only stock ledger with compacted snapshots.
+
+Every change to ``Item.stock`` also writes a ``StockMovement`` row (item,
+signed change, reason, and the order or user behind it) in the same
+transaction:
+
+* checkout writes one ``order`` movement per line;
+* the admin item pages write ``create``, ``edit`` and ``delete`` movements;
+* bulk restocks write ``restock`` movements with one ``INSERT ... SELECT``
+  over the items their ``UPDATE`` will change;
+* imports compare stock before and after each chunk and write ``import``
+  movements for what changed;
+* ``reconcile(fix=True)`` writes ``reconcile`` movements to correct drift.
+
+Rows are never updated or deleted. Items that had stock before the ledger
+existed get an ``opening`` movement when the schema is upgraded.
+
+``take_snapshot()`` (scripts/stock_ledger.py snapshot, run it nightly)
+stores every item's balance up to the newest movement. Stock at a point in
+time is then the newest snapshot taken before it plus the movements since
+that snapshot, a bounded tail read by primary-key range. Movements over a
+date range read the ``at`` index.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import func, literal, select
+
+from . import db
+from .models import Item, StockMovement, StockSnapshot, StockSnapshotLine
+
+REASONS = ('opening', 'order', 'create', 'edit', 'restock', 'import', 'delete', 'reconcile')
+
+Drift = namedtuple('Drift', ['item_id', 'name', 'ledger', 'stock'])
+
+
+def record(movements):
+    """Insert movements (dicts with item_id, change, reason and optionally
+    order_id/user_id); zero changes are skipped. The caller commits."""
+    now = datetime.utcnow()
+    rows = [
+        {'item_id': m['item_id'], 'change': m['change'], 'reason': m['reason'], 'at': now,
+         'order_id': m.get('order_id'), 'user_id': m.get('user_id')}
+        for m in movements if m['change']
+    ]
+    if rows:
+        db.session.execute(StockMovement.__table__.insert(), rows)
+    return len(rows)
+
+
+def record_change(item_id, change, reason, order_id=None, user_id=None):
+    return record([{'item_id': item_id, 'change': change, 'reason': reason,
+                    'order_id': order_id, 'user_id': user_id}])
+
+
+def record_update(filters, new_stock, reason, user_id=None):
+    """Record the movements of ``UPDATE item SET stock = new_stock WHERE filters``.
+
+    Call it just before that statement, in the same transaction; it is one
+    ``INSERT ... SELECT`` over the matching items.
+    """
+    current = func.coalesce(Item.stock, 0)
+    query = select(
+        Item.id, new_stock - current, literal(reason), literal(datetime.utcnow()), literal(user_id)
+    ).where(*filters).where(new_stock != current)
+    db.session.execute(StockMovement.__table__.insert().from_select(
+        ['item_id', 'change', 'reason', 'at', 'user_id'], query))
+
+
+def stock_levels(*filters):
+    """``{item_id: stock}`` for the items matching ``filters``."""
+    return dict(db.session.query(Item.id, func.coalesce(Item.stock, 0)).filter(*filters))
+
+
+def record_levels(before, after, reason, user_id=None):
+    """Record the difference between two ``stock_levels`` results.
+
+    Items only in ``after`` are new; items only in ``before`` were deleted.
+    """
+    return record([
+        {'item_id': item_id, 'change': after.get(item_id, 0) - before.get(item_id, 0),
+         'reason': reason, 'user_id': user_id}
+        for item_id in set(before) | set(after)
+    ])
+
+
+def open_balances():
+    """Give items with stock but no movements an ``opening`` movement. The caller commits."""
+    has_movements = select(StockMovement.id).where(StockMovement.item_id == Item.id).exists()
+    query = select(Item.id, Item.stock, literal('opening'), literal(datetime.utcnow()))\
+        .where(func.coalesce(Item.stock, 0) != 0, ~has_movements)
+    count = db.session.execute(StockMovement.__table__.insert().from_select(
+        ['item_id', 'change', 'reason', 'at'], query)).rowcount
+    return count
+
+
+def latest_snapshot(when=None):
+    query = StockSnapshot.query
+    if when is not None:
+        query = query.filter(StockSnapshot.taken_at <= when)
+    return query.order_by(StockSnapshot.taken_at.desc(), StockSnapshot.id.desc()).first()
+
+
+def stock_at(when=None, item_ids=None):
+    """``{item_id: stock}`` according to the ledger at ``when`` (default now).
+
+    Reads the newest snapshot taken by then and the movements after it.
+    Items with no stock may be left out.
+    """
+    snapshot = latest_snapshot(when)
+    levels = {}
+    if snapshot is not None:
+        query = db.session.query(StockSnapshotLine.item_id, StockSnapshotLine.stock)\
+            .filter(StockSnapshotLine.snapshot_id == snapshot.id)
+        if item_ids is not None:
+            query = query.filter(StockSnapshotLine.item_id.in_(item_ids))
+        levels = dict(query)
+    tail = db.session.query(StockMovement.item_id, func.sum(StockMovement.change))
+    if snapshot is not None:
+        tail = tail.filter(StockMovement.id > snapshot.last_movement_id)
+    if when is not None:
+        tail = tail.filter(StockMovement.at <= when)
+    if item_ids is not None:
+        tail = tail.filter(StockMovement.item_id.in_(item_ids))
+    for item_id, change in tail.group_by(StockMovement.item_id):
+        levels[item_id] = levels.get(item_id, 0) + change
+    return levels
+
+
+def moved(start, end, item_ids=None):
+    """``{item_id: {reason: change}}`` summed over ``start <= at < end``."""
+    query = db.session.query(StockMovement.item_id, StockMovement.reason, func.sum(StockMovement.change))\
+        .filter(StockMovement.at >= start, StockMovement.at < end)
+    if item_ids is not None:
+        query = query.filter(StockMovement.item_id.in_(item_ids))
+    totals = {}
+    for item_id, reason, change in query.group_by(StockMovement.item_id, StockMovement.reason):
+        totals.setdefault(item_id, {})[reason] = change
+    return totals
+
+
+def take_snapshot():
+    """Store every item's ledger balance as of the newest movement."""
+    last_movement_id = db.session.query(func.max(StockMovement.id)).scalar() or 0
+    previous = latest_snapshot()
+    if previous is not None and previous.last_movement_id == last_movement_id:
+        return previous
+    levels = {}
+    if previous is not None:
+        levels = dict(db.session.query(StockSnapshotLine.item_id, StockSnapshotLine.stock)
+                      .filter(StockSnapshotLine.snapshot_id == previous.id))
+    tail = db.session.query(StockMovement.item_id, func.sum(StockMovement.change))\
+        .filter(StockMovement.id > (previous.last_movement_id if previous is not None else 0),
+                StockMovement.id <= last_movement_id)\
+        .group_by(StockMovement.item_id)
+    for item_id, change in tail:
+        levels[item_id] = levels.get(item_id, 0) + change
+    levels = {item_id: stock for item_id, stock in levels.items() if stock}
+    snapshot = StockSnapshot(last_movement_id=last_movement_id, item_count=len(levels),
+                             total_units=sum(levels.values()))
+    db.session.add(snapshot)
+    db.session.flush()
+    if levels:
+        db.session.execute(StockSnapshotLine.__table__.insert(), [
+            {'snapshot_id': snapshot.id, 'item_id': item_id, 'stock': stock}
+            for item_id, stock in levels.items()
+        ])
+    db.session.commit()
+    return snapshot
+
+
+def reconcile(fix=False):
+    """Compare ledger balances with ``Item.stock``; returns a list of ``Drift``.
+
+    Deleted items whose ledger balance isn't zero are reported with
+    ``stock=0``. With ``fix``, a ``reconcile`` movement brings each ledger
+    balance in line with the stock column.
+    """
+    ledger = stock_at()
+    items = db.session.query(Item.id, Item.name, func.coalesce(Item.stock, 0)).all()
+    drift = []
+    for item_id, name, stock in items:
+        balance = ledger.pop(item_id, 0)
+        if balance != stock:
+            drift.append(Drift(item_id, name, balance, stock))
+    drift.extend(Drift(item_id, None, balance, 0) for item_id, balance in ledger.items() if balance)
+    if fix and drift:
+        record([{'item_id': d.item_id, 'change': d.stock - d.ledger, 'reason': 'reconcile'} for d in drift])
+        db.session.commit()
+    return drift
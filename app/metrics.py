@@ -0,0 +1,260 @@
+# app/metrics.py
+"""Per-endpoint request metrics.
+
+Records, for every request, wall time, the number of SQL statements and the
+time spent in them (via SQLAlchemy cursor events) and the response size.
+Values go into small in-memory log-linear histograms (HdrHistogram style), so
+percentiles cost a fixed amount of memory no matter how many requests are
+seen. Metrics are per process; with several gunicorn workers each keeps its
+own.
+"""
+import hmac
+import threading
+import time
+
+from flask import g, has_app_context, request, Response, abort
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers.
+
+    Values below ``SUB_BUCKETS`` are exact; above that each power of two is
+    split into ``SUB_BUCKETS`` buckets, which keeps the relative error of any
+    percentile within about 3%.
+    """
+
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def _index(cls, value):
+        if value < cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        top = value >> shift
+        return (shift + 1) * cls.SUB_BUCKETS + (top - cls.SUB_BUCKETS)
+
+    @classmethod
+    def _bucket_value(cls, index):
+        """Midpoint of the values that map to ``index``."""
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        top = index % cls.SUB_BUCKETS + cls.SUB_BUCKETS
+        low = top << shift
+        return low + ((1 << shift) - 1) // 2
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        target = max(1, int(round(q / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= self.count:
+                return self.max
+            if seen >= target:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+class EndpointMetrics:
+
+    def __init__(self):
+        self.wall_us = Histogram()
+        self.sql_count = Histogram()
+        self.sql_us = Histogram()
+        self.response_bytes = Histogram()
+        self.status = {}
+
+
+class MetricsRegistry:
+
+    QUANTILES = (50, 90, 99)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.started = time.time()
+        self.collectors = []
+
+    def add_collector(self, collector):
+        """Add a callable returning extra exposition lines for ``/metrics``."""
+        self.collectors.append(collector)
+
+    def record(self, endpoint, wall_us, sql_count, sql_us, response_bytes, status_code):
+        with self._lock:
+            metrics = self.endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self.endpoints[endpoint] = EndpointMetrics()
+            metrics.wall_us.record(wall_us)
+            metrics.sql_count.record(sql_count)
+            metrics.sql_us.record(sql_us)
+            if response_bytes is not None:
+                metrics.response_bytes.record(response_bytes)
+            status_class = f'{status_code // 100}xx'
+            metrics.status[status_class] = metrics.status.get(status_class, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        """Return one summary dict per endpoint, slowest (by total time) first."""
+        rows = []
+        with self._lock:
+            for endpoint, m in self.endpoints.items():
+                rows.append({
+                    'endpoint': endpoint,
+                    'count': m.wall_us.count,
+                    'total_ms': m.wall_us.total / 1000.0,
+                    'wall_ms': {q: m.wall_us.percentile(q) / 1000.0 for q in self.QUANTILES},
+                    'max_ms': (m.wall_us.max or 0) / 1000.0,
+                    'sql_count_mean': m.sql_count.mean,
+                    'sql_count_max': m.sql_count.max or 0,
+                    'sql_ms': {q: m.sql_us.percentile(q) / 1000.0 for q in self.QUANTILES},
+                    'bytes_mean': m.response_bytes.mean,
+                    'status': dict(m.status),
+                })
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows
+
+    def prometheus(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        series = [
+            ('storeapp_request_duration_seconds', 'Request wall time', 'wall_us', 1e-6),
+            ('storeapp_request_sql_queries', 'SQL statements per request', 'sql_count', 1),
+            ('storeapp_request_sql_seconds', 'Time spent in SQL per request', 'sql_us', 1e-6),
+            ('storeapp_response_size_bytes', 'Response body size', 'response_bytes', 1),
+        ]
+        lines = []
+        with self._lock:
+            for name, help_text, attr, scale in series:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} summary')
+                for endpoint, m in sorted(self.endpoints.items()):
+                    hist = getattr(m, attr)
+                    label = _label(endpoint)
+                    for q in self.QUANTILES:
+                        lines.append(f'{name}{{endpoint="{label}",quantile="{q / 100.0}"}} {hist.percentile(q) * scale:g}')
+                    lines.append(f'{name}_sum{{endpoint="{label}"}} {hist.total * scale:g}')
+                    lines.append(f'{name}_count{{endpoint="{label}"}} {hist.count}')
+            lines.append('# HELP storeapp_responses_total Responses by status class')
+            lines.append('# TYPE storeapp_responses_total counter')
+            for endpoint, m in sorted(self.endpoints.items()):
+                for status_class, count in sorted(m.status.items()):
+                    lines.append(f'storeapp_responses_total{{endpoint="{_label(endpoint)}",status="{status_class}"}} {count}')
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _RequestMetrics:
+    __slots__ = ('start', 'sql_count', 'sql_seconds')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+
+def current_request_metrics():
+    """Return the in-flight request's counters, or None outside a request."""
+    if not has_app_context():
+        return None
+    return g.get('_request_metrics')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    metrics = current_request_metrics()
+    if metrics is not None:
+        metrics.sql_count += 1
+        metrics.sql_seconds += elapsed
+
+
+def get_registry():
+    from flask import current_app
+    return current_app.extensions['metrics']
+
+
+def init_app(app):
+    """Register the request hooks, SQL listeners and the ``/metrics`` endpoint.
+
+    Call this early in ``create_app`` so the timer starts before the other
+    ``before_request`` hooks run.
+    """
+    registry = MetricsRegistry()
+    app.extensions['metrics'] = registry
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_metrics():
+        g._request_metrics = _RequestMetrics()
+
+    @app.after_request
+    def record_request_metrics(response):
+        metrics = g.pop('_request_metrics', None)
+        if metrics is None:
+            return response
+        wall = time.perf_counter() - metrics.start
+        # Streamed responses have no length up front; leave them out of the size histogram
+        size = None if response.is_streamed else response.calculate_content_length()
+        registry.record(
+            request.endpoint or '<unmatched>',
+            wall * 1e6,
+            metrics.sql_count,
+            metrics.sql_seconds * 1e6,
+            size,
+            response.status_code
+        )
+        return response
+
+    def prometheus_metrics():
+        token = app.config.get('METRICS_TOKEN')
+        supplied = request.headers.get('Authorization', '')
+        if token and hmac.compare_digest(supplied, f'Bearer {token}'):
+            pass
+        elif not (current_user.is_authenticated and current_user.is_admin):
+            abort(403)
+        return Response(registry.prometheus(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'prometheus_metrics', prometheus_metrics)
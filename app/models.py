@@ -12,6 +12,19 @@ class User(db.Model, UserMixin):
     cart = db.relationship('Cart', backref='user', lazy=True, uselist=False)
     orders = db.relationship('Order', backref='user', lazy=True)
 
+    @property
+    def cart_summary(self):
+        """(cart_id, line_count, total_quantity); filled in by the user loader in app/users.py."""
+        summary = self.__dict__.get('_cart_summary')
+        if summary is None:
+            from .users import fetch_cart_summary
+            summary = self._cart_summary = fetch_cart_summary(self.id)
+        return summary
+
+    @cart_summary.setter
+    def cart_summary(self, value):
+        self._cart_summary = value
+
 class Item(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
@@ -20,9 +33,16 @@ class Item(db.Model):
     stock = db.Column(db.Integer, default=0)
     max_per_customer = db.Column(db.Integer, nullable=True, 
                                doc='Maximum quantity allowed per customer. None means no limit.')
+    low_stock_threshold = db.Column(db.Integer, nullable=True,
+                                    doc='Alert when stock falls to this. None means LOW_STOCK_THRESHOLD.')
     barcode = db.Column(db.String(100), unique=True, index=True)
+    # ``barcode`` as a GTIN-14 number for EAN/UPC codes, else NULL; set
+    # through app/barcodes.py, which all barcode lookups go through
+    gtin = db.Column(db.BigInteger, unique=True, index=True)
     image_url = db.Column(db.String(500))
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every write to the item; NULL for rows older than the column
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class Cart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -54,15 +74,121 @@ class Order(db.Model):
     shipping_state = db.Column(db.String(100), nullable=True)
     shipping_zip_code = db.Column(db.String(20), nullable=True)
     shipping_country = db.Column(db.String(100), nullable=True)
+    # A customer's order history, newest first (keyset pages in app/archive.py)
+    __table_args__ = (db.Index('ix_order_user_date', 'user_id', date_ordered.desc(), id.desc()),)
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), index=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    # The item as it was at checkout, so order pages and exports never need
+    # Item (which may since have changed or been deleted)
+    item_name = db.Column(db.String(150))
+    item_barcode = db.Column(db.String(100))
+    item_image_url = db.Column(db.String(500))
+    item = db.relationship('Item')
+
+# Old Delivered/Cancelled orders are moved here by app/archive.py. The
+# columns mirror Order/OrderItem (ids are kept) so the same templates render
+# either; archived orders are read-only.
+Order.is_archived = False
+
+class ArchivedOrder(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    items = db.relationship('ArchivedOrderItem', backref='order', lazy=True)
+    total = db.Column(db.Float, nullable=False)
+    date_ordered = db.Column(db.DateTime, nullable=False, index=True)
+    status = db.Column(db.String(50))
+    shipping_first_name = db.Column(db.String(100), nullable=True)
+    shipping_last_name = db.Column(db.String(100), nullable=True)
+    shipping_address1 = db.Column(db.String(200), nullable=True)
+    shipping_address2 = db.Column(db.String(200), nullable=True)
+    shipping_city = db.Column(db.String(100), nullable=True)
+    shipping_state = db.Column(db.String(100), nullable=True)
+    shipping_zip_code = db.Column(db.String(20), nullable=True)
+    shipping_country = db.Column(db.String(100), nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    user = db.relationship('User')
+    is_archived = True
+    __table_args__ = (db.Index('ix_archived_order_user_date', 'user_id', date_ordered.desc(), id.desc()),)
+
+class ArchivedOrderItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('archived_order.id'), index=True)
     item_id = db.Column(db.Integer, db.ForeignKey('item.id'))
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
+    item_name = db.Column(db.String(150))
+    item_barcode = db.Column(db.String(100))
+    item_image_url = db.Column(db.String(500))
     item = db.relationship('Item')
 
+class DailySales(db.Model):
+    """Per-day totals of orders that aren't cancelled; maintained by app/rollups.py."""
+    day = db.Column(db.Date, primary_key=True)
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    units = db.Column(db.Integer, default=0, nullable=False)
+
+class ItemSales(db.Model):
+    """Lifetime units and revenue per item, excluding cancelled orders."""
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), primary_key=True)
+    units = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    item = db.relationship('Item')
+
+class CustomerSales(db.Model):
+    """Lifetime order count and spend per customer, excluding cancelled orders.
+
+    ``first_order``/``last_order`` cover every order placed, cancelled or not.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    total_spent = db.Column(db.Float, default=0.0, nullable=False)
+    first_order = db.Column(db.DateTime)
+    last_order = db.Column(db.DateTime)
+    user = db.relationship('User')
+
+class StockMovement(db.Model):
+    """One change to ``Item.stock``; append-only, written by app/ledger.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
+    at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    change = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)  # opening, order, create, edit, restock, import, delete, reconcile
+    order_id = db.Column(db.Integer)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    __table_args__ = (db.Index('ix_stock_movement_item', 'item_id', 'id'),)
+
+class StockSnapshot(db.Model):
+    """Every item's stock as of ``last_movement_id``; the ledger up to there, compacted."""
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    last_movement_id = db.Column(db.Integer, nullable=False)
+    item_count = db.Column(db.Integer, default=0, nullable=False)
+    total_units = db.Column(db.Integer, default=0, nullable=False)
+
+class StockSnapshotLine(db.Model):
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('stock_snapshot.id'), primary_key=True)
+    item_id = db.Column(db.Integer, primary_key=True)
+    stock = db.Column(db.Integer, nullable=False)
+
+class StockAlert(db.Model):
+    """An item at or below its low-stock threshold; open until restocked (app/stock_alerts.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
+    level = db.Column(db.String(10), nullable=False)  # low, out
+    stock = db.Column(db.Integer, nullable=False)
+    threshold = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    resolved_at = db.Column(db.DateTime)
+    item = db.relationship('Item')
+    __table_args__ = (db.Index('ix_stock_alert_open', 'resolved_at', 'item_id'),)
+
 class StoreSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     currency = db.Column(db.String(10), default='¥')
@@ -87,4 +213,36 @@ class StoreSettings(db.Model):
         if self.currency_position == 'left':
             return f"{self.currency}{amount:,.0f}"
         else:
-            return f"{amount:,.0f}{self.currency}"
\ No newline at end of file
+            return f"{amount:,.0f}{self.currency}"
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text)  # JSON-encoded keyword arguments
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued, running, done, failed
+    progress = db.Column(db.Integer, default=0)  # 0-100
+    message = db.Column(db.String(500))
+    result_path = db.Column(db.String(500))
+    result_name = db.Column(db.String(200))
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    worker = db.Column(db.String(300))  # host:pid of the process running it
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress or 0,
+            'message': self.message or '',
+            'has_result': bool(self.result_path),
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S') if self.started_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None,
+        }
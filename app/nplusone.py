@@ -0,0 +1,125 @@
+# app/nplusone.py
+"""N+1 lazy-load detection for tests and staging.
+
+Enable with ``STOREAPP_NPLUSONE=log`` (or ``raise``), or set
+``app.config['NPLUSONE_MODE']``, which is checked on every request. While a
+request is handled, every lazy relationship load that reaches the database is
+recorded against ``Model.relationship``. When the same relationship is lazy-loaded for
+``NPLUSONE_THRESHOLD`` or more sibling objects in one request, that is an N+1:
+
+* ``log``   - a report is logged at the end of the request, naming the
+  template line (or Python line) that triggered the first load;
+* ``raise`` - ``NPlusOneError`` is raised at the offending load, which fails
+  the request under the test client.
+
+Loads served from the identity map emit no SQL and are not counted.
+"""
+import os
+import sys
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+MODES = ('off', 'log', 'raise')
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+class LazyLoadTracker:
+    """Lazy loads seen during one request, grouped by relationship."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.loads = {}  # 'Order.user' -> {'count', 'parents', 'location'}
+
+    def record(self, relationship, parent_key, location):
+        entry = self.loads.get(relationship)
+        if entry is None:
+            entry = self.loads[relationship] = {'count': 0, 'parents': set(), 'location': location}
+        entry['count'] += 1
+        entry['parents'].add(parent_key)
+        return len(entry['parents'])
+
+    def offenders(self):
+        return {
+            relationship: entry for relationship, entry in self.loads.items()
+            if len(entry['parents']) >= self.threshold
+        }
+
+    def report(self):
+        lines = []
+        for relationship, entry in sorted(self.offenders().items()):
+            lines.append(
+                f"  {relationship}: lazy-loaded {entry['count']} times for "
+                f"{len(entry['parents'])} objects, first at {entry['location']}"
+            )
+        return '\n'.join(lines)
+
+
+def _load_location():
+    """Return 'template.html:line' for the innermost Jinja frame, else the app frame."""
+    frame = sys._getframe(2)
+    app_frame = None
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            lineno = template.get_corresponding_lineno(frame.f_lineno)
+            return f'{template.name or template.filename}:{lineno}'
+        filename = frame.f_code.co_filename
+        if app_frame is None and filename.startswith(_APP_DIR) and filename != __file__:
+            app_frame = f'{filename}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return app_frame or 'unknown location'
+
+
+def _on_orm_execute(orm_execute_state):
+    if not orm_execute_state.is_relationship_load:
+        return
+    parent = orm_execute_state.lazy_loaded_from
+    if parent is None or not has_request_context():
+        # Eager loaders (selectin/subquery) have no single parent object
+        return
+    tracker = g.get('_lazy_load_tracker')
+    if tracker is None:
+        return
+
+    prop = orm_execute_state.loader_strategy_path[-1]
+    relationship = f'{parent.class_.__name__}.{prop.key}'
+    location = _load_location()
+    siblings = tracker.record(relationship, parent.key or id(parent), location)
+
+    if siblings >= tracker.threshold and current_app.config.get('NPLUSONE_MODE') == 'raise':
+        raise NPlusOneError(
+            f'N+1 lazy load of {relationship} for {siblings} objects in '
+            f'{request.endpoint}, at {location}'
+        )
+
+
+def init_app(app):
+    app.config.setdefault('NPLUSONE_MODE', os.environ.get('STOREAPP_NPLUSONE', 'off').lower())
+    app.config.setdefault('NPLUSONE_THRESHOLD', 2)
+    if app.config['NPLUSONE_MODE'] not in MODES:
+        raise ValueError(f"NPLUSONE_MODE must be one of {MODES}, got {app.config['NPLUSONE_MODE']!r}")
+
+    if not event.contains(Session, 'do_orm_execute', _on_orm_execute):
+        event.listen(Session, 'do_orm_execute', _on_orm_execute)
+
+    @app.before_request
+    def start_lazy_load_tracking():
+        if app.config['NPLUSONE_MODE'] != 'off':
+            g._lazy_load_tracker = LazyLoadTracker(app.config['NPLUSONE_THRESHOLD'])
+
+    @app.teardown_request
+    def report_lazy_loads(exc):
+        tracker = g.pop('_lazy_load_tracker', None)
+        if tracker is None:
+            return
+        report = tracker.report()
+        if report:
+            app.logger.warning('N+1 lazy loads in %s %s (%s):\n%s',
+                               request.method, request.path, request.endpoint, report)
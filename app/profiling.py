@@ -0,0 +1,251 @@
+# app/profiling.py
+"""On-demand cProfile of single requests, for admins.
+
+An admin adds ``?_profile=1`` to a URL (or sends an ``X-Profile: 1`` header)
+and that one request runs under cProfile. The result is kept in a bounded,
+per-process ring buffer (``PROFILE_HISTORY``, default 20) and can be browsed
+at /admin/profiles as a call tree, or downloaded as a ``.prof`` file for
+``pstats``/snakeviz or as folded stacks for flamegraph.pl/speedscope. The
+response carries an ``X-Profile-Id`` header pointing at the stored profile.
+
+Requests without the flag only pay for a dict lookup. The body of a streamed
+response is produced after the request returns and is not profiled.
+"""
+import cProfile
+import itertools
+import marshal
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import g, request
+from flask_login import current_user
+
+TRIGGER_PARAM = '_profile'
+TRIGGER_HEADER = 'X-Profile'
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RequestProfile:
+    """One profiled request and its raw cProfile stats."""
+
+    def __init__(self, id, method, path, endpoint, user, wall_ms, status_code, stats):
+        self.id = id
+        self.created_at = time.time()
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.user = user
+        self.wall_ms = wall_ms
+        self.status_code = status_code
+        # {(file, line, func): (primitive calls, calls, tottime, cumtime, callers)}
+        self.stats = stats
+
+    @property
+    def created(self):
+        return datetime.fromtimestamp(self.created_at)
+
+    @property
+    def function_count(self):
+        return len(self.stats)
+
+    def top_functions(self, limit=40, sort='cumtime'):
+        index = {'tottime': 2, 'cumtime': 3, 'calls': 1}[sort]
+        rows = sorted(self.stats.items(), key=lambda kv: kv[1][index], reverse=True)[:limit]
+        return [{
+            'function': _label(func),
+            'calls': nc,
+            'primitive_calls': cc,
+            'tottime_ms': tt * 1000,
+            'cumtime_ms': ct * 1000,
+        } for func, (cc, nc, tt, ct, callers) in rows]
+
+    def _callees(self):
+        callees = {}
+        for func, (cc, nc, tt, ct, callers) in self.stats.items():
+            for caller, edge in callers.items():
+                callees.setdefault(caller, {})[func] = edge
+        return callees
+
+    def _roots(self):
+        roots = [func for func, row in self.stats.items() if not row[4]]
+        return sorted(roots, key=lambda func: self.stats[func][3], reverse=True)
+
+    def call_tree(self, min_fraction=0.005, max_depth=60):
+        """Nested dicts of callees, with edge times scaled to fit their parent.
+
+        cProfile only records caller/callee pairs, so a function's time below
+        a particular call path is estimated from its per-caller totals.
+        """
+        callees = self._callees()
+        total = sum(self.stats[func][3] for func in self._roots()) or 1e-9
+        cutoff = total * min_fraction
+
+        def build(func, cumtime, calls, path):
+            node = {
+                'function': _label(func),
+                'calls': calls,
+                'cumtime_ms': cumtime * 1000,
+                'percent': 100.0 * cumtime / total,
+                'children': [],
+            }
+            if len(path) >= max_depth:
+                return node
+            edges = [(child, edge) for child, edge in callees.get(func, {}).items() if child not in path]
+            edge_total = sum(edge[3] for _, edge in edges)
+            scale = min(1.0, cumtime / edge_total) if edge_total else 1.0
+            for child, edge in sorted(edges, key=lambda e: e[1][3], reverse=True):
+                child_time = edge[3] * scale
+                if child_time < cutoff:
+                    continue
+                node['children'].append(build(child, child_time, edge[1], path | {child}))
+            return node
+
+        return [build(func, self.stats[func][3], self.stats[func][1], {func})
+                for func in self._roots() if self.stats[func][3] >= cutoff]
+
+    def folded_stacks(self, min_fraction=0.001, max_depth=60):
+        """Brendan Gregg's folded format, one ``a;b;c <microseconds>`` line per stack.
+
+        Subtrees below ``min_fraction`` of the total are folded into their
+        parent's own time; expanding every call path would be exponential.
+        """
+        callees = self._callees()
+        total = sum(self.stats[func][3] for func in self._roots())
+        cutoff = total * min_fraction
+        lines = {}
+
+        def walk(func, cumtime, stack, path):
+            edges = [(child, edge) for child, edge in callees.get(func, {}).items() if child not in path]
+            edge_total = sum(edge[3] for _, edge in edges)
+            scale = min(1.0, cumtime / edge_total) if edge_total else 1.0
+            if len(path) >= max_depth:
+                edges = []
+            edges = [(child, edge[3] * scale) for child, edge in edges if edge[3] * scale >= cutoff]
+            own = cumtime - sum(child_time for _, child_time in edges)
+            if own > 0:
+                key = ';'.join(stack)
+                lines[key] = lines.get(key, 0) + own
+            for child, child_time in edges:
+                walk(child, child_time, stack + [_short_label(child)], path | {child})
+
+        for func in self._roots():
+            walk(func, self.stats[func][3], [_short_label(func)], {func})
+        return '\n'.join(f'{stack} {int(seconds * 1e6)}'
+                         for stack, seconds in sorted(lines.items()) if int(seconds * 1e6)) + '\n'
+
+    def pstats_bytes(self):
+        """The stats in the format ``pstats.Stats(filename)`` loads."""
+        return marshal.dumps(self.stats)
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name  # built-in
+    return f'{name} ({_short_path(filename)}:{line})'
+
+
+def _short_label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def _short_path(filename):
+    if filename.startswith(_PROJECT_DIR + os.sep):
+        return filename[len(_PROJECT_DIR) + 1:]
+    for marker in (os.sep + 'site-packages' + os.sep, os.sep + 'lib' + os.sep + 'python'):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    return filename
+
+
+class ProfileStore:
+    """Ring buffer of the most recent request profiles."""
+
+    def __init__(self, maxlen):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.profiles = deque(maxlen=maxlen)
+
+    def add(self, **kwargs):
+        with self._lock:
+            profile = RequestProfile(next(self._ids), **kwargs)
+            self.profiles.appendleft(profile)
+        return profile
+
+    def get(self, profile_id):
+        with self._lock:
+            for profile in self.profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def all(self):
+        with self._lock:
+            return list(self.profiles)
+
+    def clear(self):
+        with self._lock:
+            self.profiles.clear()
+
+
+def get_store():
+    from flask import current_app
+    return current_app.extensions['profiles']
+
+
+def _requested():
+    return request.args.get(TRIGGER_PARAM) == '1' or request.headers.get(TRIGGER_HEADER) == '1'
+
+
+def _finish(store, status_code):
+    state = g.pop('_profiler', None)
+    if state is None:
+        return None
+    profiler, started = state
+    profiler.disable()
+    wall_ms = (time.perf_counter() - started) * 1000
+    profiler.create_stats()
+    return store.add(
+        method=request.method,
+        path=request.full_path.rstrip('?'),
+        endpoint=request.endpoint or '<unmatched>',
+        user=getattr(current_user, 'email', None),
+        wall_ms=wall_ms,
+        status_code=status_code,
+        stats=profiler.stats,
+    )
+
+
+def init_app(app):
+    store = ProfileStore(app.config.setdefault('PROFILE_HISTORY', 20))
+    app.extensions['profiles'] = store
+
+    @app.before_request
+    def start_profiling():
+        if not _requested():
+            return
+        if not (current_user.is_authenticated and current_user.is_admin):
+            return
+        profiler = cProfile.Profile()
+        g._profiler = (profiler, time.perf_counter())
+        profiler.enable()
+
+    @app.after_request
+    def stop_profiling(response):
+        profile = _finish(store, response.status_code)
+        if profile is not None:
+            response.headers['X-Profile-Id'] = str(profile.id)
+        return response
+
+    @app.teardown_request
+    def discard_profiler(exc):
+        # after_request is skipped when the view raised
+        if g.get('_profiler') is not None:
+            _finish(store, 500)
@@ -0,0 +1,207 @@
+# app/rollups.py
+"""Precomputed sales totals for the dashboard and customer export.
+
+``DailySales``, ``ItemSales`` and ``CustomerSales`` hold totals over orders
+that are not cancelled. They are updated in the same transaction as the
+change that affects them:
+
+* checkout adds the new order (``record_orders``);
+* a status change into or out of ``Cancelled`` subtracts or re-adds the
+  affected orders (``record_status_change``), for single orders and bulk
+  updates alike.
+
+Each update is a handful of grouped SELECTs over the affected orders plus an
+upsert per table, so its cost depends on the orders touched, not the size of
+the history. ``rebuild()`` (scripts/rebuild_rollups.py, or the button on the
+admin dashboard) recomputes everything from the raw tables, e.g. after an
+import or manual SQL. Archiving old orders (app/archive.py) moves rows but
+leaves the totals alone.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+from . import db
+from .models import ArchivedOrder, ArchivedOrderItem, CustomerSales, DailySales, Item, ItemSales, Order, OrderItem, User
+
+CANCELLED = 'Cancelled'
+
+
+def _day(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _when(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _upsert(model, key, rows, summed, extra=None):
+    if not rows:
+        return
+    table = model.__table__
+    stmt = insert(table)
+    values = {column: table.c[column] + stmt.excluded[column] for column in summed}
+    if extra:
+        values.update(extra(table, stmt.excluded))
+    db.session.execute(stmt.on_conflict_do_update(index_elements=[key], set_=values), rows)
+
+
+def _customer_dates(table, excluded):
+    # Keep the earliest and latest order seen, whichever side is NULL
+    return {
+        'first_order': func.min(func.coalesce(table.c.first_order, excluded.first_order), excluded.first_order),
+        'last_order': func.max(func.coalesce(table.c.last_order, excluded.last_order), excluded.last_order),
+    }
+
+
+def _apply(filters, sign, counted=True, orders=Order, lines=OrderItem):
+    """Add (``sign=1``) or subtract (``-1``) the orders matching ``filters``.
+
+    With ``counted=False`` only the customers' first/last order dates are
+    touched; ``rebuild`` uses that for cancelled orders. ``orders``/``lines``
+    select the archive tables instead of the hot ones.
+    """
+    day = func.date(orders.date_ordered)
+    if counted:
+        units_by_day = dict(
+            db.session.query(day, func.sum(lines.quantity))
+            .join(lines, lines.order_id == orders.id)
+            .filter(*filters)
+            .group_by(day)
+            .all()
+        )
+        _upsert(DailySales, 'day', [
+            {
+                'day': _day(order_day),
+                'order_count': sign * count,
+                'revenue': sign * (revenue or 0.0),
+                'units': sign * int(units_by_day.get(order_day) or 0),
+            }
+            for order_day, count, revenue in db.session.query(day, func.count(orders.id), func.sum(orders.total))
+            .filter(*filters)
+            .group_by(day)
+        ], ['order_count', 'revenue', 'units'])
+
+        _upsert(ItemSales, 'item_id', [
+            {
+                'item_id': item_id,
+                'units': sign * int(units or 0),
+                'revenue': sign * (revenue or 0.0),
+                'order_count': sign * order_count,
+            }
+            for item_id, units, revenue, order_count in db.session.query(
+                lines.item_id,
+                func.sum(lines.quantity),
+                func.sum(lines.quantity * lines.price),
+                func.count(func.distinct(orders.id))
+            ).join(orders, lines.order_id == orders.id)
+             .filter(*filters)
+             .group_by(lines.item_id)
+            if item_id is not None
+        ], ['units', 'revenue', 'order_count'])
+
+    _upsert(CustomerSales, 'user_id', [
+        {
+            'user_id': user_id,
+            'order_count': sign * count if counted else 0,
+            'total_spent': sign * (total or 0.0) if counted else 0.0,
+            'first_order': _when(first),
+            'last_order': _when(last),
+        }
+        for user_id, count, total, first, last in db.session.query(
+            orders.user_id,
+            func.count(orders.id),
+            func.sum(orders.total),
+            func.min(orders.date_ordered),
+            func.max(orders.date_ordered)
+        ).filter(*filters)
+         .group_by(orders.user_id)
+        if user_id is not None
+    ], ['order_count', 'total_spent'], extra=_customer_dates)
+
+
+def record_orders(filters):
+    """Add newly placed orders (e.g. ``[Order.id == order.id]`` at checkout).
+
+    Call after the order and its lines are flushed, before the commit.
+    """
+    _apply(list(filters) + [Order.status != CANCELLED], 1)
+
+
+def record_status_change(filters, new_status):
+    """Adjust the rollups for orders matching ``filters`` about to get ``new_status``.
+
+    Call before the status UPDATE, in the same transaction. Only moves into
+    or out of ``Cancelled`` change any totals.
+    """
+    if new_status == CANCELLED:
+        _apply(list(filters) + [Order.status != CANCELLED], -1)
+    else:
+        _apply(list(filters) + [Order.status == CANCELLED], 1)
+
+
+def rebuild(commit=True):
+    """Recompute every rollup table from the hot and archived orders.
+
+    Commits unless ``commit`` is false (the schema upgrade commits once at
+    the end).
+    """
+    DailySales.query.delete()
+    ItemSales.query.delete()
+    CustomerSales.query.delete()
+    for orders, lines in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+        _apply([orders.status != CANCELLED], 1, orders=orders, lines=lines)
+        _apply([orders.status == CANCELLED], 1, counted=False, orders=orders, lines=lines)
+    if commit:
+        db.session.commit()
+    return {
+        'days': DailySales.query.count(),
+        'items': ItemSales.query.count(),
+        'customers': CustomerSales.query.count(),
+    }
+
+
+def daily_sales(days=30):
+    """One row per day for the last ``days`` days (UTC), zero-filled."""
+    today = datetime.utcnow().date()
+    since = today - timedelta(days=days - 1)
+    stored = {row.day: row for row in DailySales.query.filter(DailySales.day >= since)}
+    result = []
+    for offset in range(days):
+        day = since + timedelta(days=offset)
+        row = stored.get(day)
+        result.append({
+            'day': day,
+            'order_count': row.order_count if row else 0,
+            'revenue': row.revenue if row else 0.0,
+            'units': row.units if row else 0,
+        })
+    return result
+
+
+def lifetime_totals():
+    order_count, revenue, units = db.session.query(
+        func.coalesce(func.sum(DailySales.order_count), 0),
+        func.coalesce(func.sum(DailySales.revenue), 0.0),
+        func.coalesce(func.sum(DailySales.units), 0)
+    ).one()
+    return {'order_count': order_count, 'revenue': revenue, 'units': units}
+
+
+def top_items(limit=5):
+    return db.session.query(Item.id, Item.name, ItemSales.units, ItemSales.revenue)\
+        .join(Item, Item.id == ItemSales.item_id)\
+        .filter(ItemSales.units > 0)\
+        .order_by(ItemSales.units.desc())\
+        .limit(limit)\
+        .all()
+
+
+def top_customers(limit=5):
+    return db.session.query(User.first_name, User.email, CustomerSales.order_count, CustomerSales.total_spent)\
+        .join(User, User.id == CustomerSales.user_id)\
+        .filter(CustomerSales.order_count > 0)\
+        .order_by(CustomerSales.total_spent.desc())\
+        .limit(limit)\
+        .all()
@@ -0,0 +1,66 @@
+# app/scanning.py
+"""Barcode image decoding (OpenCV + pyzbar).
+
+OpenCV and numpy take a large share of the app's import time, and only the
+two scan routes need them, so views import this module inside those routes
+rather than at the top of the file. Set ``SCAN_WARMUP`` (or
+``STOREAPP_SCAN_WARMUP=1``) to import it on a background thread at boot, so
+the first scan doesn't pay the import either.
+"""
+import cv2
+import numpy as np
+
+from .utils.zbar_loader import ensure_zbar_loaded
+
+
+class ScannerUnavailable(Exception):
+    pass
+
+
+def _decoder():
+    # Ensure ZBar DLL is available before importing pyzbar
+    if not ensure_zbar_loaded():
+        raise ScannerUnavailable('Barcode engine (ZBar) is not available.')
+    try:
+        from pyzbar.pyzbar import decode
+    except ImportError as e:
+        raise ScannerUnavailable(f'Barcode engine (ZBar) is not available: {e}')
+    return decode
+
+
+def read_image_file(path):
+    return cv2.imread(path)
+
+
+def decode_image_bytes(data):
+    """Decode an uploaded image; returns None if it isn't a readable image."""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def save_image(img, path):
+    cv2.imwrite(path, img)
+
+
+def find_barcodes(img, retry_binarized=False):
+    """Return the decoded barcode strings found in a BGR image."""
+    decode = _decoder()
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    barcodes = decode(gray)
+    if not barcodes and retry_binarized:
+        # Try with different binarization
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        barcodes = decode(binary)
+    return [barcode.data.decode('utf-8') for barcode in barcodes]
+
+
+def warm_up():
+    """Touch the OpenCV and ZBar code paths once so their lazy setup is done."""
+    img = np.full((8, 8, 3), 255, dtype=np.uint8)
+    ok, encoded = cv2.imencode('.png', img)
+    if ok:
+        decoded = decode_image_bytes(encoded.tobytes())
+        try:
+            find_barcodes(decoded)
+        except ScannerUnavailable:
+            pass
+
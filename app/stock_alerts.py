@@ -0,0 +1,165 @@
+# app/stock_alerts.py
+"""Low-stock alerts, opened and resolved where stock changes.
+
+Each item alerts when its stock falls to ``Item.low_stock_threshold`` (or
+``LOW_STOCK_THRESHOLD``, default 5, when the item has none). Nothing scans
+the catalogue for this. The code that changes stock compares the levels
+before and after and only touches ``StockAlert`` when an item crosses its
+threshold:
+
+* checkout and the admin item pages call ``note_changes`` with the items
+  they just changed, in the same transaction;
+* bulk restocks and imports call ``sync`` with the filter of their
+  set-based statement.
+
+An item has at most one open alert. It goes from ``low`` to ``out`` when
+stock reaches zero and is resolved once stock is back above the threshold.
+The dashboard lists open alerts (``ix_stock_alert_open``) with a sell-through
+estimate from the last ``SELL_THROUGH_DAYS`` days of order lines, for just
+those items.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, literal, select
+
+from . import db
+from .models import Item, Order, OrderItem, StockAlert
+
+DEFAULT_THRESHOLD = 5
+SELL_THROUGH_DAYS = 14
+
+
+def default_threshold():
+    return current_app.config.get('LOW_STOCK_THRESHOLD', DEFAULT_THRESHOLD)
+
+
+def threshold_for(item):
+    return item.low_stock_threshold if item.low_stock_threshold is not None else default_threshold()
+
+
+def level_for(stock, threshold):
+    """``'out'``, ``'low'`` or None for a stock level against ``threshold``."""
+    if stock is None:
+        return None
+    if stock <= 0:
+        return 'out'
+    return 'low' if stock <= threshold else None
+
+
+def note_changes(changes):
+    """Open, update or resolve alerts after stock or threshold changes.
+
+    ``changes`` holds ``(item, old_stock, old_threshold)`` tuples, with the
+    item already carrying its new values; ``old_stock`` is None for a new
+    item and ``old_threshold`` None when it didn't change. Only items whose
+    level changed cost a query. The caller commits.
+    """
+    crossings = {}
+    for item, old_stock, old_threshold in changes:
+        threshold = threshold_for(item)
+        before = level_for(old_stock, threshold if old_threshold is None else old_threshold)
+        after = level_for(item.stock or 0, threshold)
+        if before != after:
+            crossings[item.id] = (item, after, threshold)
+    if not crossings:
+        return 0
+    open_alerts = {alert.item_id: alert for alert in StockAlert.query.filter(
+        StockAlert.item_id.in_(crossings), StockAlert.resolved_at.is_(None))}
+    now = datetime.utcnow()
+    for item_id, (item, level, threshold) in crossings.items():
+        alert = open_alerts.get(item_id)
+        if alert is None:
+            if level is not None:
+                db.session.add(StockAlert(item_id=item_id, level=level, stock=item.stock or 0,
+                                          threshold=threshold, created_at=now))
+        elif level is None:
+            alert.resolved_at = now
+        else:
+            alert.level = level
+            alert.stock = item.stock or 0
+            alert.threshold = threshold
+    return len(crossings)
+
+
+def sync(filters, new_stock=None):
+    """Bring alerts for the items matching ``filters`` up to date, in SQL.
+
+    ``new_stock`` is the stock an ``UPDATE`` is about to set (call this just
+    before it, since its filter may stop matching afterwards); by default the
+    current stock is used. The caller commits.
+    """
+    if new_stock is None:
+        stock = func.coalesce(Item.stock, 0)
+    elif isinstance(new_stock, int):
+        stock = literal(new_stock)
+    else:
+        stock = new_stock
+    threshold = func.coalesce(Item.low_stock_threshold, default_threshold())
+    level = case((stock <= 0, 'out'), else_='low')
+    now = datetime.utcnow()
+    is_open = StockAlert.resolved_at.is_(None)
+
+    recovered = select(Item.id).where(*filters).where(stock > threshold)
+    StockAlert.query.filter(is_open, StockAlert.item_id.in_(recovered))\
+        .update({StockAlert.resolved_at: now}, synchronize_session=False)
+
+    same_item = Item.id == StockAlert.item_id
+    low = select(Item.id).where(*filters).where(stock <= threshold)
+    StockAlert.query.filter(is_open, StockAlert.item_id.in_(low)).update({
+        StockAlert.level: select(level).where(same_item).scalar_subquery(),
+        StockAlert.stock: select(stock).where(same_item).scalar_subquery(),
+        StockAlert.threshold: select(threshold).where(same_item).scalar_subquery(),
+    }, synchronize_session=False)
+
+    has_open = select(StockAlert.id).where(StockAlert.item_id == Item.id, is_open).exists()
+    query = select(Item.id, level, stock, threshold, literal(now))\
+        .where(*filters).where(stock <= threshold, ~has_open)
+    db.session.execute(StockAlert.__table__.insert().from_select(
+        ['item_id', 'level', 'stock', 'threshold', 'created_at'], query))
+
+
+def resolve_item(item_id):
+    """Close the open alert of an item that is being deleted."""
+    StockAlert.query.filter(StockAlert.item_id == item_id, StockAlert.resolved_at.is_(None))\
+        .update({StockAlert.resolved_at: datetime.utcnow()}, synchronize_session=False)
+
+
+def sell_through(item_ids, days=SELL_THROUGH_DAYS):
+    """Units per day sold of each item over the last ``days`` days (not cancelled)."""
+    if not item_ids:
+        return {}
+    since = datetime.utcnow() - timedelta(days=days)
+    units = db.session.query(OrderItem.item_id, func.sum(OrderItem.quantity))\
+        .join(Order, Order.id == OrderItem.order_id)\
+        .filter(OrderItem.item_id.in_(item_ids), Order.date_ordered >= since, Order.status != 'Cancelled')\
+        .group_by(OrderItem.item_id)
+    return {item_id: (total or 0) / float(days) for item_id, total in units}
+
+
+def open_alerts(limit=10):
+    """``(rows, open_count)`` for the dashboard, out-of-stock items first.
+
+    Each row has the alert, its item, ``per_day`` (recent units sold per day)
+    and ``days_left`` (stock divided by that; None when out of stock or
+    nothing sold).
+    """
+    open_count = db.session.query(func.count(StockAlert.id)).filter(StockAlert.resolved_at.is_(None)).scalar()
+    if not open_count:
+        return [], 0
+    alerts = db.session.query(StockAlert, Item).join(Item, Item.id == StockAlert.item_id)\
+        .filter(StockAlert.resolved_at.is_(None))\
+        .order_by(case((StockAlert.level == 'out', 0), else_=1), StockAlert.created_at.desc())\
+        .limit(limit).all()
+    rates = sell_through([item.id for _, item in alerts])
+    rows = []
+    for alert, item in alerts:
+        per_day = rates.get(item.id, 0.0)
+        stock = item.stock or 0
+        rows.append({
+            'alert': alert,
+            'item': item,
+            'per_day': per_day,
+            'days_left': stock / per_day if per_day and stock > 0 else None,
+        })
+    return rows, open_count
@@ -0,0 +1,73 @@
+# app/templating.py
+"""Persistent Jinja bytecode cache and template warm-up.
+
+The packaged (PyInstaller onefile) app unpacks to a new temporary directory
+on every launch, so without help every template is compiled again on its
+first use after each start. Compiled templates are therefore kept in
+``<DATA_DIR>/template_cache`` (``TEMPLATE_CACHE_DIR``), which survives
+restarts; set ``STOREAPP_TEMPLATE_CACHE=0`` to turn it off.
+
+Jinja's own cache key includes the template's file path, which changes with
+every onefile launch, so entries here are keyed on the template name alone.
+A cached entry is only used while the template's source is unchanged (Jinja
+stores a checksum with it) and was written by the same Jinja and Python
+versions, so an upgrade or an edited template simply compiles again.
+
+With ``STOREAPP_TEMPLATE_WARMUP=1`` (the default for packaged builds) a
+background thread loads every template right after startup, so the first
+visitor doesn't wait for compilation or cache reads either.
+scripts/bench_startup.py measures first-request latency with and without
+the cache.
+"""
+import os
+import sys
+import threading
+import time
+from hashlib import sha1
+
+from jinja2 import FileSystemBytecodeCache
+
+
+class NamedBytecodeCache(FileSystemBytecodeCache):
+    """``FileSystemBytecodeCache`` keyed on the template name only."""
+
+    def get_cache_key(self, name, filename=None):
+        return sha1(name.encode('utf-8')).hexdigest()
+
+
+def cache_dir(app):
+    return app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.config['DATA_DIR'], 'template_cache')
+
+
+def warm_up(app):
+    """Compile (or load from the cache) every template; returns ``(loaded, failed, seconds)``."""
+    started = time.perf_counter()
+    loaded = failed = 0
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        try:
+            app.jinja_env.get_template(name)
+            loaded += 1
+        except Exception:
+            failed += 1
+            app.logger.warning('Template warm-up: could not compile %s', name, exc_info=True)
+    elapsed = time.perf_counter() - started
+    app.logger.info('Template warm-up: %d templates in %.0f ms (%d failed)', loaded, elapsed * 1000, failed)
+    return loaded, failed, elapsed
+
+
+def init_app(app):
+    frozen = getattr(sys, 'frozen', False)
+    app.config.setdefault('TEMPLATE_CACHE', os.environ.get('STOREAPP_TEMPLATE_CACHE', '1') != '0')
+    app.config.setdefault('TEMPLATE_WARMUP', os.environ.get('STOREAPP_TEMPLATE_WARMUP', '1' if frozen else '0') == '1')
+
+    if app.config['TEMPLATE_CACHE']:
+        directory = cache_dir(app)
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            app.logger.warning('Template cache disabled: cannot create %s', directory)
+        else:
+            app.jinja_env.bytecode_cache = NamedBytecodeCache(directory)
+
+    if app.config['TEMPLATE_WARMUP']:
+        threading.Thread(target=warm_up, args=(app,), name='template-warmup', daemon=True).start()
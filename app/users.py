@@ -0,0 +1,124 @@
+# app/users.py
+"""User loading for Flask-Login, with the cart summary in the same query.
+
+``load_user`` fetches the user, their cart id and the cart's line count and
+total quantity (for the navbar badge) with one query. The result is kept in a
+small per-process cache for ``USER_CACHE_TTL`` seconds (default 10), so a burst
+of requests from one session doesn't repeat it. Routes that change a cart call
+``invalidate(user_id)`` afterwards. The cache lives in each worker process, so
+another worker can show a badge that is up to the TTL out of date.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import db
+from .models import Cart, CartItem, User
+
+CartSummary = namedtuple('CartSummary', ['cart_id', 'line_count', 'total_quantity'])
+EMPTY_CART = CartSummary(None, 0, 0)
+
+
+class UserCache:
+    """User column values and cart summaries by user id, with a TTL."""
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (expires, values, summary)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return entry[1], entry[2]
+
+    def put(self, user_id, values, summary):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = (time.monotonic() + self.ttl, values, summary)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _cache():
+    from flask import current_app
+    return current_app.extensions.get('user_cache')
+
+
+def _summary_query():
+    return db.session.query(
+        Cart.id,
+        func.count(CartItem.id),
+        func.coalesce(func.sum(CartItem.quantity), 0)
+    ).outerjoin(CartItem, CartItem.cart_id == Cart.id)
+
+
+def fetch_cart_summary(user_id):
+    """Cart id, line count and total quantity for one user (one query)."""
+    row = _summary_query().filter(Cart.user_id == user_id)\
+        .group_by(Cart.id).order_by(Cart.id).first()
+    if row is None:
+        return EMPTY_CART
+    return CartSummary(row[0], row[1], int(row[2]))
+
+
+def load_user(user_id):
+    cache = _cache()
+    cached = cache.get(user_id) if cache is not None else None
+    if cached is not None:
+        values, summary = cached
+        # Attach a copy to this request's session without querying
+        user = User(**values)
+        make_transient_to_detached(user)
+        user = db.session.merge(user, load=False)
+    else:
+        row = db.session.query(
+            User,
+            Cart.id,
+            func.count(CartItem.id),
+            func.coalesce(func.sum(CartItem.quantity), 0)
+        ).outerjoin(Cart, Cart.user_id == User.id)\
+         .outerjoin(CartItem, CartItem.cart_id == Cart.id)\
+         .filter(User.id == user_id)\
+         .group_by(User.id, Cart.id)\
+         .order_by(Cart.id)\
+         .first()
+        if row is None:
+            return None
+        user, cart_id, line_count, total_quantity = row
+        summary = CartSummary(cart_id, line_count, int(total_quantity)) if cart_id else EMPTY_CART
+        if cache is not None:
+            values = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+            cache.put(user_id, values, summary)
+    user.cart_summary = summary
+    return user
+
+
+def invalidate(user_id):
+    """Forget the cached user and cart summary after a cart write."""
+    cache = _cache()
+    if cache is not None:
+        cache.invalidate(user_id)
+
+
+def init_app(app):
+    app.config.setdefault('USER_CACHE_TTL', 10)
+    if app.config['USER_CACHE_TTL'] > 0:
+        app.extensions['user_cache'] = UserCache(app.config['USER_CACHE_TTL'])
@@ -1,13 +1,15 @@
 # app/views.py
 import os
 import time
-import cv2
-import numpy as np
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort
 from flask_login import login_required, current_user
 from .models import Item, Cart, CartItem, Order, OrderItem, StoreSettings, db
+from sqlalchemy import and_, func
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
 from .utils.zbar_loader import ensure_zbar_loaded
+from . import admission, archive, barcodes, conditional, events, guest_cart, ledger, rollups, stock_alerts, users
+from .conditional import conditional_page
 
 views = Blueprint('views', __name__)
 
@@ -19,7 +21,37 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def current_cart_id(create=False):
+    """The current user's cart id from the loader's cart summary, without loading the cart.
+
+    A summary without a cart is checked against the database, since it may be
+    a stale cached one. With ``create=True`` a missing cart is created and
+    flushed; the caller commits.
+    """
+    summary = current_user.cart_summary
+    if summary.cart_id is not None:
+        return summary.cart_id
+    # The summary may have been cached before another worker created the cart
+    cart = Cart.query.filter_by(user_id=current_user.id).order_by(Cart.id).first()
+    if cart is None:
+        if not create:
+            return None
+        cart = Cart(user_id=current_user.id)
+        db.session.add(cart)
+        db.session.flush()
+    else:
+        users.invalidate(current_user.id)
+    current_user.cart_summary = summary._replace(cart_id=cart.id)
+    return cart.id
+
+def cart_lines(cart_id):
+    """Cart lines with their items, in one query."""
+    if cart_id is None:
+        return []
+    return CartItem.query.options(joinedload(CartItem.item)).filter_by(cart_id=cart_id).all()
+
 @views.route('/')
+@conditional_page(conditional.catalog_version)
 def home():
     from .models import StoreSettings
     # Only show items that have stock available
@@ -29,6 +61,7 @@ def home():
 
 
 @views.route('/freestore/')
+@conditional_page(conditional.catalog_version)
 def fs_home():
     from .models import StoreSettings
     # Only show items that have stock available (free store view)
@@ -37,6 +70,7 @@ def fs_home():
     return render_template('fs/views/home.html', items=items, user=current_user, settings=settings)
 
 @views.route('/item/<int:item_id>')
+@conditional_page(conditional.item_version)
 def item_detail(item_id):
     from .models import StoreSettings
     item = Item.query.get_or_404(item_id)
@@ -44,7 +78,6 @@ def item_detail(item_id):
     return render_template('views/item_detail.html', item=item, user=current_user, settings=settings)
 
 @views.route('/add_to_cart/<int:item_id>', methods=['POST'])
-@login_required
 def add_to_cart(item_id):
     # CSRF token is automatically validated by Flask-WTF
     
@@ -72,23 +105,28 @@ def add_to_cart(item_id):
     except (ValueError, TypeError):
         return error_response('Invalid quantity', 'error')
     
-    if not current_user.cart:
-        cart = Cart(user_id=current_user.id)
-        db.session.add(cart)
-        db.session.commit()
-    
-    # Check if item already in cart
-    cart_item = CartItem.query.filter_by(
-        cart_id=current_user.cart.id,
-        item_id=item_id
-    ).first()
+    # Guests keep their cart in a signed cookie (see app/guest_cart.py)
+    guest = not current_user.is_authenticated
+    if guest:
+        cart_item = None
+        guest_lines = guest_cart.load()
+        in_cart = guest_lines.get(item_id, 0)
+    else:
+        cart_id = current_cart_id(create=True)
+        
+        # Check if item already in cart
+        cart_item = CartItem.query.filter_by(
+            cart_id=cart_id,
+            item_id=item_id
+        ).first()
+        in_cart = cart_item.quantity if cart_item else 0
     
     # Calculate total requested quantity
-    requested_quantity = (cart_item.quantity if cart_item else 0) + quantity
+    requested_quantity = in_cart + quantity
     
     # Apply maximum per customer limit if set
     if item.max_per_customer and requested_quantity > item.max_per_customer:
-        adjusted_quantity = item.max_per_customer - (cart_item.quantity if cart_item else 0)
+        adjusted_quantity = item.max_per_customer - in_cart
         if adjusted_quantity <= 0:
             return error_response(
                 f'You can only order a maximum of {item.max_per_customer} of this item.',
@@ -106,7 +144,7 @@ def add_to_cart(item_id):
         flash(f'Adjusted quantity to maximum allowed ({item.max_per_customer}).', 'info')
     
     # Check stock availability
-    available_quantity = item.stock - (cart_item.quantity if cart_item else 0)
+    available_quantity = item.stock - in_cart
     if quantity > available_quantity:
         if available_quantity <= 0:
             return error_response('Sorry, this item is out of stock.', 'error')
@@ -121,19 +159,27 @@ def add_to_cart(item_id):
             })
         flash(f'Adjusted quantity to available stock ({available_quantity}).', 'info')
     
-    if cart_item:
+    if guest:
+        guest_lines[item_id] = in_cart + quantity
+        try:
+            guest_cart.save(guest_lines)
+        except ValueError as e:
+            return error_response(str(e), 'warning')
+    elif cart_item:
         # Update existing cart item quantity
         cart_item.quantity += quantity
     else:
         # Create new cart item with specified quantity
         cart_item = CartItem(
-            cart_id=current_user.cart.id,
+            cart_id=cart_id,
             item_id=item_id,
             quantity=quantity
         )
         db.session.add(cart_item)
     
-    db.session.commit()
+    if not guest:
+        db.session.commit()
+        users.invalidate(current_user.id)
     
     if is_ajax:
         return jsonify({
@@ -147,11 +193,7 @@ def add_to_cart(item_id):
     return redirect(url_for('views.cart'))
 
 @views.route('/update_cart/<int:item_id>', methods=['POST'])
-@login_required
 def update_cart(item_id):
-    if not current_user.cart:
-        return jsonify({'success': False, 'message': 'Cart not found'}), 400
-    
     # Get data from form instead of JSON
     quantity = request.form.get('quantity', 1, type=int)
     
@@ -162,9 +204,30 @@ def update_cart(item_id):
     except (ValueError, TypeError):
         return jsonify({'success': False, 'message': 'Invalid quantity'}), 400
     
+    if not current_user.is_authenticated:
+        guest_lines = guest_cart.load()
+        item = Item.query.get(item_id) if item_id in guest_lines else None
+        if item is None:
+            return jsonify({'success': False, 'message': 'Item not found in cart'}), 404
+        if item.max_per_customer and quantity > item.max_per_customer:
+            return jsonify({
+                'success': False,
+                'message': f'Maximum {item.max_per_customer} per customer allowed for this item.',
+                'max_additional': max(0, item.max_per_customer - guest_lines[item_id])
+            }), 400
+        if quantity > (item.stock or 0):
+            return jsonify({'success': False, 'message': f'Only {item.stock or 0} available in stock'}), 400
+        guest_lines[item_id] = quantity
+        guest_cart.save(guest_lines)
+        return jsonify({'success': True})
+    
+    cart_id = current_cart_id()
+    if cart_id is None:
+        return jsonify({'success': False, 'message': 'Cart not found'}), 400
+    
     # Get the cart item
     cart_item = CartItem.query.filter_by(
-        cart_id=current_user.cart.id,
+        cart_id=cart_id,
         item_id=item_id
     ).first()
     
@@ -174,11 +237,9 @@ def update_cart(item_id):
     # Check max_per_customer limit
     if cart_item.item.max_per_customer:
         # Get total quantity of this item in all cart items
-        total_quantity_in_cart = sum(
-            ci.quantity 
-            for ci in current_user.cart.items 
-            if ci.item_id == item_id
-        )
+        total_quantity_in_cart = db.session.query(func.coalesce(func.sum(CartItem.quantity), 0))\
+            .filter_by(cart_id=cart_id, item_id=item_id)\
+            .scalar()
         
         # Calculate the new total quantity (current total - current item quantity + new quantity)
         new_total_quantity = total_quantity_in_cart - cart_item.quantity + quantity
@@ -201,39 +262,200 @@ def update_cart(item_id):
     # Update quantity
     cart_item.quantity = quantity
     db.session.commit()
+    users.invalidate(current_user.id)
     
     return jsonify({'success': True})
 
 @views.route('/remove_from_cart/<int:item_id>', methods=['POST'])
-@login_required
 def remove_from_cart(item_id):
-    if not current_user.cart:
+    if not current_user.is_authenticated:
+        guest_lines = guest_cart.load()
+        if guest_lines.pop(item_id, None) is None:
+            return jsonify({'success': False, 'message': 'Item not found in cart'}), 404
+        guest_cart.save(guest_lines)
+        return jsonify({'success': True})
+    
+    cart_id = current_cart_id()
+    if cart_id is None:
         return jsonify({'success': False, 'message': 'Cart not found'}), 400
     
     # CSRF token is automatically validated by Flask-WTF
     
     # Remove the item from cart
     cart_item = CartItem.query.filter_by(
-        cart_id=current_user.cart.id,
+        cart_id=cart_id,
         item_id=item_id
     ).first()
     
     if cart_item:
         db.session.delete(cart_item)
         db.session.commit()
+        users.invalidate(current_user.id)
         return jsonify({'success': True})
     
     return jsonify({'success': False, 'message': 'Item not found in cart'}), 404
 
+CART_OPS = ('set', 'delta', 'remove')
+
+def cart_totals(cart_id):
+    """Return line count, total quantity and total price for a cart in one query."""
+    line_count, total_quantity, total = db.session.query(
+        func.count(CartItem.id),
+        func.coalesce(func.sum(CartItem.quantity), 0),
+        func.coalesce(func.sum(CartItem.quantity * Item.price), 0.0)
+    ).join(Item, CartItem.item_id == Item.id)\
+     .filter(CartItem.cart_id == cart_id)\
+     .one()
+    return {
+        'line_count': line_count,
+        'total_quantity': int(total_quantity),
+        'total': float(total)
+    }
+
+@views.route('/cart/update', methods=['POST'])
+def update_cart_batch():
+    """Apply a batch of cart line changes in a single transaction.
+
+    Expects JSON of the form ``{"changes": [{"item_id": 1, "op": "set", "quantity": 3}, ...]}``
+    where ``op`` is one of ``set``, ``delta`` or ``remove``. Either every change is
+    applied or none is; per-line errors are returned with a 400.
+    """
+    data = request.get_json(silent=True) or {}
+    changes = data.get('changes')
+    if not isinstance(changes, list) or not changes:
+        return jsonify({'success': False, 'message': 'No cart changes provided'}), 400
+
+    # Parse and normalise the requested changes before touching the database
+    parsed = []
+    errors = []
+    for index, change in enumerate(changes):
+        if not isinstance(change, dict):
+            errors.append({'index': index, 'message': 'Invalid change'})
+            continue
+        op = change.get('op', 'set')
+        try:
+            item_id = int(change.get('item_id'))
+            quantity = int(change.get('quantity', 0)) if op != 'remove' else 0
+        except (ValueError, TypeError):
+            errors.append({'index': index, 'message': 'Invalid item or quantity'})
+            continue
+        if op not in CART_OPS:
+            errors.append({'index': index, 'item_id': item_id, 'message': f'Unknown operation: {op}'})
+            continue
+        parsed.append((index, item_id, op, quantity))
+    if errors:
+        return jsonify({'success': False, 'message': 'Invalid cart changes', 'errors': errors}), 400
+
+    item_ids = {item_id for _, item_id, _, _ in parsed}
+    guest = not current_user.is_authenticated
+    if guest:
+        # Guest cart lives in a cookie; one query loads the affected items
+        # and the rest of the cart's items for the totals
+        guest_lines = guest_cart.load()
+        items = {item.id: item for item in Item.query.filter(Item.id.in_(item_ids | set(guest_lines)))}
+        new_quantities = {item_id: guest_lines[item_id] for item_id in item_ids if item_id in guest_lines}
+    else:
+        cart_id = current_cart_id(create=True)
+
+        # Load every affected item together with its cart line (if any) in one query
+        rows = db.session.query(Item, CartItem)\
+            .outerjoin(CartItem, and_(CartItem.item_id == Item.id, CartItem.cart_id == cart_id))\
+            .filter(Item.id.in_(item_ids))\
+            .all()
+        items = {item.id: item for item, _ in rows}
+        lines = {item.id: cart_item for item, cart_item in rows if cart_item is not None}
+        new_quantities = {item_id: line.quantity for item_id, line in lines.items()}
+
+    # Work out the resulting quantity for each line
+    for index, item_id, op, quantity in parsed:
+        if item_id not in items:
+            errors.append({'index': index, 'item_id': item_id, 'message': 'Item not found'})
+            continue
+        if op == 'remove':
+            new_quantities[item_id] = 0
+        elif op == 'delta':
+            new_quantities[item_id] = new_quantities.get(item_id, 0) + quantity
+        else:
+            new_quantities[item_id] = quantity
+
+    # Validate the final quantities against stock and per-customer limits
+    for item_id in item_ids:
+        item = items.get(item_id)
+        quantity = new_quantities.get(item_id, 0)
+        if item is None or quantity == 0:
+            continue
+        if quantity < 0:
+            errors.append({'item_id': item_id, 'message': 'Quantity must be at least 1'})
+        elif item.max_per_customer and quantity > item.max_per_customer:
+            errors.append({
+                'item_id': item_id,
+                'message': f'Maximum {item.max_per_customer} per customer allowed for {item.name}.',
+                'max_quantity': item.max_per_customer
+            })
+        elif quantity > (item.stock or 0):
+            errors.append({
+                'item_id': item_id,
+                'message': f'Only {item.stock or 0} of {item.name} available in stock',
+                'max_quantity': item.stock or 0
+            })
+    if errors:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Cart could not be updated', 'errors': errors}), 400
+
+    if guest:
+        for item_id in item_ids:
+            guest_lines[item_id] = new_quantities.get(item_id, 0)
+        try:
+            guest_cart.save(guest_lines)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        guest_lines = guest_cart.load()
+        totals = {
+            'line_count': len(guest_lines),
+            'total_quantity': sum(guest_lines.values()),
+            'total': float(sum(items[item_id].price * quantity
+                               for item_id, quantity in guest_lines.items() if item_id in items))
+        }
+    else:
+        # Apply everything and commit once
+        for item_id in item_ids:
+            quantity = new_quantities.get(item_id, 0)
+            line = lines.get(item_id)
+            if quantity == 0:
+                if line is not None:
+                    db.session.delete(line)
+            elif line is not None:
+                line.quantity = quantity
+            else:
+                db.session.add(CartItem(cart_id=cart_id, item_id=item_id, quantity=quantity))
+        db.session.flush()
+
+        totals = cart_totals(cart_id)
+        db.session.commit()
+        users.invalidate(current_user.id)
+
+    settings = StoreSettings.get_settings()
+    return jsonify({
+        'success': True,
+        'lines': [
+            {
+                'item_id': item_id,
+                'quantity': new_quantities.get(item_id, 0),
+                'line_total': items[item_id].price * new_quantities.get(item_id, 0)
+            }
+            for item_id in sorted(item_ids)
+        ],
+        'cart': dict(totals, total_display=settings.format_price(totals['total']))
+    })
+
 @views.route('/cart')
-@login_required
 def cart():
-    if not current_user.cart:
-        cart = Cart(user_id=current_user.id)
-        db.session.add(cart)
-        db.session.commit()
-    
-    cart_items = current_user.cart.items
+    if current_user.is_authenticated:
+        cart_items = cart_lines(current_cart_id())
+    else:
+        cart_items, notices = guest_cart.display_lines()
+        for notice in notices:
+            flash(notice, 'info')
     total = sum(item.item.price * item.quantity for item in cart_items)
     settings = StoreSettings.get_settings()
     return render_template('views/cart.html', 
@@ -245,11 +467,12 @@ def cart():
 @views.route('/checkout', methods=['POST'])
 @login_required
 def checkout():
-    if not current_user.cart or not current_user.cart.items:
+    cart_id = current_cart_id()
+    cart_items = cart_lines(cart_id)
+    if not cart_items:
         flash('Your cart is empty!', 'error')
         return redirect(url_for('views.cart'))
     
-    cart_items = current_user.cart.items
     total = sum(item.item.price * item.quantity for item in cart_items)
     
     # Create order
@@ -257,26 +480,52 @@ def checkout():
     db.session.add(order)
     db.session.flush()  # Get the order ID
     
-    # Add items to order
+    # Add items to order in one INSERT, with a snapshot of each item
+    db.session.execute(OrderItem.__table__.insert(), [
+        {
+            'order_id': order.id,
+            'item_id': cart_item.item_id,
+            'quantity': cart_item.quantity,
+            'price': cart_item.item.price,
+            'item_name': cart_item.item.name,
+            'item_barcode': cart_item.item.barcode,
+            'item_image_url': cart_item.item.image_url
+        }
+        for cart_item in cart_items
+    ])
+    
     for cart_item in cart_items:
-        order_item = OrderItem(
-            order_id=order.id,
-            item_id=cart_item.item_id,
-            quantity=cart_item.quantity,
-            price=cart_item.item.price
-        )
-        db.session.add(order_item)
-        
         # Update stock
         cart_item.item.stock -= cart_item.quantity
         if cart_item.item.stock < 0:
             db.session.rollback()
             flash(f'Not enough stock for {cart_item.item.name}', 'error')
             return redirect(url_for('views.cart'))
+    ledger.record([
+        {'item_id': cart_item.item_id, 'change': -cart_item.quantity, 'reason': 'order',
+         'order_id': order.id, 'user_id': current_user.id}
+        for cart_item in cart_items
+    ])
+    stock_alerts.note_changes([
+        (cart_item.item, cart_item.item.stock + cart_item.quantity, None) for cart_item in cart_items
+    ])
     
     # Clear cart
-    CartItem.query.filter_by(cart_id=current_user.cart.id).delete()
+    CartItem.query.filter_by(cart_id=cart_id).delete()
+    rollups.record_orders([Order.id == order.id])
     db.session.commit()
+    users.invalidate(current_user.id)
+    events.publish('order.created', {
+        'id': order.id,
+        'customer': current_user.first_name,
+        'email': current_user.email,
+        'item_count': len(cart_items),
+        'total': order.total,
+        'total_display': StoreSettings.get_settings().format_price(order.total),
+        'status': order.status,
+        'date': order.date_ordered.isoformat(),
+        'date_display': order.date_ordered.strftime('%b %d, %Y')
+    })
     
     flash('Order placed successfully!', 'success')
     return redirect(url_for('views.orders'))
@@ -284,10 +533,17 @@ def checkout():
 @views.route('/orders')
 @login_required
 def orders():
-    from .models import StoreSettings
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.date_ordered.desc()).all()
+    from .models import CustomerSales, StoreSettings
+    # Orders moved to the archive are only read when asked for (?history=all)
+    include_archived = request.args.get('history') == 'all'
+    before = archive.parse_cursor(request.args.get('before'))
+    rows, next_before = archive.order_page(current_user.id, before=before, include_archived=include_archived)
+    # Lifetime totals come from the rollup kept up to date at checkout
+    summary = CustomerSales.query.get(current_user.id)
     settings = StoreSettings.get_settings()
-    return render_template('views/orders.html', orders=orders, user=current_user, settings=settings)
+    return render_template('views/orders.html', rows=rows, summary=summary, user=current_user,
+                           settings=settings, include_archived=include_archived, paged=before is not None,
+                           next_cursor=archive.format_cursor(next_before) if next_before else None)
 
 @views.route('/camera-test')
 def camera_test():
@@ -301,7 +557,8 @@ def scan_barcode():
         if not ensure_zbar_loaded():
             flash('Barcode engine (ZBar) is not available on this system. Please reinstall or contact support.', 'error')
             return redirect(request.url)
-        from pyzbar.pyzbar import decode
+        # OpenCV is imported on first use; see app/scanning.py
+        from . import scanning
         if 'barcode_image' not in request.files:
             flash('No file uploaded', 'error')
             return redirect(request.url)
@@ -317,28 +574,24 @@ def scan_barcode():
             filepath = os.path.join(UPLOAD_FOLDER, filename)
             file.save(filepath)
             
-            # Read the image
-            img = cv2.imread(filepath)
-            
-            # Convert to grayscale
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            # Read the image and decode barcodes
+            img = scanning.read_image_file(filepath)
+            try:
+                codes = scanning.find_barcodes(img)
+            except scanning.ScannerUnavailable:
+                flash('Barcode engine (ZBar) is not available on this system. Please reinstall or contact support.', 'error')
+                return redirect(request.url)
             
-            # Decode barcodes
-            barcodes = decode(gray)
-            
-            if barcodes:
-                barcode_data = barcodes[0].data.decode('utf-8')
+            if codes:
+                barcode_data = codes[0]
                 # Try to find item by barcode in the database
-                item = Item.query.filter_by(barcode=barcode_data).first()
+                item = barcodes.find_item(barcode_data)
                 if item:
                     # Add to cart if item found
-                    if not current_user.cart:
-                        cart = Cart(user_id=current_user.id)
-                        db.session.add(cart)
-                        db.session.commit()
+                    cart_id = current_cart_id(create=True)
                     
                     cart_item = CartItem.query.filter_by(
-                        cart_id=current_user.cart.id,
+                        cart_id=cart_id,
                         item_id=item.id
                     ).first()
                     
@@ -346,13 +599,14 @@ def scan_barcode():
                         cart_item.quantity += 1
                     else:
                         cart_item = CartItem(
-                            cart_id=current_user.cart.id,
+                            cart_id=cart_id,
                             item_id=item.id,
                             quantity=1
                         )
                         db.session.add(cart_item)
                     
                     db.session.commit()
+                    users.invalidate(current_user.id)
                     flash(f'Added {item.name} to cart!', 'success')
                     return redirect(url_for('views.item_detail', item_id=item.id))
                 else:
@@ -367,12 +621,26 @@ def scan_barcode():
 @views.route('/api/scan-barcode', methods=['POST'])
 @login_required
 def api_scan_barcode():
+    # Turn frames away before reading the upload when this user is over
+    # their rate or too many decodes are already running (app/admission.py)
+    control = admission.get_scan_admission()
+    try:
+        control.acquire(current_user.id)
+    except admission.Rejected as e:
+        return admission.rejected_response(e)
+    try:
+        return _scan_barcode_frame()
+    finally:
+        control.release()
+
+def _scan_barcode_frame():
     try:
         print("Received barcode scan request")
         # Ensure ZBar DLL is available before importing pyzbar
         if not ensure_zbar_loaded():
             return jsonify({'success': False, 'error': 'Barcode engine (ZBar) is not available.'}), 500
-        from pyzbar.pyzbar import decode
+        # OpenCV is imported on first use; see app/scanning.py
+        from . import scanning
         
         if 'barcode_image' not in request.files:
             print("No file in request")
@@ -394,8 +662,7 @@ def api_scan_barcode():
                 print("Empty file data")
                 return jsonify({'success': False, 'error': 'Empty file data'}), 400
                 
-            nparr = np.frombuffer(file_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            img = scanning.decode_image_bytes(file_data)
             
             if img is None:
                 print("Failed to decode image")
@@ -405,29 +672,22 @@ def api_scan_barcode():
             debug_dir = os.path.join('app', 'static', 'debug')
             os.makedirs(debug_dir, exist_ok=True)
             debug_path = os.path.join(debug_dir, f'scan_{int(time.time())}.jpg')
-            cv2.imwrite(debug_path, img)
+            scanning.save_image(img, debug_path)
             print(f"Saved debug image to {debug_path}")
             
-            # Convert to grayscale
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # Try different barcode formats if needed
-            barcodes = decode(gray)
-            
-            if not barcodes:
-                # Try with different settings if no barcode found
-                print("No barcode found with default settings, trying with different parameters...")
-                # Try with different binarization
-                _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                barcodes = decode(binary)
+            # Decode, retrying with Otsu binarization if nothing is found
+            try:
+                codes = scanning.find_barcodes(img, retry_binarized=True)
+            except scanning.ScannerUnavailable as e:
+                return jsonify({'success': False, 'error': str(e)}), 500
             
-            print(f"Found {len(barcodes)} barcodes")
+            print(f"Found {len(codes)} barcodes")
             
-            if barcodes:
-                barcode_data = barcodes[0].data.decode('utf-8')
+            if codes:
+                barcode_data = codes[0]
                 print(f"Decoded barcode: {barcode_data}")
                 
-                item = Item.query.filter_by(barcode=barcode_data).first()
+                item = barcodes.find_item(barcode_data)
                 if item:
                     print(f"Found item in database: {item.name}")
                     return jsonify({
@@ -481,6 +741,8 @@ def api_scan_barcode():
 @login_required
 def view_order(order_id):
     from .models import StoreSettings
-    order = Order.query.filter_by(id=order_id, user_id=current_user.id).first_or_404()
+    order = archive.find_order(order_id, user_id=current_user.id)
+    if order is None:
+        abort(404)
     settings = StoreSettings.get_settings()
     return render_template('views/order_detail.html', order=order, user=current_user, settings=settings)
\ No newline at end of file
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Move old Delivered/Cancelled orders into the archive tables.
+
+Usage:
+  python scripts/archive_orders.py --dry-run
+  python scripts/archive_orders.py
+  python scripts/archive_orders.py --days 365 --batch-size 200 --limit 10000
+
+Orders placed more than --days ago (default 180) whose status is Delivered or
+Cancelled are copied to archived_order/archived_order_item and removed from
+the hot tables, one transaction per batch. The store can stay online while
+this runs; stopping it part-way loses nothing, and re-running continues.
+Archived orders still show on order detail pages and, when asked for, in the
+order listings and exports.
+"""
+import argparse
+import sys
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Archive old finished orders')
+    p.add_argument('--days', type=int, default=None, help='Archive orders placed more than this many days ago (default: 180)')
+    p.add_argument('--batch-size', type=int, default=None, help='Orders moved per transaction (default: 500)')
+    p.add_argument('--limit', type=int, default=None, help='Stop after moving this many orders')
+    p.add_argument('--dry-run', action='store_true', help='Only count the orders that would be archived')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Import app factory and db lazily so script can be executed from repo root
+    try:
+        from app import create_app
+        from app import archive
+    except Exception as e:
+        print('Error importing the application. Make sure you run this from the project root and your venv is active.')
+        print('Import error:', e)
+        sys.exit(1)
+
+    days = archive.DEFAULT_AGE_DAYS if args.days is None else args.days
+    batch_size = archive.DEFAULT_BATCH_SIZE if args.batch_size is None else args.batch_size
+    if days < 0 or batch_size < 1:
+        print('--days must be >= 0 and --batch-size >= 1')
+        sys.exit(2)
+
+    app = create_app()
+
+    with app.app_context():
+        if args.dry_run:
+            count = archive.count_archivable(days)
+            if args.limit is not None:
+                count = min(count, args.limit)
+            print('Would archive %d orders placed more than %d days ago.' % (count, days))
+            return
+
+        progress = None
+        for progress in archive.archive_orders(days, batch_size, args.limit):
+            print('Batch %d: %d orders, %d lines archived so far' % (progress.batches, progress.orders, progress.lines))
+        if progress is None:
+            print('Nothing to archive.')
+        else:
+            print('Archived %d orders (%d lines) placed before %s.'
+                  % (progress.orders, progress.lines, progress.cutoff.strftime('%Y-%m-%d')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Measure import time and boot time of the app in fresh interpreters.
+
+Usage:
+  python scripts/bench_startup.py
+  python scripts/bench_startup.py --runs 10 --top 15
+  python scripts/bench_startup.py --json startup.json
+
+Each measurement runs in a new Python process, so nothing is cached in
+memory between runs. Reported:
+
+  import      - `import app` (package import, no app created)
+  boot-cold   - create_app() against an empty data directory (schema created)
+  boot-warm   - create_app() against an existing database (schema check only)
+  first-scan  - boot-warm plus importing the scan stack (OpenCV/numpy)
+  cli         - scripts/update_currency.py --dry-run end to end
+
+first-request latency, i.e. the first GETs of a few pages after boot (time
+inside the process, excluding boot), in three setups:
+
+  first-request-nocache - no template bytecode cache (every template compiles)
+  first-request-cold    - bytecode cache enabled but empty (compile and store)
+  first-request-cached  - bytecode cache filled by an earlier run, as after
+                          a restart of the packaged app
+
+and the slowest modules from `python -X importtime` for create_app().
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+BOOT = 'from app import create_app; create_app()'
+
+FIRST_REQUEST_PATHS = ('/', '/login', '/cart')
+FIRST_REQUEST = '''
+import time
+from app import create_app
+app = create_app()
+client = app.test_client()
+started = time.perf_counter()
+for path in %r:
+    client.get(path, base_url='https://localhost')
+print((time.perf_counter() - started) * 1000)
+''' % (FIRST_REQUEST_PATHS,)
+
+
+def _run(args, env, cwd=REPO_ROOT):
+    started = time.perf_counter()
+    proc = subprocess.run(args, env=env, cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError('%s failed:\n%s' % (' '.join(args), proc.stderr[-2000:]))
+    return elapsed, proc.stderr
+
+
+def measure(name, args, env, runs, before=None):
+    samples = []
+    for _ in range(runs):
+        if before:
+            before()
+        elapsed, _ = _run(args, env)
+        samples.append(elapsed * 1000)
+    return {
+        'name': name,
+        'runs': runs,
+        'median_ms': statistics.median(samples),
+        'min_ms': min(samples),
+        'max_ms': max(samples),
+    }
+
+
+def measure_first_request(name, env, runs, before=None):
+    samples = []
+    for _ in range(runs):
+        if before:
+            before()
+        proc = subprocess.run([sys.executable, '-c', FIRST_REQUEST], env=env, cwd=REPO_ROOT,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError('first request failed:\n%s' % proc.stderr[-2000:])
+        samples.append(float(proc.stdout.strip().splitlines()[-1]))
+    return {
+        'name': name,
+        'runs': runs,
+        'median_ms': statistics.median(samples),
+        'min_ms': min(samples),
+        'max_ms': max(samples),
+    }
+
+
+def import_profile(env, top):
+    """Slowest top-level imports, by cumulative time, during create_app()."""
+    _, stderr = _run([sys.executable, '-X', 'importtime', '-c', BOOT], env)
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|', 2)
+        name = name[1:]
+        # Nested imports are indented; count each package once, at the top
+        if name.startswith(' ') or not cumulative.strip().isdigit():
+            continue
+        rows.append({'module': name, 'cumulative_ms': int(cumulative) / 1000})
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:top]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Benchmark app import and boot time')
+    p.add_argument('--runs', type=int, default=5, help='Runs per measurement (default: 5)')
+    p.add_argument('--top', type=int, default=10, help='Slowest imported packages to list (default: 10)')
+    p.add_argument('--json', help='Also write the results to this file')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    data_dir = tempfile.mkdtemp(prefix='storeapp-bench-')
+    env = dict(os.environ, STOREAPP_DATA_DIR=data_dir, PYTHONPATH=REPO_ROOT)
+    db_path = os.path.join(data_dir, 'store.db')
+    template_cache = os.path.join(data_dir, 'template_cache')
+
+    def remove_db():
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+    def remove_template_cache():
+        shutil.rmtree(template_cache, ignore_errors=True)
+
+    try:
+        results = [
+            measure('import', [sys.executable, '-c', 'import app'], env, args.runs),
+            measure('boot-cold', [sys.executable, '-c', BOOT], env, args.runs, before=remove_db),
+            measure('boot-warm', [sys.executable, '-c', BOOT], env, args.runs),
+        ]
+        try:
+            results.append(measure(
+                'first-scan', [sys.executable, '-c', BOOT + '; import app.scanning'], env, args.runs))
+        except RuntimeError:
+            print('Skipping first-scan: OpenCV/numpy not importable')
+        results.extend([
+            measure_first_request('first-request-nocache', dict(env, STOREAPP_TEMPLATE_CACHE='0'), args.runs),
+            measure_first_request('first-request-cold', env, args.runs, before=remove_template_cache),
+            measure_first_request('first-request-cached', env, args.runs),
+        ])
+        results.append(measure(
+            'cli', [sys.executable, os.path.join(REPO_ROOT, 'scripts', 'update_currency.py'), '$', '--dry-run'],
+            env, args.runs))
+        modules = import_profile(env, args.top)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print('%-22s %10s %10s %10s' % ('measure', 'median ms', 'min ms', 'max ms'))
+    for row in results:
+        print('%-22s %10.1f %10.1f %10.1f' % (row['name'], row['median_ms'], row['min_ms'], row['max_ms']))
+    if modules:
+        print()
+        print('Slowest top-level imports during create_app():')
+        for row in modules:
+            print('  %-30s %8.1f ms' % (row['module'], row['cumulative_ms']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results, 'imports': modules}, f, indent=2)
+        print('Saved results to %s' % args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Bulk order and product updates, each run as a single UPDATE statement.
+
+Usage:
+  python scripts/bulk_update.py order-status Shipped --from-status Processing --end 2024-05-31
+  python scripts/bulk_update.py order-status Delivered --ids 12,13,14 --dry-run
+  python scripts/bulk_update.py reprice 10 --search "tea"
+  python scripts/bulk_update.py restock --add 24 --max-stock 5
+  python scripts/bulk_update.py restock --set 0 --ids 7
+
+Every command accepts --dry-run, which prints how many rows would change
+without committing anything. Commands refuse to run without a filter.
+"""
+import argparse
+import sys
+
+def _ids(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Bulk order status and product updates')
+    sub = p.add_subparsers(dest='command', required=True)
+
+    orders = sub.add_parser('order-status', help='Set the status of matching orders')
+    orders.add_argument('status', help='New status (Processing, Shipped, Delivered, Cancelled)')
+    orders.add_argument('--ids', type=_ids, help='Comma-separated order ids')
+    orders.add_argument('--from-status', help='Only orders currently in this status')
+    orders.add_argument('--start', help='Only orders placed on or after this date (YYYY-MM-DD)')
+    orders.add_argument('--end', help='Only orders placed on or before this date (YYYY-MM-DD)')
+
+    def item_filter_args(parser):
+        parser.add_argument('--ids', type=_ids, help='Comma-separated item ids')
+        parser.add_argument('--search', help='Only items whose name contains this text')
+        parser.add_argument('--max-stock', type=int, help='Only items with at most this much stock')
+        parser.add_argument('--barcodes', type=lambda v: [b.strip() for b in v.split(',') if b.strip()],
+                            help='Comma-separated barcodes')
+
+    reprice = sub.add_parser('reprice', help='Change prices of matching items by a percentage')
+    reprice.add_argument('percent', type=float, help='Percentage change, e.g. 10 or -5')
+    item_filter_args(reprice)
+
+    restock = sub.add_parser('restock', help='Add to or set the stock of matching items')
+    amount = restock.add_mutually_exclusive_group(required=True)
+    amount.add_argument('--add', type=int, help='Units to add (negative to remove)')
+    amount.add_argument('--set', dest='set_to', type=int, help='Set stock to this value')
+    item_filter_args(restock)
+
+    for parser in (orders, reprice, restock):
+        parser.add_argument('--dry-run', action='store_true', help='Show how many rows would change without committing')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Import app factory and db lazily so script can be executed from repo root
+    try:
+        from app import create_app
+        from app import bulk, exports
+    except Exception as e:
+        print('Error importing the application. Make sure you run this from the project root and your venv is active.')
+        print('Import error:', e)
+        sys.exit(1)
+
+    app = create_app()
+
+    with app.app_context():
+        try:
+            if args.command == 'order-status':
+                start, end = exports.parse_date_range({'start': args.start, 'end': args.end})
+                filters = bulk.order_filters(args.ids, args.from_status, start, end)
+                result = bulk.set_order_status(args.status, filters, dry_run=args.dry_run)
+                what = 'order(s) set to %s' % args.status
+                would = 'order(s) would be set to %s' % args.status
+            else:
+                filters = bulk.item_filters(args.ids, args.search, args.max_stock, args.barcodes)
+                if args.command == 'reprice':
+                    result = bulk.reprice_items(args.percent, filters, dry_run=args.dry_run)
+                    what = 'item(s) repriced by %+g%%' % args.percent
+                    would = 'item(s) would be repriced by %+g%%' % args.percent
+                else:
+                    result = bulk.restock_items(filters, add=args.add, set_to=args.set_to, dry_run=args.dry_run)
+                    what = 'item(s) restocked'
+                    would = 'item(s) would be restocked'
+        except ValueError as e:
+            print('Error:', e)
+            sys.exit(2)
+
+        if result.dry_run:
+            print('Dry-run: %d %s; no changes committed.' % (result.matched, would))
+        else:
+            print('%d %s.' % (result.matched, what))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Bulk import products from a CSV or JSONL file.
+
+Usage:
+  python scripts/import_products.py products_export.csv
+  python scripts/import_products.py catalogue.jsonl --chunk-size 5000
+
+The file uses the same columns as the admin product export. Rows are upserted
+by barcode in chunks, each chunk in its own transaction. Progress is printed
+after every chunk and per-row errors are listed at the end.
+"""
+import argparse
+import sys
+import time
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Bulk import products into the DB')
+    p.add_argument('path', help='CSV or JSONL file to import')
+    p.add_argument('--format', choices=['csv', 'jsonl'], help='File format (detected from the extension by default)')
+    p.add_argument('--chunk-size', type=int, default=1000, help='Rows per transaction (default: 1000)')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Import app factory and db lazily so script can be executed from repo root
+    try:
+        from app import create_app
+        from app import importer
+    except Exception as e:
+        print('Error importing the application. Make sure you run this from the project root and your venv is active.')
+        print('Import error:', e)
+        sys.exit(1)
+
+    app = create_app()
+    fmt = args.format or importer.detect_format(args.path)
+
+    with app.app_context():
+        started = time.time()
+        result = None
+        with open(args.path, 'rb') as f:
+            for result in importer.import_products(f, fmt, max(1, args.chunk_size)):
+                print('Processed %d rows (%d upserted, %d updated by id, %d inserted, %d failed)' % (
+                    result.rows, result.upserted, result.updated_by_id, result.inserted, result.failed))
+
+        print('Finished in %.1fs' % (time.time() - started))
+        for error in result.errors:
+            print('  line %s: %s' % (error['line'], error['message']))
+        if result.failed > len(result.errors):
+            print('  ... %d more errors not shown' % (result.failed - len(result.errors)))
+        if result.failed:
+            sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+"""End-to-end load test for the browse -> cart -> checkout -> scan paths.
+
+Usage:
+  python scripts/loadtest.py                                  # Flask test client, 8 users, 30s
+  python scripts/loadtest.py --vus 16 --duration 60 --items 5000 --orders 50000
+  python scripts/loadtest.py --server gunicorn --workers 3   # real HTTP against local gunicorn
+  python scripts/loadtest.py --url http://127.0.0.1:5000     # an already running server
+  python scripts/loadtest.py --compare loadtest_results/20240101-120000.json
+
+A fresh SQLite database is seeded in a temporary data directory with the
+requested numbers of users, items (with EAN-13 barcodes) and orders. Virtual
+users then log in and pick operations by weight from the mix (home,
+item_detail, add_to_cart, update_cart, checkout, orders, scan). The scan
+operation posts synthetic barcode images to /api/scan-barcode.
+
+The run reports throughput, latency percentiles and error rates per
+operation, plus how often "database is locked" appeared in the server log.
+Every run is saved as JSON (see --out) so runs can be compared.
+"""
+import argparse
+import http.cookiejar
+import io
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_MIX = {
+    'home': 30,
+    'item_detail': 25,
+    'add_to_cart': 15,
+    'update_cart': 8,
+    'checkout': 5,
+    'orders': 10,
+    'scan': 7,
+}
+
+# --- Synthetic EAN-13 barcodes -------------------------------------------------
+
+_EAN_L = ['0001101', '0011001', '0010011', '0111101', '0100011',
+          '0110001', '0101111', '0111011', '0110111', '0001011']
+_EAN_G = ['0100111', '0110011', '0011011', '0100001', '0011101',
+          '0111001', '0000101', '0010001', '0001001', '0010111']
+_EAN_R = ['1110010', '1100110', '1101100', '1000010', '1011100',
+          '1001110', '1010000', '1000100', '1001000', '1110100']
+_EAN_PARITY = ['LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+               'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL']
+
+
+def ean13(body12):
+    """Append the EAN-13 check digit to a 12-digit string."""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body12))
+    return body12 + str((10 - total % 10) % 10)
+
+
+def ean13_modules(code):
+    parity = _EAN_PARITY[int(code[0])]
+    left = ''.join((_EAN_L if p == 'L' else _EAN_G)[int(d)] for p, d in zip(parity, code[1:7]))
+    right = ''.join(_EAN_R[int(d)] for d in code[7:])
+    return '101' + left + '01010' + right + '101'
+
+
+def render_barcode_png(code, module_px=3, height=120, quiet=10):
+    """Draw an EAN-13 barcode as PNG bytes (needs numpy and OpenCV)."""
+    import numpy as np
+    import cv2
+
+    modules = ('0' * quiet) + ean13_modules(code) + ('0' * quiet)
+    row = np.array([0 if m == '1' else 255 for m in modules], dtype=np.uint8).repeat(module_px)
+    img = np.tile(row, (height, 1))
+    img = np.pad(img, ((20, 20), (0, 0)), constant_values=255)
+    ok, buf = cv2.imencode('.png', img)
+    if not ok:
+        raise RuntimeError('Failed to encode barcode image')
+    return buf.tobytes()
+
+
+# --- Seeding -------------------------------------------------------------------
+
+def seed(app, users, items, orders, seed_value):
+    """Fill an empty database with synthetic users, items and orders."""
+    from app import db
+    from app.models import User, Item, Order, OrderItem
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {'email': f'user{i}@load.test', 'first_name': f'User{i}', 'password': 'loadtest', 'is_admin': False}
+            for i in range(users)
+        ])
+        db.session.execute(Item.__table__.insert(), [
+            {
+                'name': f'Load Item {i}',
+                'price': round(rng.uniform(100, 5000)),
+                'description': f'Synthetic item {i} for load testing',
+                'stock': 1000000,
+                'max_per_customer': None,
+                'barcode': ean13(f'490{i:09d}'),
+                'image_url': '',
+                'date_added': now,
+            }
+            for i in range(items)
+        ])
+        db.session.commit()
+
+        user_ids = [row[0] for row in db.session.query(User.id).all()]
+        item_rows = db.session.query(Item.id, Item.price).all()
+        batch = 5000
+        for start in range(0, orders, batch):
+            count = min(batch, orders - start)
+            order_rows = []
+            lines = []
+            for _ in range(count):
+                picked = rng.sample(item_rows, k=min(len(item_rows), rng.randint(1, 3)))
+                quantities = [rng.randint(1, 3) for _ in picked]
+                order_rows.append({
+                    'user_id': rng.choice(user_ids),
+                    'total': sum(p * q for (_, p), q in zip(picked, quantities)),
+                    'date_ordered': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+                    'status': rng.choice(['Processing', 'Shipped', 'Delivered', 'Cancelled']),
+                })
+                lines.append([(item_id, price, q) for (item_id, price), q in zip(picked, quantities)])
+            first_id = (db.session.query(db.func.max(Order.id)).scalar() or 0) + 1
+            db.session.execute(Order.__table__.insert(), order_rows)
+            db.session.execute(OrderItem.__table__.insert(), [
+                {'order_id': first_id + offset, 'item_id': item_id, 'quantity': q, 'price': price}
+                for offset, order_lines in enumerate(lines)
+                for item_id, price, q in order_lines
+            ])
+            db.session.commit()
+        return len(user_ids), [(row[0], ean13(f'490{i:09d}')) for i, row in enumerate(item_rows)]
+
+
+# --- Transports ----------------------------------------------------------------
+
+class TestClientTransport:
+    """Drives the app in-process through the Flask test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.base = 'https://localhost'
+
+    def request(self, method, path, data=None, json_body=None, files=None, headers=None):
+        kwargs = {'headers': headers or {}}
+        if json_body is not None:
+            kwargs['json'] = json_body
+        elif files:
+            form = dict(data or {})
+            for name, (filename, content, _) in files.items():
+                form[name] = (io.BytesIO(content), filename)
+            kwargs['data'] = form
+            kwargs['content_type'] = 'multipart/form-data'
+        elif data is not None:
+            kwargs['data'] = data
+        response = self.client.open(self.base + path, method=method, **kwargs)
+        return response.status_code, response.get_data()
+
+    def csrf_token(self, path='/'):
+        return None  # CSRF is disabled for in-process runs
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport:
+    """Drives a running server over HTTP with its own cookie jar."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _NoRedirect()
+        )
+        self._csrf = None
+
+    def request(self, method, path, data=None, json_body=None, files=None, headers=None):
+        headers = dict(headers or {})
+        # The app redirects plain HTTP to HTTPS unless the proxy says otherwise
+        headers.setdefault('X-Forwarded-Proto', 'https')
+        if method != 'GET' and self._csrf:
+            headers['X-CSRFToken'] = self._csrf
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif files:
+            body, content_type = _multipart(data or {}, files)
+            headers['Content-Type'] = content_type
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def csrf_token(self, path='/'):
+        status, body = self.request('GET', path)
+        match = re.search(rb'name="csrf-token" content="([^"]+)"', body)
+        self._csrf = match.group(1).decode() if match else None
+        return self._csrf
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, mimetype) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {mimetype}\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# --- Virtual users -------------------------------------------------------------
+
+class Stats:
+    """Per-operation samples, shared by all virtual users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ops = {}
+
+    def record(self, op, seconds, status, error=None):
+        with self._lock:
+            entry = self.ops.setdefault(op, {'latencies': [], 'statuses': {}, 'errors': 0, 'rejected': 0, 'exceptions': {}})
+            entry['latencies'].append(seconds)
+            key = str(status) if status is not None else 'exception'
+            entry['statuses'][key] = entry['statuses'].get(key, 0) + 1
+            if status is None or status >= 500:
+                entry['errors'] += 1
+            elif status >= 400:
+                entry['rejected'] += 1
+            if error:
+                entry['exceptions'][error] = entry['exceptions'].get(error, 0) + 1
+
+
+class VirtualUser:
+
+    def __init__(self, index, transport, items, scan_images, rng):
+        self.index = index
+        self.transport = transport
+        self.items = items
+        self.scan_images = scan_images
+        self.rng = rng
+        self.cart = set()
+
+    def login(self):
+        self.transport.csrf_token('/login')
+        status, _ = self.transport.request('POST', '/login', data={
+            'email': f'user{self.index}@load.test', 'password': 'loadtest'
+        })
+        if status not in (200, 302):
+            raise RuntimeError(f'Login failed for user{self.index}: HTTP {status}')
+
+    def _item_id(self):
+        return self.rng.choice(self.items)[0]
+
+    def home(self):
+        return self.transport.request('GET', '/')
+
+    def item_detail(self):
+        return self.transport.request('GET', f'/item/{self._item_id()}')
+
+    def add_to_cart(self):
+        item_id = self._item_id()
+        result = self.transport.request('POST', f'/add_to_cart/{item_id}', data={'quantity': 1},
+                                        headers={'X-Requested-With': 'XMLHttpRequest'})
+        if result[0] == 200:
+            self.cart.add(item_id)
+        return result
+
+    def update_cart(self):
+        if not self.cart:
+            return self.add_to_cart()
+        item_id = self.rng.choice(sorted(self.cart))
+        # The same batch endpoint the cart page uses
+        change = {'item_id': item_id, 'op': 'set', 'quantity': self.rng.randint(1, 3)}
+        return self.transport.request('POST', '/cart/update', json_body={'changes': [change]},
+                                      headers={'X-Requested-With': 'XMLHttpRequest'})
+
+    def checkout(self):
+        if not self.cart:
+            self.add_to_cart()
+        result = self.transport.request('POST', '/checkout')
+        self.cart.clear()
+        return result
+
+    def orders(self):
+        return self.transport.request('GET', '/orders')
+
+    def scan(self):
+        if not self.scan_images:
+            return self.home()
+        code, png = self.rng.choice(self.scan_images)
+        return self.transport.request('POST', '/api/scan-barcode',
+                                      files={'barcode_image': (f'{code}.png', png, 'image/png')})
+
+
+def run_user(vu, mix, deadline, max_requests, think, stats):
+    ops, weights = zip(*mix.items())
+    done = 0
+    while time.time() < deadline and (not max_requests or done < max_requests):
+        op = vu.rng.choices(ops, weights)[0]
+        started = time.perf_counter()
+        try:
+            status, _ = getattr(vu, op)()
+            stats.record(op, time.perf_counter() - started, status)
+        except Exception as e:
+            stats.record(op, time.perf_counter() - started, None, type(e).__name__)
+        done += 1
+        if think:
+            time.sleep(think)
+
+
+# --- Reporting -----------------------------------------------------------------
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarise(stats, elapsed):
+    summary = {}
+    total = errors = 0
+    for op, entry in sorted(stats.ops.items()):
+        latencies = sorted(entry['latencies'])
+        count = len(latencies)
+        total += count
+        errors += entry['errors']
+        summary[op] = {
+            'requests': count,
+            'throughput_rps': count / elapsed if elapsed else 0,
+            'error_rate': entry['errors'] / count if count else 0,
+            'rejected': entry['rejected'],
+            'statuses': entry['statuses'],
+            'exceptions': entry['exceptions'],
+            'latency_ms': {
+                'mean': 1000 * sum(latencies) / count if count else 0,
+                'p50': 1000 * percentile(latencies, 50),
+                'p90': 1000 * percentile(latencies, 90),
+                'p95': 1000 * percentile(latencies, 95),
+                'p99': 1000 * percentile(latencies, 99),
+                'max': 1000 * (latencies[-1] if latencies else 0),
+            },
+        }
+    return summary, {
+        'requests': total,
+        'throughput_rps': total / elapsed if elapsed else 0,
+        'error_rate': errors / total if total else 0,
+    }
+
+
+def print_report(result, previous=None):
+    totals = result['totals']
+    print()
+    print('%-12s %8s %8s %8s %8s %8s %8s %8s %7s' % (
+        'operation', 'reqs', 'rps', 'mean', 'p50', 'p95', 'p99', 'max', 'err%'))
+    for op, s in result['operations'].items():
+        lat = s['latency_ms']
+        line = '%-12s %8d %8.1f %8.1f %8.1f %8.1f %8.1f %8.1f %6.2f%%' % (
+            op, s['requests'], s['throughput_rps'], lat['mean'], lat['p50'], lat['p95'], lat['p99'], lat['max'],
+            100 * s['error_rate'])
+        if previous and op in previous.get('operations', {}):
+            before = previous['operations'][op]['latency_ms']['p95']
+            if before:
+                line += '  (p95 %+.0f%% vs previous)' % (100.0 * (lat['p95'] - before) / before)
+        print(line)
+    print()
+    print('Total: %d requests in %.1fs, %.1f req/s, %.2f%% errors, %d "database is locked"' % (
+        totals['requests'], result['elapsed_s'], totals['throughput_rps'], 100 * totals['error_rate'],
+        result['database_locked']))
+    if previous:
+        before = previous['totals']['throughput_rps']
+        if before:
+            print('Throughput %+.1f%% vs previous run' % (100.0 * (totals['throughput_rps'] - before) / before))
+
+
+class _LockedCounter(logging.Handler):
+    """Counts log records that mention SQLite lock contention."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        text = record.getMessage()
+        if record.exc_info and record.exc_info[1] is not None:
+            text += str(record.exc_info[1])
+        if 'database is locked' in text:
+            self.count += 1
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'Unknown operation in mix: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Load test the store end to end')
+    p.add_argument('--users', type=int, default=200, help='Users to seed (default: 200)')
+    p.add_argument('--items', type=int, default=500, help='Items to seed (default: 500)')
+    p.add_argument('--orders', type=int, default=2000, help='Historical orders to seed (default: 2000)')
+    p.add_argument('--vus', type=int, default=8, help='Concurrent virtual users (default: 8)')
+    p.add_argument('--duration', type=float, default=30, help='Seconds to run (default: 30)')
+    p.add_argument('--requests', type=int, default=0, help='Stop each virtual user after this many requests')
+    p.add_argument('--think', type=float, default=0, help='Seconds each virtual user waits between requests')
+    p.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                   help='Operation weights, e.g. home=30,item_detail=25,scan=5')
+    p.add_argument('--server', choices=['testclient', 'gunicorn'], default='testclient',
+                   help='Drive the app in-process or through a local gunicorn (default: testclient)')
+    p.add_argument('--workers', type=int, default=3, help='gunicorn workers (default: 3)')
+    p.add_argument('--url', help='Target an already running server instead (no seeding)')
+    p.add_argument('--scan-images', type=int, default=20, help='Distinct synthetic barcode images (default: 20)')
+    p.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    p.add_argument('--out', default=os.path.join(REPO_ROOT, 'loadtest_results'),
+                   help='Directory for the JSON result (default: loadtest_results/)')
+    p.add_argument('--compare', help='Previous result JSON to compare against')
+    p.add_argument('--keep-data', action='store_true', help='Keep the temporary data directory')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    data_dir = tempfile.mkdtemp(prefix='storeapp-loadtest-')
+    os.environ['STOREAPP_DATA_DIR'] = data_dir
+    # Uploads and debug images are written relative to the working directory
+    os.chdir(data_dir)
+    sys.path.insert(0, REPO_ROOT)
+
+    server = None
+    server_log = None
+    locked = _LockedCounter()
+    try:
+        from app import create_app
+
+        app = create_app()
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.logger.addHandler(locked)
+
+        if args.url:
+            # Trust the running server's own data; item ids and barcodes are unknown
+            items = [(i, ean13(f'490{i - 1:09d}')) for i in range(1, args.items + 1)]
+            user_count = args.users
+        else:
+            print('Seeding %d users, %d items, %d orders in %s ...' % (args.users, args.items, args.orders, data_dir))
+            started = time.time()
+            user_count, items = seed(app, args.users, args.items, args.orders, args.seed)
+            print('Seeded in %.1fs' % (time.time() - started))
+
+        scan_images = []
+        if args.mix.get('scan'):
+            try:
+                for _, code in rng.sample(items, k=min(args.scan_images, len(items))):
+                    scan_images.append((code, render_barcode_png(code)))
+            except ImportError:
+                print('numpy/OpenCV not available; scan requests fall back to home')
+
+        if args.url:
+            make_transport = lambda: HttpTransport(args.url)
+            target = args.url
+        elif args.server == 'gunicorn':
+            port = _free_port()
+            server_log = open(os.path.join(data_dir, 'gunicorn.log'), 'w+')
+            env = dict(os.environ, FLASK_ENV='production', PYTHONPATH=REPO_ROOT)
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-b', f'127.0.0.1:{port}', 'flask_app:app'],
+                cwd=data_dir, env=env, stdout=server_log, stderr=subprocess.STDOUT
+            )
+            target = f'http://127.0.0.1:{port}'
+            for _ in range(100):
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                    break
+                except OSError:
+                    if server.poll() is not None:
+                        raise RuntimeError('gunicorn exited during startup; see %s' % server_log.name)
+                    time.sleep(0.2)
+            make_transport = lambda: HttpTransport(target)
+        else:
+            make_transport = lambda: TestClientTransport(app)
+            target = 'testclient'
+
+        vus = []
+        for index in range(args.vus):
+            vu = VirtualUser(index % max(1, user_count), make_transport(), items, scan_images,
+                             random.Random(args.seed * 1000 + index))
+            vu.login()
+            vus.append(vu)
+
+        print('Running %d virtual users against %s for %ss ...' % (args.vus, target, args.duration))
+        stats = Stats()
+        started = time.time()
+        deadline = started + args.duration
+        threads = [
+            threading.Thread(target=run_user, args=(vu, args.mix, deadline, args.requests, args.think, stats))
+            for vu in vus
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+
+        database_locked = locked.count
+        if server_log is not None:
+            server_log.flush()
+            server_log.seek(0)
+            database_locked += server_log.read().count('database is locked')
+
+        operations, totals = summarise(stats, elapsed)
+        result = {
+            'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'git_revision': _git_revision(),
+            'config': {
+                'server': 'url' if args.url else args.server,
+                'workers': args.workers if args.server == 'gunicorn' and not args.url else None,
+                'vus': args.vus,
+                'duration_s': args.duration,
+                'think_s': args.think,
+                'users': args.users,
+                'items': args.items,
+                'orders': args.orders,
+                'mix': args.mix,
+                'seed': args.seed,
+            },
+            'elapsed_s': elapsed,
+            'totals': totals,
+            'database_locked': database_locked,
+            'operations': operations,
+        }
+
+        previous = None
+        if args.compare:
+            with open(args.compare) as f:
+                previous = json.load(f)
+        print_report(result, previous)
+
+        os.makedirs(args.out, exist_ok=True)
+        out_path = os.path.join(args.out, datetime.utcnow().strftime('%Y%m%d-%H%M%S') + '.json')
+        with open(out_path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print('Saved result to %s' % out_path)
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if server_log is not None:
+            server_log.close()
+        os.chdir(REPO_ROOT)
+        if not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
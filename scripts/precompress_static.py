@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Write gzip (and brotli) copies of the static assets for the app to serve.
+
+Usage:
+  python scripts/precompress_static.py
+  python scripts/precompress_static.py --force
+  python scripts/precompress_static.py --clean
+
+Run it as part of a build or deploy, after the static files change. For
+every CSS/JS/JSON/SVG/... file under app/static it writes file.gz, plus
+file.br when the optional `brotli` package is installed, at the highest
+compression levels. The app serves these instead of compressing on every
+request, and falls back to the original when a copy is missing or older
+than its source. --clean deletes all generated copies.
+"""
+import argparse
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Pre-compress static assets')
+    p.add_argument('--dir', default=os.path.join(REPO_ROOT, 'app', 'static'), help='Static directory (default: app/static)')
+    p.add_argument('--min-size', type=int, default=256, help='Skip files smaller than this many bytes (default: 256)')
+    p.add_argument('--force', action='store_true', help='Recompress files whose copies are already up to date')
+    p.add_argument('--clean', action='store_true', help='Remove generated .gz/.br files and exit')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Import the app package lazily so script can be executed from repo root
+    try:
+        from app import compression
+    except Exception as e:
+        print('Error importing the application. Make sure you run this from the project root and your venv is active.')
+        print('Import error:', e)
+        sys.exit(1)
+
+    if args.clean:
+        removed = 0
+        for directory, _, files in os.walk(args.dir):
+            for name in files:
+                base, suffix = os.path.splitext(name)
+                if suffix in ('.gz', '.br') and base.endswith(compression.STATIC_EXTENSIONS):
+                    os.remove(os.path.join(directory, name))
+                    removed += 1
+        print('Removed %d compressed copies.' % removed)
+        return
+
+    if compression.brotli is None:
+        print('brotli is not installed; writing .gz copies only.')
+    results = compression.precompress_directory(args.dir, min_size=args.min_size, force=args.force)
+    for path, size, written in results:
+        sizes = ', '.join('%s %d' % (suffix, length) for suffix, length in sorted(written.items()))
+        print('%-50s %8d -> %s' % (os.path.relpath(path, args.dir), size, sizes))
+    print('Compressed %d files.' % len(results))
+
+
+if __name__ == '__main__':
+    main()
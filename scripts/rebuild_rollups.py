@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Recompute the sales rollup tables from the raw orders.
+
+Usage:
+  python scripts/rebuild_rollups.py
+  python scripts/rebuild_rollups.py --check
+
+The rollups (daily revenue, per-item units, per-customer totals) are kept up
+to date by checkout and order status changes. Run this after importing
+orders, editing them with SQL, or upgrading from a version without rollups.
+--check compares the stored totals with a fresh aggregate and changes nothing.
+"""
+import argparse
+import sys
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Rebuild the sales rollup tables')
+    p.add_argument('--check', action='store_true', help='Report drift between rollups and orders without rebuilding')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Import app factory and db lazily so script can be executed from repo root
+    try:
+        from app import create_app, db
+        from app import rollups
+        from app.archive import all_orders
+    except Exception as e:
+        print('Error importing the application. Make sure you run this from the project root and your venv is active.')
+        print('Import error:', e)
+        sys.exit(1)
+
+    app = create_app()
+
+    with app.app_context():
+        if args.check:
+            stored = rollups.lifetime_totals()
+            orders = all_orders(include_archived=True)
+            count, revenue = db.session.query(
+                db.func.count(orders.c.id),
+                db.func.coalesce(db.func.sum(orders.c.total), 0.0)
+            ).filter(orders.c.status != rollups.CANCELLED).one()
+            print('Rollups: %d orders, revenue %.2f' % (stored['order_count'], stored['revenue']))
+            print('Orders:  %d orders, revenue %.2f' % (count, revenue))
+            if stored['order_count'] != count or abs(stored['revenue'] - revenue) > 0.005:
+                print('Rollups are out of date; run without --check to rebuild.')
+                sys.exit(3)
+            print('Rollups match.')
+            return
+
+        counts = rollups.rebuild()
+        print('Rebuilt rollups: %(days)d days, %(items)d items, %(customers)d customers.' % counts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Stock ledger snapshots, point-in-time stock and reconciliation.
+
+Usage:
+  python scripts/stock_ledger.py snapshot
+  python scripts/stock_ledger.py at 2024-05-31
+  python scripts/stock_ledger.py at "2024-05-31 18:00" --ids 7,9
+  python scripts/stock_ledger.py moved 2024-05-27 2024-06-03
+  python scripts/stock_ledger.py reconcile
+  python scripts/stock_ledger.py reconcile --fix
+
+Every stock change is recorded in the stock ledger (see app/ledger.py).
+`snapshot` compacts the ledger so far into a snapshot; schedule it nightly
+(cron, Task Scheduler) so point-in-time queries only replay a day of
+movements. `at` prints stock as it was at a moment, `moved` sums movements by
+reason over [start, end). `reconcile` compares ledger balances with the stock
+column and exits with status 3 on drift; --fix appends correcting movements.
+"""
+import argparse
+import sys
+from datetime import datetime
+
+
+def _ids(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+def _when(value):
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f'Invalid date: {value!r} (use YYYY-MM-DD [HH:MM[:SS]], UTC)')
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Stock ledger snapshots and reports')
+    sub = p.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('snapshot', help='Compact the ledger so far into a snapshot')
+
+    at = sub.add_parser('at', help='Stock per item at a point in time (UTC)')
+    at.add_argument('when', type=_when, help='YYYY-MM-DD [HH:MM[:SS]]; a bare date means its midnight')
+    at.add_argument('--ids', type=_ids, help='Comma-separated item ids')
+
+    moved = sub.add_parser('moved', help='Movements per item and reason over a date range (UTC)')
+    moved.add_argument('start', type=_when, help='Start, inclusive')
+    moved.add_argument('end', type=_when, help='End, exclusive')
+    moved.add_argument('--ids', type=_ids, help='Comma-separated item ids')
+
+    reconcile = sub.add_parser('reconcile', help='Check ledger balances against Item.stock')
+    reconcile.add_argument('--fix', action='store_true', help='Append movements that correct the drift')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Import app factory and db lazily so script can be executed from repo root
+    try:
+        from app import create_app, db
+        from app import ledger
+        from app.models import Item
+    except Exception as e:
+        print('Error importing the application. Make sure you run this from the project root and your venv is active.')
+        print('Import error:', e)
+        sys.exit(1)
+
+    app = create_app()
+
+    with app.app_context():
+        if args.command == 'snapshot':
+            snapshot = ledger.take_snapshot()
+            print('Snapshot #%d up to movement %d: %d items, %d units.' % (
+                snapshot.id, snapshot.last_movement_id, snapshot.item_count, snapshot.total_units))
+            return
+
+        if args.command == 'reconcile':
+            drift = ledger.reconcile(fix=args.fix)
+            for row in drift:
+                print('%-6d %-40s ledger %6d  stock %6d' % (row.item_id, row.name or '(deleted)', row.ledger, row.stock))
+            if not drift:
+                print('Ledger matches stock for every item.')
+            elif args.fix:
+                print('Recorded %d correcting movement(s).' % len(drift))
+            else:
+                print('%d item(s) differ; run with --fix to record corrections.' % len(drift))
+                sys.exit(3)
+            return
+
+        ids = args.ids
+        names = dict(db.session.query(Item.id, Item.name).filter(Item.id.in_(ids)) if ids else
+                     db.session.query(Item.id, Item.name))
+        if args.command == 'at':
+            levels = ledger.stock_at(args.when, item_ids=ids)
+            for item_id in sorted(set(levels) | set(ids or ())):
+                print('%-6d %-40s %6d' % (item_id, names.get(item_id, '(deleted)'), levels.get(item_id, 0)))
+            print('Total units at %s: %d' % (args.when, sum(levels.values())))
+        elif args.command == 'moved':
+            totals = ledger.moved(args.start, args.end, item_ids=ids)
+            for item_id in sorted(totals):
+                reasons = ', '.join('%s %+d' % (reason, change) for reason, change in sorted(totals[item_id].items()))
+                print('%-6d %-40s %s' % (item_id, names.get(item_id, '(deleted)'), reasons))
+            print('%d item(s) moved.' % len(totals))
+
+
+if __name__ == '__main__':
+    main()
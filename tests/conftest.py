@@ -0,0 +1,146 @@
+"""Shared fixtures: an app on a throwaway data directory, and query counting.
+
+Every test gets a fresh ``create_app()`` whose ``STOREAPP_DATA_DIR`` (and so
+its SQLite database) is a temporary directory. ``max_queries`` fails a test
+when a block runs more SQL statements than allowed::
+
+    def test_home_queries(client, max_queries):
+        with max_queries(3):
+            client.get('/')
+
+``nplusone_raise`` makes any N+1 lazy load raise ``NPlusOneError``.
+"""
+import threading
+from contextlib import contextmanager
+
+import pytest
+from flask.testing import FlaskClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BASE_URL = 'https://localhost'
+
+_local = threading.local()
+
+
+class HttpsClient(FlaskClient):
+    """Test client whose requests go to https://localhost, like the deployed app."""
+
+    def open(self, *args, **kwargs):
+        if args and isinstance(args[0], str):
+            kwargs.setdefault('base_url', BASE_URL)
+        return super().open(*args, **kwargs)
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, 'counters', ()):
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """Count SQL statements executed by this thread inside the block."""
+    if not event.contains(Engine, 'before_cursor_execute', _count_statement):
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+    counter = QueryCounter()
+    counters = _local.__dict__.setdefault('counters', [])
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+@contextmanager
+def assert_max_queries(limit, label='block'):
+    with count_queries() as counter:
+        yield counter
+    assert counter.count <= limit, (
+        f'{label} ran {counter.count} SQL statements (max {limit}):\n' +
+        '\n'.join(f'  {statement}' for statement in counter.statements)
+    )
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('STOREAPP_DATA_DIR', str(tmp_path))
+    from app import create_app
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield app
+    from app import db
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    app.test_client_class = HttpsClient
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """``make_user(email, is_admin=False)`` -> user id."""
+    from app import db
+    from app.models import User
+
+    def make(email, is_admin=False, first_name='Test'):
+        with app.app_context():
+            user = User(email=email, password='x', first_name=first_name, is_admin=is_admin)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make
+
+
+@pytest.fixture
+def make_item(app):
+    """``make_item(name, stock=10, price=1.0, **fields)`` -> item id."""
+    from app import barcodes, db
+    from app.models import Item
+
+    def make(name, stock=10, price=1.0, **fields):
+        fields.setdefault('description', f'{name} description')
+        if fields.get('barcode') and 'gtin' not in fields:
+            fields['gtin'] = barcodes.gtin_or_none(fields['barcode'])
+        with app.app_context():
+            item = Item(name=name, stock=stock, price=price, **fields)
+            db.session.add(item)
+            db.session.commit()
+            return item.id
+    return make
+
+
+@pytest.fixture
+def login(client):
+    """``login(email)`` signs the test client in (passwords aren't checked)."""
+    def log_in(email):
+        response = client.post('/login', data={'email': email, 'password': 'x'})
+        assert response.status_code == 302
+        client.get('/cart')  # consume the login flash
+    return log_in
+
+
+@pytest.fixture
+def max_queries():
+    """``with max_queries(5): client.get(...)`` fails if more than 5 statements run."""
+    return assert_max_queries
+
+
+@pytest.fixture
+def nplusone_raise(app):
+    """Make any N+1 lazy load raise ``NPlusOneError`` for the duration of a test."""
+    previous = app.config.get('NPLUSONE_MODE', 'off')
+    app.config['NPLUSONE_MODE'] = 'raise'
+    yield
+    app.config['NPLUSONE_MODE'] = previous
@@ -0,0 +1,31 @@
+"""Carts shared between worker processes, each with its own user cache."""
+from app import create_app
+
+from conftest import HttpsClient
+
+
+def test_cart_added_in_one_worker_is_seen_by_another(app, client, make_user, make_item, login):
+    other = create_app()
+    other.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    other.test_client_class = HttpsClient
+    other_client = other.test_client()
+
+    make_user('buyer@example.com')
+    item_id = make_item('Widget', stock=5)
+    login('buyer@example.com')
+    assert other_client.post('/login', data={'email': 'buyer@example.com', 'password': 'x'}).status_code == 302
+    assert b'Widget' not in other_client.get('/cart').data  # caches the empty cart summary
+
+    client.post(f'/add_to_cart/{item_id}', data={'quantity': '2'})
+    assert b'Widget' in other_client.get('/cart').data
+    response = other_client.post('/checkout')
+    assert response.status_code == 302
+    assert '/cart' not in response.headers['Location']
+
+    from app.models import Order
+    with app.app_context():
+        assert Order.query.count() == 1
+    with other.app_context():
+        from app import db
+        db.session.remove()
+        db.engine.dispose()
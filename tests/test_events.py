@@ -0,0 +1,34 @@
+"""The admin live order feed frees its subscriber slot however a response ends."""
+import pytest
+
+
+@pytest.fixture
+def hub(app, make_user, login):
+    make_user('admin@example.com', is_admin=True)
+    login('admin@example.com')
+    hub = app.extensions['events']
+    hub.max_subscribers = 2
+    return hub
+
+
+def test_head_requests_free_their_slot(client, hub):
+    for _ in range(5):
+        response = client.head('/admin/orders/events')
+        assert response.status_code == 200
+        response.close()  # as the WSGI server does once the headers are sent
+    assert hub.subscriber_count == 0
+
+
+def test_unstarted_streams_free_their_slot(client, hub):
+    for _ in range(5):
+        response = client.get('/admin/orders/events', buffered=False)
+        assert response.status_code == 200
+        response.close()
+    assert hub.subscriber_count == 0
+
+
+def test_started_streams_free_their_slot(client, hub):
+    response = client.get('/admin/orders/events', buffered=False)
+    assert next(response.response) == b'retry: 5000\n\n'
+    response.close()
+    assert hub.subscriber_count == 0
@@ -0,0 +1,40 @@
+"""Bulk product import: upserts by GTIN and barcode."""
+import io
+
+from app import db, importer
+from app.models import Item
+
+HEADER = 'ID,Name,Description,Price,Stock,Barcode,Image Path,Date Added\n'
+
+
+def _import(app, body):
+    with app.app_context():
+        results = list(importer.import_products(io.BytesIO((HEADER + body).encode()), 'csv', 100))
+        return results[-1]
+
+
+def _items(app):
+    with app.app_context():
+        return [(item.name, item.stock, item.barcode, item.gtin) for item in Item.query.order_by(Item.id)]
+
+
+def test_upsert_matches_any_gtin_format(app, make_item):
+    make_item('Cola', stock=1, barcode='036000291452')
+    result = _import(app, ',Cola Zero,,2.5,7,0036000291452,,\n')
+    assert (result.failed, result.upserted, result.inserted) == (0, 1, 0)
+    assert _items(app) == [('Cola Zero', 7, '036000291452', 36000291452)]
+
+
+def test_gtin_is_attached_to_item_with_same_barcode_and_no_gtin(app, make_item):
+    make_item('Cola', stock=1, barcode='036000291452', gtin=None)
+    make_item('Other', stock=3, barcode='4006381333931')
+    result = _import(app, ',Cola Zero,,2.5,7,036000291452,,\n'
+                          ',Other 2,,1,4,4006381333931,,\n')
+    assert (result.failed, result.upserted, result.inserted) == (0, 2, 0)
+    assert _items(app) == [('Cola Zero', 7, '036000291452', 36000291452),
+                           ('Other 2', 4, '4006381333931', 4006381333931)]
+    from app.models import StockMovement
+    with app.app_context():
+        moves = db.session.query(StockMovement.item_id, StockMovement.change)\
+            .filter(StockMovement.reason == 'import').order_by(StockMovement.item_id).all()
+        assert moves == [(1, 6), (2, 1)]
@@ -0,0 +1,56 @@
+"""Background jobs: export progress and jobs orphaned by a dead process."""
+import json
+import os
+import socket
+import subprocess
+import sys
+
+from app import db
+from app.models import Job
+
+
+def _add_job(app, **fields):
+    with app.app_context():
+        job = Job(**fields)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+
+def test_export_job_reports_rows_written(app, make_item, monkeypatch):
+    from app import exports, jobs
+    for i in range(10):
+        make_item(f'Item {i}')
+    monkeypatch.setattr(exports, 'EXPORT_BATCH_SIZE', 4)
+    seen = []
+    set_progress = jobs.JobContext.set_progress
+
+    def record(ctx, progress, message=None, persist=False):
+        seen.append((progress, message))
+        return set_progress(ctx, progress, message, persist)
+    monkeypatch.setattr(jobs.JobContext, 'set_progress', record)
+
+    job_id = _add_job(app, kind='export', params=json.dumps({'export': 'products'}))
+    app.extensions['jobs']._run(job_id)
+
+    assert seen == [(0, 'Writing 10 rows'), (40, 'Wrote 4 of 10 rows'), (80, 'Wrote 8 of 10 rows')]
+    with app.app_context():
+        job = Job.query.get(job_id)
+        assert (job.status, job.progress) == ('done', 100)
+        with open(job.result_path, encoding='utf-8') as f:
+            assert len(f.readlines()) == 11
+
+
+def test_jobs_of_dead_processes_are_failed_on_start(app):
+    host = socket.gethostname()
+    finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+    finished.wait()
+    dead = _add_job(app, kind='export', status='running', worker=f'{host}:{finished.pid}')
+    legacy = _add_job(app, kind='export', status='running')
+    alive = _add_job(app, kind='export', status='running', worker=f'{host}:{os.getppid()}')
+    elsewhere = _add_job(app, kind='export', status='running', worker='other-host:1')
+
+    with app.app_context():
+        assert sorted(app.extensions['jobs'].fail_orphaned()) == sorted([dead, legacy])
+        status = dict(db.session.query(Job.id, Job.status))
+    assert status == {dead: 'failed', legacy: 'failed', alive: 'running', elsewhere: 'running'}
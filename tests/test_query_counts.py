@@ -0,0 +1,42 @@
+"""Per-route SQL statement budgets; a route going over its budget fails here."""
+
+
+def _place_orders(client, item_id, count):
+    for _ in range(count):
+        client.post(f'/add_to_cart/{item_id}', data={'quantity': '1'})
+        assert client.post('/checkout').status_code == 302
+
+
+def test_home_queries(client, make_item, max_queries):
+    for i in range(5):
+        make_item(f'Item {i}')
+    with max_queries(5, label='GET /') as few:
+        assert client.get('/').status_code == 200
+
+    for i in range(5, 50):
+        make_item(f'Item {i}')
+    with max_queries(few.count, label='GET / with more items'):
+        assert client.get('/').status_code == 200
+
+
+def test_order_history_queries_do_not_grow_with_orders(client, make_user, make_item, login,
+                                                       max_queries, nplusone_raise):
+    make_user('buyer@example.com')
+    item_id = make_item('Widget', stock=100)
+    login('buyer@example.com')
+
+    _place_orders(client, item_id, 2)
+    with max_queries(10, label='GET /orders') as few:
+        assert client.get('/orders').status_code == 200
+
+    _place_orders(client, item_id, 15)
+    with max_queries(few.count, label='GET /orders with more orders'):
+        assert client.get('/orders').status_code == 200
+
+
+def test_admin_orders_has_no_n_plus_one(client, make_user, make_item, login, nplusone_raise):
+    make_user('admin@example.com', is_admin=True)
+    item_id = make_item('Widget', stock=100)
+    login('admin@example.com')
+    _place_orders(client, item_id, 5)
+    assert client.get('/admin/orders').status_code == 200
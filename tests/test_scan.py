@@ -0,0 +1,79 @@
+"""Barcode scanning: a decoded frame is looked up through app/barcodes.py."""
+import io
+from types import SimpleNamespace
+
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+UPC = '036000291452'
+EAN = '0' + UPC  # the same product as an EAN-13, as ZBar reports it
+
+_L = ['0001101', '0011001', '0010011', '0111101', '0100011',
+      '0110001', '0101111', '0111011', '0110111', '0001011']
+_PARITY = ['LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+           'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL']
+
+
+def _ean13_modules(code):
+    right = [''.join('1' if bit == '0' else '0' for bit in pattern) for pattern in _L]
+    left = ''.join(_L[int(d)] if parity == 'L' else right[int(d)][::-1]
+                   for d, parity in zip(code[1:7], _PARITY[int(code[0])]))
+    return '101' + left + '01010' + ''.join(right[int(d)] for d in code[7:]) + '101'
+
+
+def _frame(code=EAN, module=3, height=120, quiet=12):
+    """A PNG of the EAN-13 ``code``, as the live scanner would upload it."""
+    modules = '0' * quiet + _ean13_modules(code) + '0' * quiet
+    row = np.array([0 if bit == '1' else 255 for bit in modules for _ in range(module)], dtype=np.uint8)
+    img = cv2.cvtColor(np.tile(row, (height, 1)), cv2.COLOR_GRAY2BGR)
+    ok, encoded = cv2.imencode('.png', img)
+    assert ok
+    return encoded.tobytes()
+
+
+@pytest.fixture
+def scanner(monkeypatch, tmp_path):
+    """Decode frames with ZBar when it is installed, else with a stand-in
+    decoder that reports ``EAN``. The routes write uploads and debug images
+    relative to the working directory, so run them in ``tmp_path``."""
+    from app import scanning, views
+    (tmp_path / 'app' / 'static' / 'barcode_uploads').mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(views, 'UPLOAD_FOLDER', str(tmp_path / 'app' / 'static' / 'barcode_uploads'))
+    try:
+        scanning._decoder()
+    except scanning.ScannerUnavailable:
+        monkeypatch.setattr(views, 'ensure_zbar_loaded', lambda: True)
+        monkeypatch.setattr(scanning, '_decoder',
+                            lambda: lambda img: [SimpleNamespace(data=EAN.encode())])
+
+
+@pytest.fixture
+def shopper(make_user, make_item, login):
+    make_user('scanner@example.com')
+    item_id = make_item('Cola', barcode=UPC)
+    login('scanner@example.com')
+    return item_id
+
+
+def test_live_scan_finds_item(client, scanner, shopper):
+    response = client.post('/api/scan-barcode', data={
+        'barcode_image': (io.BytesIO(_frame()), 'frame.png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] is True
+    assert body['item']['id'] == shopper
+
+
+def test_uploaded_scan_adds_item_to_cart(app, client, scanner, shopper):
+    response = client.post('/scan-barcode', data={
+        'barcode_image': (io.BytesIO(_frame()), 'photo.png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(f'/item/{shopper}')
+    from app.models import CartItem
+    with app.app_context():
+        assert [(line.item_id, line.quantity) for line in CartItem.query.all()] == [(shopper, 1)]
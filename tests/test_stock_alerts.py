@@ -0,0 +1,59 @@
+"""Low-stock alerts and the item form's threshold field."""
+import pytest
+
+
+@pytest.fixture
+def admin(make_user, login):
+    make_user('admin@example.com', is_admin=True)
+    login('admin@example.com')
+
+
+def _open_alerts(app):
+    from app.models import StockAlert
+    with app.app_context():
+        return [(alert.item_id, alert.level, alert.stock)
+                for alert in StockAlert.query.filter(StockAlert.resolved_at.is_(None))]
+
+
+def _edit(client, item_id, **fields):
+    data = {'name': 'Widget', 'price': '2', 'description': 'd', 'stock': '10'}
+    data.update(fields)
+    return client.post(f'/admin/items/edit/{item_id}', data=data)
+
+
+@pytest.mark.parametrize('value', ['abc', '1.5', '-1'])
+def test_edit_rejects_bad_threshold(app, client, admin, make_item, value):
+    item_id = make_item('Widget', stock=10, low_stock_threshold=3)
+    response = _edit(client, item_id, stock='2', low_stock_threshold=value)
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(f'/admin/items/edit/{item_id}')
+    assert b'Low-stock alert level' in client.get(response.headers['Location']).data
+    from app.models import Item
+    with app.app_context():
+        item = Item.query.get(item_id)
+        assert (item.stock, item.low_stock_threshold) == (10, 3)
+
+
+@pytest.mark.parametrize('value', ['abc', '-1'])
+def test_new_item_rejects_bad_threshold(app, client, admin, value):
+    response = client.post('/admin/items/new', data={
+        'name': 'Widget', 'price': '2', 'description': 'd', 'stock': '1', 'low_stock_threshold': value,
+    })
+    assert response.status_code == 200
+    assert b'Low-stock alert level' in response.data
+    from app.models import Item
+    with app.app_context():
+        assert Item.query.count() == 0
+
+
+def test_threshold_crossings_open_and_resolve_alerts(app, client, admin, make_item):
+    item_id = make_item('Widget', stock=10)
+    _edit(client, item_id, stock='10', low_stock_threshold=' 12 ')
+    assert _open_alerts(app) == [(item_id, 'low', 10)]
+
+    client.post(f'/add_to_cart/{item_id}', data={'quantity': '10'})
+    assert client.post('/checkout').status_code == 302
+    assert _open_alerts(app) == [(item_id, 'out', 0)]
+
+    _edit(client, item_id, stock='20', low_stock_threshold='')
+    assert _open_alerts(app) == []
@@ -0,0 +1,70 @@
+"""Booting on a database from before the current schema upgrades it in place."""
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+BACKUP_DB = os.path.join(ROOT, 'backup', 'store.db')
+
+
+@pytest.fixture
+def upgraded_app(tmp_path, monkeypatch):
+    """The app booted on a copy of backup/store.db (baseline schema, with orders)."""
+    shutil.copy(BACKUP_DB, tmp_path / 'store.db')
+    monkeypatch.setenv('STOREAPP_DATA_DIR', str(tmp_path))
+    from app import create_app, db
+    app = create_app()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_upgrade_fills_rollups_from_existing_orders(upgraded_app):
+    from app import exports, rollups
+    from app.models import Order
+    with upgraded_app.app_context():
+        orders = Order.query.filter(Order.status != rollups.CANCELLED).all()
+        assert orders, 'backup/store.db should hold orders'
+        totals = rollups.lifetime_totals()
+        assert totals['order_count'] == len(orders)
+        assert totals['revenue'] == pytest.approx(sum(order.total for order in orders))
+        _, _, rows = exports.customers_export()
+        assert {row[1] for row in rows} == {order.user.email for order in orders}
+
+
+def test_second_boot_keeps_rollups(upgraded_app):
+    from app import create_app, rollups
+    with upgraded_app.app_context():
+        before = rollups.lifetime_totals()
+    app = create_app()
+    with app.app_context():
+        assert rollups.lifetime_totals() == before
+
+
+def test_concurrent_boots_upgrade_once(tmp_path):
+    """Workers booting together on an old database upgrade it exactly once."""
+    shutil.copy(BACKUP_DB, tmp_path / 'store.db')
+    env = dict(os.environ, STOREAPP_DATA_DIR=str(tmp_path))
+    workers = [
+        subprocess.Popen([sys.executable, '-c', 'from app import create_app; create_app()'],
+                         cwd=ROOT, env=env, stderr=subprocess.PIPE, text=True)
+        for _ in range(4)
+    ]
+    for worker in workers:
+        _, stderr = worker.communicate(timeout=120)
+        assert worker.returncode == 0, stderr
+
+    with sqlite3.connect(tmp_path / 'store.db') as conn:
+        items_with_stock = conn.execute('SELECT count(*) FROM item WHERE stock != 0').fetchone()[0]
+        openings = conn.execute("SELECT count(*), count(DISTINCT item_id) FROM stock_movement "
+                                "WHERE reason = 'opening'").fetchone()
+        assert openings == (items_with_stock, items_with_stock)
+        alerts = conn.execute('SELECT count(*), count(DISTINCT item_id) FROM stock_alert').fetchone()
+        assert alerts[0] == alerts[1]
+        orders = conn.execute("SELECT count(*) FROM \"order\" WHERE status != 'Cancelled'").fetchone()[0]
+        assert conn.execute('SELECT sum(order_count) FROM daily_sales').fetchone()[0] == orders